@@ -1,5 +1,6 @@
 import os
 import logging
+import threading
 from dotenv import load_dotenv
 from flask import Flask
 
@@ -16,30 +17,39 @@ from routes.main import main_bp
 from routes.sales import sales_bp
 from routes.admin import admin_bp
 from routes.logistics import logistics_bp
+from routes.design import design_bp
+from routes.production import production_bp
+from routes.logistics import start_background_sync
+from routes.sales import start_sales_sync
+from routes.production import start_production_sync
+from routes.design import start_inventory_scheduler
 
 from flask_login import LoginManager
 from models import User
 from extensions import supabase
+import user_cache
+import metrics
 
 load_dotenv()
 
-app = Flask(__name__)
-app.secret_key = os.getenv("SECRET_KEY")
+import cache_store
+import scheduler
+import outbox
 
-# Initialize Flask-Login
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'auth.login'
-login_manager.login_message = "Por favor inicia sesión para acceder a esta página."
-login_manager.login_message_category = "error"
+_background_lock = threading.Lock()
+# Proceso en el que ya se iniciaron: los hilos no sobreviven a un fork (gunicorn con preload_app)
+_background_pid = None
 
-@login_manager.user_loader
-def load_user(user_id):
+
+def fetch_user(user_id):
     try:
         # Fetch profile from Supabase
         response = supabase.table('profiles').select('*').eq('id', user_id).execute()
         if response.data:
             data = response.data[0]
+            # Una cuenta desactivada por un administrador pierde la sesión (ver admin.user_update)
+            if data.get('status') != 'Aprobado':
+                return None
             return User(
                 id=data['id'], 
                 email=data['email'], 
@@ -50,26 +60,71 @@ def load_user(user_id):
         return None
     return None
 
-from routes.design import design_bp
-from routes.production import production_bp
 
-app.register_blueprint(auth_bp)
-app.register_blueprint(main_bp)
-app.register_blueprint(sales_bp)
-app.register_blueprint(admin_bp)
-app.register_blueprint(logistics_bp)
-app.register_blueprint(design_bp)
-app.register_blueprint(production_bp)
+def load_user(user_id):
+    # Sesión firmada o caché en memoria antes de consultar Supabase (ver user_cache)
+    return user_cache.load_user(user_id, fetch_user)
+
+
+def create_app():
+    """Construye la aplicación sin iniciar hilos (ver `start_background_tasks`).
+
+    Importar este módulo no tiene efectos en segundo plano, así que gunicorn
+    puede cargarlo en el proceso maestro (`preload_app`) antes de crear los
+    workers; cada worker inicia sus tareas después del fork (gunicorn.conf.py).
+    """
+    app = Flask(__name__)
+    app.secret_key = os.getenv("SECRET_KEY")
+
+    # Latencia por ruta para /metrics
+    metrics.init_app(app)
+
+    # Initialize Flask-Login
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+    login_manager.login_view = 'auth.login'
+    login_manager.login_message = "Por favor inicia sesión para acceder a esta página."
+    login_manager.login_message_category = "error"
+    login_manager.user_loader(load_user)
+
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(main_bp)
+    app.register_blueprint(sales_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(logistics_bp)
+    app.register_blueprint(design_bp)
+    app.register_blueprint(production_bp)
+    return app
+
+
+def start_background_tasks():
+    """Inicia las tareas de segundo plano de este proceso una sola vez.
+
+    En modo `SYNC_MODE=external` solo el vigilante del almacén; en modo
+    embebido las sincronizaciones de Logística, Ventas, Producción y Diseño,
+    el programador y la bandeja de salida.
+    """
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+
+    if cache_store.is_external_sync():
+        # Las sincronizaciones y la bandeja de salida corren en `python sync.py`; este proceso solo lee el almacén
+        cache_store.start_store_watcher()
+    else:
+        start_background_sync()
+        start_sales_sync()
+        start_production_sync()
+        start_inventory_scheduler()
+        scheduler.start()
+        outbox.start_outbox_workers()
 
-# Iniciar sincronización de segundo plano para Logística, Ventas y Producción
-from routes.logistics import start_background_sync
-from routes.sales import start_sales_sync
-from routes.production import start_production_sync
-# En producción o cuando no es el reloader de Flask
-if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not app.debug:
-    start_background_sync()
-    start_sales_sync()
-    start_production_sync()
 
 if __name__ == '__main__':
+    app = create_app()
+    # Con el reloader de Flask solo el proceso hijo (el que sirve) inicia las tareas
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
     app.run(debug=True)
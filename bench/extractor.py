@@ -0,0 +1,192 @@
+"""Micro-benchmark del extractor compilado de Planeación.
+
+Uso (desde la raíz del proyecto):
+    python inspect_page.py --record instance/planeacion_pages.json   # páginas reales
+    python bench/extractor.py --pages instance/planeacion_pages.json
+    python bench/extractor.py --synthetic 5000                        # sin acceso a Notion
+
+Compara el parser manual anterior (cadenas de `.get()` por página), el
+extractor sin esquema (tipo decidido en cada página) y el extractor
+compilado contra el esquema. La segunda tabla incluye la decodificación
+del JSON: con `filter_properties` Notion solo envía las propiedades del
+extractor, que es donde está la mayor parte del ahorro por página.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from urllib.parse import unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import notion_schema
+from routes.production import PLANEACION_SPEC, parse_planeacion_page
+
+
+def legacy_parse(page):
+    """Parser manual previo al extractor compilado (referencia de la medición)."""
+    props = page.get('properties', {})
+    n_prop = props.get('N', {})
+    n_value = ""
+    if n_prop.get('type') == 'title':
+        title_list = n_prop.get('title', [])
+        if title_list:
+            n_value = title_list[0].get('plain_text', '')
+    fecha_prop = props.get('FECHA DE CREACION', {})
+    fecha_value = None
+    if fecha_prop.get('type') == 'date':
+        date_obj = fecha_prop.get('date')
+        if date_obj:
+            fecha_value = date_obj.get('start')
+    planeada_prop = props.get('FECHA PLANEADA', {})
+    planeada_start = None
+    planeada_end = None
+    if planeada_prop.get('type') == 'date':
+        date_obj = planeada_prop.get('date')
+        if date_obj:
+            planeada_start = date_obj.get('start')
+            planeada_end = date_obj.get('end')
+    values = {}
+    for name, key in (('MAQUINA', 'maquina'), ('OPERADOR', 'operador')):
+        prop = props.get(name, {})
+        values[key] = ""
+        if prop.get('type') == 'select' and prop.get('select'):
+            values[key] = prop['select'].get('name', '')
+    for name, key in (('AREA', 'area'), ('4Make', 'partida_codigo')):
+        prop = props.get(name, {})
+        values[key] = ""
+        if prop.get('type') == 'formula':
+            formula_obj = prop.get('formula', {})
+            if formula_obj.get('type') == 'string':
+                values[key] = formula_obj.get('string', '')
+    partida_prop = props.get('PARTIDA', {})
+    partida_id = ""
+    if partida_prop.get('type') == 'relation':
+        relations = partida_prop.get('relation', [])
+        if relations:
+            partida_id = relations[0].get('id', '')
+    nombre_pieza_prop = props.get('NOMBRE PIEZA', {})
+    nombre_pieza_value = ""
+    if nombre_pieza_prop.get('type') == 'rollup':
+        rollup_data = nombre_pieza_prop.get('rollup', {})
+        if rollup_data.get('type') == 'array':
+            array_data = rollup_data.get('array', [])
+            if array_data:
+                first_item = array_data[0]
+                bits = first_item.get(first_item.get('type'), [])
+                if bits:
+                    nombre_pieza_value = bits[0].get('plain_text', '')
+    imagen_prop = props.get('A MOSTRAR', {})
+    imagen_url = ""
+    if imagen_prop.get('type') == 'files':
+        files_list = imagen_prop.get('files', [])
+        if files_list:
+            first_file = files_list[0]
+            imagen_url = first_file.get(first_file.get('type'), {}).get('url', '')
+    if not n_value:
+        return None
+    return {
+        'id': page.get('id'),
+        'n': n_value,
+        'partida': values['partida_codigo'] or nombre_pieza_value or n_value,
+        'nombre_pieza': nombre_pieza_value or n_value,
+        'partida_id': partida_id,
+        'imagen_url': imagen_url,
+        'fecha_creacion': fecha_value,
+        'fecha_planeada': planeada_start,
+        'fecha_planeada_fin': planeada_end,
+        'maquina': values['maquina'],
+        'operador': values['operador'],
+        'area': values['area']
+    }
+
+
+def _text(kind, value):
+    return {'type': kind, kind: [{'type': 'text', 'plain_text': value}]}
+
+
+def synthetic_pages(count):
+    """Páginas con la forma de las respuestas de Notion para Planeación (más propiedades sin usar)."""
+    pages = []
+    for i in range(count):
+        properties = {
+            'N': {'id': 'title', **_text('title', f"N-{i}")},
+            'FECHA DE CREACION': {'id': 'fc', 'type': 'date', 'date': {'start': f"2025-01-{i % 28 + 1:02d}"}},
+            'FECHA PLANEADA': {'id': 'fp', 'type': 'date',
+                               'date': {'start': f"2025-02-{i % 28 + 1:02d}T08:00:00", 'end': None}},
+            'MAQUINA': {'id': 'mq', 'type': 'select', 'select': {'name': f"MAQ-{i % 12}"}},
+            'OPERADOR': {'id': 'op', 'type': 'select', 'select': {'name': f"OP-{i % 30}"}},
+            'AREA': {'id': 'ar', 'type': 'formula', 'formula': {'type': 'string', 'string': 'MAQUINADO'}},
+            'PARTIDA': {'id': 'pa', 'type': 'relation', 'relation': [{'id': f"rel-{i}"}]},
+            '4Make': {'id': '4m', 'type': 'formula', 'formula': {'type': 'string', 'string': f"85-{i:05d}"}},
+            'NOMBRE PIEZA': {'id': 'np', 'type': 'rollup',
+                             'rollup': {'type': 'array', 'array': [_text('title', f"PIEZA {i}")]}},
+            'A MOSTRAR': {'id': 'am', 'type': 'files',
+                          'files': [{'type': 'file', 'file': {'url': f"https://files/{i}.png"}}]}
+        }
+        for extra in range(20):
+            properties[f"EXTRA {extra}"] = {'id': f"x{extra}", **_text('rich_text', 'valor')}
+        pages.append({'id': f"page-{i}", 'properties': properties})
+    return pages
+
+
+def measure(label, fn, items, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<44} {best * 1e6 / len(items):8.2f} µs/página")
+    return best
+
+
+def only_properties(page, property_ids):
+    """Copia de la página con solo las propiedades pedidas (como responde Notion con `filter_properties`)."""
+    properties = {name: prop for name, prop in page['properties'].items() if unquote(prop['id']) in property_ids}
+    return {**page, 'properties': properties}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', help="JSON con páginas grabadas (inspect_page.py --record)")
+    parser.add_argument('--synthetic', type=int, default=5000, help="Páginas sintéticas si no hay grabación")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pages:
+        with open(args.pages, encoding='utf-8') as f:
+            pages = json.load(f)
+    else:
+        pages = synthetic_pages(args.synthetic)
+    if not pages:
+        sys.exit("No hay páginas para medir")
+
+    # Las páginas traen id y tipo de cada propiedad: bastan como esquema
+    schema = notion_schema.Schema(pages[0]['properties'])
+    compiled = PLANEACION_SPEC.compile(schema)
+    dynamic = PLANEACION_SPEC.compile()
+
+    mismatches = sum(legacy_parse(p) != parse_planeacion_page(p, compiled) for p in pages)
+    print(f"{len(pages)} páginas; diferencias con el parser anterior: {mismatches}")
+
+    print("\nSolo extracción")
+    baseline = measure('Parser manual', legacy_parse, pages, args.repeat)
+    measure('Extractor sin esquema', lambda p: parse_planeacion_page(p, dynamic), pages, args.repeat)
+    elapsed = measure('Extractor compilado', lambda p: parse_planeacion_page(p, compiled), pages, args.repeat)
+    print(f"Aceleración: {baseline / elapsed:.2f}x")
+
+    full = [json.dumps(p, ensure_ascii=False) for p in pages]
+    filtered = [json.dumps(only_properties(p, compiled.filter_properties), ensure_ascii=False) for p in pages]
+    print(f"\nDecodificación + extracción ({sum(map(len, full)) // len(full)} vs "
+          f"{sum(map(len, filtered)) // len(filtered)} bytes/página)")
+    baseline = measure('Parser manual, todas las propiedades', lambda raw: legacy_parse(json.loads(raw)),
+                       full, args.repeat)
+    elapsed = measure('Extractor compilado, filter_properties',
+                      lambda raw: parse_planeacion_page(json.loads(raw), compiled), filtered, args.repeat)
+    print(f"Aceleración: {baseline / elapsed:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Cliente de Supabase en memoria para las pruebas de carga (bench/load_test.py).
+
+Imita lo que usan `auth.py`, `admin.py` y el `user_loader` de `app.py`:
+`auth_client()` con `auth.sign_in_with_password` y `auth.sign_out`, y consultas
+`table(...).select/insert/update/eq/order/execute` sobre `profiles`. Los
+perfiles `loadtest-<n>@example.com` existen, están aprobados y tienen todos
+los roles; cualquier contraseña es válida.
+"""
+import uuid
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+LOADTEST_DOMAIN = 'example.com'
+
+
+def loadtest_email(index):
+    return f"loadtest-{index}@{LOADTEST_DOMAIN}"
+
+
+class Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.filters = []
+        self.action = 'select'
+        self.values = None
+
+    def select(self, *columns):
+        self.action = 'select'
+        return self
+
+    def insert(self, values):
+        self.action, self.values = 'insert', values
+        return self
+
+    def update(self, values):
+        self.action, self.values = 'update', values
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def execute(self):
+        with self.client.lock:
+            self.client.queries += 1
+            rows = self.client.tables.setdefault(self.table, [])
+            if self.action == 'insert':
+                rows.append(dict(self.values))
+                return SimpleNamespace(data=[dict(self.values)])
+            matched = [row for row in rows if all(row.get(c) == v for c, v in self.filters)]
+            if self.action == 'update':
+                for row in matched:
+                    row.update(self.values)
+            return SimpleNamespace(data=[dict(row) for row in matched])
+
+
+class Auth:
+    def __init__(self, client):
+        self.client = client
+
+    def sign_in_with_password(self, credentials):
+        profiles = self.client.tables['profiles']
+        profile = next((p for p in profiles if p['email'] == credentials['email']), None)
+        if profile is None:
+            raise ValueError('Invalid login credentials')
+        return SimpleNamespace(user=SimpleNamespace(id=profile['id'], email=profile['email']))
+
+    def sign_out(self, options=None):
+        return None
+
+
+class FakeSupabase:
+    def __init__(self, users=100, roles=None):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.tables = {'profiles': [
+            {
+                'id': str(uuid.uuid5(uuid.NAMESPACE_DNS, loadtest_email(i))),
+                'email': loadtest_email(i),
+                'username': f"loadtest{i}",
+                'full_name': f"Usuario de carga {i}",
+                'status': 'Aprobado',
+                'roles': list(roles or []),
+                'created_at': '2025-01-01T00:00:00'
+            }
+            for i in range(users)
+        ]}
+        self.auth = Auth(self)
+
+    def table(self, name):
+        return Query(self, name)
+
+    @contextmanager
+    def auth_client(self):
+        # Sin sesiones que aislar: el mismo cliente hace de cliente de autenticación
+        yield self
@@ -0,0 +1,28 @@
+"""Aplicación Flask para las pruebas de carga, con Supabase en memoria.
+
+Uso: lo carga bench/load_test.py en el mismo proceso o con gunicorn
+(`gunicorn -c gunicorn.conf.py --pythonpath bench load_app:app`). El entorno (SYNC_MODE,
+CACHE_SNAPSHOT_PATH con las instantáneas sembradas, LOADTEST_USERS...) lo
+prepara load_test.py antes de importar este módulo.
+"""
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_supabase import FakeSupabase
+from constants import SYSTEM_MODULES
+
+# `extensions` se reemplaza antes de que las rutas hagan `from extensions import supabase`
+extensions = types.ModuleType('extensions')
+extensions.supabase = FakeSupabase(int(os.getenv('LOADTEST_USERS', '100')),
+                                   ['Admin'] + [m['name'] for m in SYSTEM_MODULES])
+extensions.auth_client = extensions.supabase.auth_client
+sys.modules['extensions'] = extensions
+
+from app import create_app
+
+app = create_app()
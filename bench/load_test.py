@@ -0,0 +1,326 @@
+"""Prueba de carga HTTP de las APIs de Flask con Supabase en memoria.
+
+Uso (desde la raíz del proyecto):
+    python bench/load_test.py --concurrency 1,10,50 --duration 20
+    python bench/load_test.py --server gunicorn --worker-class sync,gthread --workers 4 --threads 8
+    python bench/load_test.py --mix partidas=5,submit_logistica=1 --json resultados.json
+
+Pasos:
+1. Siembra las instantáneas de caché sincronizando una vez contra la API
+   local de Notion (bench/mock_notion.py), igual que bench/sync_bench.py.
+2. Arranca la aplicación (bench/load_app.py) con `SYNC_MODE=external`,
+   como en producción con `python sync.py` aparte: en este proceso con el
+   servidor de Werkzeug (`--server inprocess`) o con gunicorn por cada
+   `--worker-class`.
+3. Cada usuario virtual inicia sesión en `/login` (Supabase simulado) y
+   repite peticiones a las rutas de `--mix` durante `--duration` segundos,
+   enviando `If-None-Match` como el navegador salvo con `--no-etag`.
+
+Se informa por ruta el número de peticiones, errores, peticiones por
+segundo y latencias p50/p95/p99, para cada nivel de concurrencia y clase de
+worker. Los clientes son hilos de este proceso: con concurrencias altas
+conviene comparar contra `--server gunicorn`, donde el servidor no comparte
+el GIL con los clientes. Los envíos (submit) solo se encolan en la bandeja
+de salida temporal; nada llega a n8n.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import requests
+import mock_notion
+import sync_bench
+from fake_supabase import loadtest_email
+
+# nombre -> (método, ruta, cuerpo JSON o None, peso por omisión)
+ROUTES = {
+    'logistica_data': ('GET', '/dashboard/logistica/api/data', None, 2),
+    'partidas': ('GET', '/dashboard/logistica/api/partidas', None, 4),
+    'ventas_data': ('GET', '/dashboard/ventas/api/data', None, 1),
+    'produccion_data': ('GET', '/dashboard/produccion/api/data', None, 2),
+    'inventario': ('GET', '/dashboard/diseno/api/inventario', None, 2),
+    'proyectos': ('GET', '/dashboard/diseno/api/proyectos', None, 2),
+    'submit_logistica': ('POST', '/dashboard/logistica/api/submit', {
+        'partida': '85-00001-01', 'material': 'MATERIAL 0001', 'cantidad': 2, 'unidad': 'PZA'
+    }, 0.2),
+    'submit_diseno': ('POST', '/dashboard/diseno/api/submit', {
+        'proyecto': 'E-00001', 'accesorios': [{'descripcion': 'ACCESORIO 0001', 'cantidad': 4}]
+    }, 0.2),
+    'submit_ventas': ('POST', '/dashboard/ventas/api/submit', {
+        'cliente': 'CLIENTE 00001 S.A. DE C.V.', 'solicitante': 'USUARIO 00001',
+        'partidas': [{'descripcion': 'PIEZA', 'cantidad': 10}]
+    }, 0.2)
+}
+
+
+def percentile(values, fraction):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not values:
+        return None
+    index = max(0, math.ceil(fraction * len(values)) - 1)
+    return values[index]
+
+
+def parse_mix(values):
+    weights = {name: route[3] for name, route in ROUTES.items()}
+    if values:
+        weights = {}
+        for value in values:
+            for item in value.split(','):
+                name, _, weight = item.partition('=')
+                if name not in ROUTES:
+                    raise SystemExit(f"Ruta desconocida: {name} (disponibles: {', '.join(ROUTES)})")
+                weights[name] = float(weight or 1)
+    return weights
+
+
+def seed_snapshots(args, workdir):
+    """Publica una sincronización de cada módulo contra la API local de Notion en CACHE_SNAPSHOT_PATH."""
+    process, url = sync_bench.start_mock(args)
+    try:
+        sync_bench.configure_environment(url, workdir, args)
+        # Las rutas que se importan aquí también las sirve el modo inprocess: que no sincronicen por su cuenta
+        os.environ['SYNC_MODE'] = 'external'
+        for name, fn, kwargs, caches, prepare in sync_bench.scenarios():
+            if name.endswith('_delta'):
+                continue
+            sync_bench.run_once(fn, kwargs, caches, prepare)
+            print(f"  {name}: {sum(len(cache['data']) for cache in caches)} registros")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def server_environment(args, workdir):
+    return {
+        **os.environ,
+        'SYNC_MODE': 'external',
+        'SECRET_KEY': 'load-test',
+        'LOADTEST_USERS': str(max(args.concurrency_levels)),
+        'CACHE_SNAPSHOT_PATH': os.path.join(workdir, 'cache_snapshots.sqlite3'),
+        'OUTBOX_PATH': os.path.join(workdir, 'outbox.sqlite3'),
+        'USER_CACHE_PATH': os.path.join(workdir, 'user_cache.sqlite3'),
+        # Los envíos solo se encolan: con SYNC_MODE=external la web no entrega la bandeja de salida
+        'LOGISTICA_WEBHOOK_URL': 'http://127.0.0.1:9/logistica',
+        'ACCESORIOS_WEBHOOK_URL': 'http://127.0.0.1:9/accesorios',
+        'N8N_WEBHOOK_URL': 'http://127.0.0.1:9/ventas'
+    }
+
+
+def wait_until_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/login", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"El servidor no respondió en {timeout}s")
+
+
+class InProcessServer:
+    """Servidor de Werkzeug con hilos dentro de este proceso."""
+
+    label = 'inprocess'
+
+    def __init__(self, args, environment):
+        os.environ.update(environment)
+        from werkzeug.serving import make_server
+        import load_app
+        from app import start_background_tasks
+        start_background_tasks()
+        self.port = sync_bench.free_port()
+        self.server = make_server('127.0.0.1', self.port, load_app.app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+class GunicornServer:
+    """gunicorn en un subproceso con la clase de worker indicada."""
+
+    def __init__(self, args, environment, worker_class):
+        self.label = f"gunicorn {worker_class} x{args.workers}" + (
+            f" ({args.threads} hilos)" if worker_class == 'gthread' else '')
+        self.port = sync_bench.free_port()
+        # La configuración de producción; la clase y el tamaño van en el entorno como en el despliegue
+        # (gunicorn.conf.py decide `preload_app` según la clase)
+        self.command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+                        '--bind', f"127.0.0.1:{self.port}", '--pythonpath', BENCH_DIR, '--chdir', ROOT,
+                        '--log-level', 'warning', 'load_app:app']
+        # Las instantáneas ya están sembradas: no se inicia sync.py
+        self.environment = dict(environment, GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(args.workers),
+                                GUNICORN_THREADS=str(args.threads), GUNICORN_SYNC_PROCESS='0',
+                                GUNICORN_ACCESS_LOG='')
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, env=self.environment)
+        base_url = f"http://127.0.0.1:{self.port}"
+        wait_until_ready(base_url)
+        return base_url
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
+
+
+def login(base_url, index):
+    session = requests.Session()
+    response = session.post(f"{base_url}/login", data={'email': loadtest_email(index), 'password': 'carga'},
+                            allow_redirects=False, timeout=30)
+    if response.status_code != 302 or 'dashboard' not in response.headers.get('Location', ''):
+        raise RuntimeError(f"No se pudo iniciar sesión como {loadtest_email(index)} ({response.status_code})")
+    return session
+
+
+def run_level(base_url, sessions, weights, duration, use_etag, seed):
+    """Ejecuta un nivel de concurrencia y devuelve `{ruta: [(latencia, status)]}` y la duración real."""
+    names = list(weights)
+    cumulative = [sum(weights[n] for n in names[:i + 1]) for i in range(len(names))]
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(len(sessions) + 1)
+    deadline = [0.0]
+
+    def user(index, session):
+        rng = random.Random(seed + index)
+        etags = {}
+        local = defaultdict(list)
+        start_barrier.wait()
+        while time.monotonic() < deadline[0]:
+            name = rng.choices(names, cum_weights=cumulative)[0]
+            method, path, body, _ = ROUTES[name]
+            headers = {}
+            if use_etag and name in etags:
+                headers['If-None-Match'] = etags[name]
+            started = time.perf_counter()
+            try:
+                response = session.request(method, f"{base_url}{path}", json=body, headers=headers, timeout=60)
+                status = response.status_code
+                if response.headers.get('ETag'):
+                    etags[name] = response.headers['ETag']
+            except requests.RequestException:
+                status = 'error'
+            local[name].append((time.perf_counter() - started, status))
+        with lock:
+            for name, values in local.items():
+                samples[name].extend(values)
+
+    threads = [threading.Thread(target=user, args=(i, s), daemon=True) for i, s in enumerate(sessions)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.monotonic() + duration
+    started = time.monotonic()
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def summarize(samples, elapsed):
+    rows = {}
+    everything = []
+    for name in sorted(samples):
+        values = samples[name]
+        latencies = sorted(latency for latency, _ in values)
+        errors = sum(1 for _, status in values if status == 'error' or status >= 500)
+        everything.extend(latencies)
+        rows[name] = {
+            'requests': len(values),
+            'errors': errors,
+            'not_modified': sum(1 for _, status in values if status == 304),
+            'rps': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2)
+        }
+    everything.sort()
+    if everything:
+        rows['TOTAL'] = {
+            'requests': len(everything),
+            'errors': sum(r['errors'] for r in rows.values()),
+            'not_modified': sum(r['not_modified'] for r in rows.values()),
+            'rps': round(len(everything) / elapsed, 1),
+            'p50_ms': round(percentile(everything, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(everything, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(everything, 0.99) * 1000, 2)
+        }
+    return rows
+
+
+def print_rows(label, concurrency, rows):
+    print(f"\n{label} — {concurrency} usuarios")
+    print(f"{'Ruta':<18} {'Peticiones':>10} {'Errores':>8} {'304':>6} {'Pet/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8}")
+    for name, row in rows.items():
+        print(f"{name:<18} {row['requests']:>10} {row['errors']:>8} {row['not_modified']:>6} {row['rps']:>8} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    mock_notion.add_arguments(parser)
+    parser.add_argument('--rate-limit', type=float, default=1000.0, help="NOTION_RATE_LIMIT al sembrar")
+    parser.add_argument('--server', choices=['inprocess', 'gunicorn'], default='inprocess')
+    parser.add_argument('--worker-class', default='gthread', help="Clases de worker de gunicorn, separadas por comas")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help="Hilos por worker (gthread)")
+    parser.add_argument('--concurrency', default='1,10,25', help="Usuarios simultáneos, separados por comas")
+    parser.add_argument('--duration', type=float, default=15.0, help="Segundos por nivel de concurrencia")
+    parser.add_argument('--mix', action='append', help="Pesos por ruta (`partidas=5,submit_ventas=1`)")
+    parser.add_argument('--no-etag', action='store_true', help="No reenviar If-None-Match (sin respuestas 304)")
+    parser.add_argument('--json', help="Guarda los resultados en este archivo")
+    args = parser.parse_args()
+    args.concurrency_levels = [int(value) for value in args.concurrency.split(',')]
+    weights = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix='reyper-load-')
+    print("Sembrando las cachés contra la API local de Notion...")
+    seed_snapshots(args, workdir)
+    environment = server_environment(args, workdir)
+
+    if args.server == 'inprocess':
+        servers = [InProcessServer(args, environment)]
+    else:
+        servers = [GunicornServer(args, environment, worker_class) for worker_class in args.worker_class.split(',')]
+
+    results = {}
+    for server in servers:
+        with server as base_url:
+            sessions = [login(base_url, i) for i in range(max(args.concurrency_levels))]
+            for concurrency in args.concurrency_levels:
+                samples, elapsed = run_level(base_url, sessions[:concurrency], weights, args.duration,
+                                             not args.no_etag, concurrency)
+                rows = summarize(samples, elapsed)
+                results.setdefault(server.label, {})[str(concurrency)] = rows
+                print_rows(server.label, concurrency, rows)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'mix': weights, 'duration': args.duration, 'results': results}, f, indent=2,
+                      ensure_ascii=False)
+        print(f"\nResultados guardados en {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+"""Servidor local que imita la API de Notion para medir las sincronizaciones sin red.
+
+Uso (desde la raíz del proyecto):
+    python bench/mock_notion.py --port 8765 --latency-ms 150 --rate-429 0.02
+    NOTION_API_URL=http://127.0.0.1:8765/v1 python sync.py
+
+Atiende `GET /v1/databases/{id}` (esquema) y `POST /v1/databases/{id}/query`
+(paginación con `start_cursor`/`page_size`, `filter_properties` y los
+filtros que usan los módulos: fechas, select, relation, fórmulas y
+`last_edited_time`). Las bases de datos imitan Partidas, Material,
+Planeación, Clientes, Usuarios, Cotizaciones, Inventario y Proyectos, con
+`--extra-properties` propiedades sin usar por página (como en Notion, donde
+la mayor parte del cuerpo son columnas que la sincronización no lee).
+
+Las páginas se generan de forma determinista a partir de su índice, así que
+dos ejecuciones con los mismos parámetros devuelven los mismos datos.
+"""
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta, date
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Fecha de referencia de los datos: las fechas se reparten alrededor de hoy para que
+# las ventanas de Logística (±1 año) y Planeación (hoy - 3 días en adelante) tengan registros
+TODAY = date.today()
+EDITED_BASE = datetime(2025, 1, 1)
+
+ESTATUS = ['A1-EN PROCESO', 'B2-MAQUINADO', 'C3-CALIDAD', 'D1-TERMINADA', 'D7-ENTREGADA', 'D8-CANCELADA']
+PUESTOS = ['COMPRAS', 'INGENIERÍA', 'CALIDAD', 'MANTENIMIENTO', 'PRODUCCIÓN', 'DIRECCIÓN']
+AREAS = ['MAQUINADO', 'ENSAMBLE', 'PINTURA', 'SOLDADURA', 'ALMACÉN']
+
+
+def database_id(name):
+    return hashlib.md5(name.encode('utf-8')).hexdigest()
+
+
+def _text(kind, value):
+    return {'type': kind, kind: [{'type': 'text', 'text': {'content': value}, 'plain_text': value}]}
+
+
+def title(value):
+    return _text('title', value)
+
+
+def rich_text(value):
+    return _text('rich_text', value)
+
+
+def select(value):
+    return {'type': 'select', 'select': {'name': value} if value else None}
+
+
+def date_value(start, end=None):
+    return {'type': 'date', 'date': {'start': start, 'end': end} if start else None}
+
+
+def relation(ids):
+    return {'type': 'relation', 'relation': [{'id': i} for i in ids]}
+
+
+def formula(kind, value):
+    return {'type': 'formula', 'formula': {'type': kind, kind: value}}
+
+
+def rollup_title(value):
+    return {'type': 'rollup', 'rollup': {'type': 'array', 'array': [title(value)]}}
+
+
+def files(url):
+    return {'type': 'files', 'files': [{'type': 'file', 'name': 'pieza.png', 'file': {'url': url}}]}
+
+
+def _day(offset):
+    return (TODAY + timedelta(days=offset)).isoformat()
+
+
+def partida_page(i):
+    return {
+        '01-CODIGO PIEZA': title(f"85-{i // 10:05d}-{i % 10:02d}"),
+        'CAPTURA DE MATERIAL': relation([] if i % 5 else [database_id(f"captura-{i}")]),
+        '06-ESTATUS GENERAL': select(ESTATUS[i % len(ESTATUS)]),
+        'FECHA DE CREACION': date_value(_day(-400 + i % 430))
+    }
+
+
+def material_page(i):
+    return {'MATERIAL': title(f"MATERIAL {i:04d}")}
+
+
+def planeacion_page(i):
+    start = datetime.combine(TODAY, datetime.min.time()) + timedelta(days=-10 + i % 70, hours=6 + i % 12)
+    return {
+        'N': title(f"N-{i}"),
+        'FECHA DE CREACION': date_value(_day(-60 + i % 60)),
+        'FECHA PLANEADA': date_value(start.isoformat(), (start + timedelta(hours=1 + i % 5)).isoformat()),
+        'MAQUINA': select(f"MAQ-{i % 12:02d}"),
+        'OPERADOR': select(f"OPERADOR {i % 30}"),
+        'AREA': formula('string', AREAS[i % len(AREAS)]),
+        'PARTIDA': relation([database_id(f"partida-{i}")]),
+        '4Make': formula('string', f"85-{i // 10:05d}-{i % 10:02d}"),
+        'NOMBRE PIEZA': rollup_title(f"PIEZA {i}"),
+        'A MOSTRAR': files(f"https://files.example/{i}.png")
+    }
+
+
+def cliente_page(i):
+    return {'RAZON SOCIAL': title(f"CLIENTE {i:05d} S.A. DE C.V.")}
+
+
+def usuario_page(i):
+    return {'NOMBRE COMPLETO': title(f"USUARIO {i:05d}")}
+
+
+def cotizacion_page(i):
+    return {
+        'N': title(f"COT-{i:05d}"),
+        'PUESTO': select(PUESTOS[i % len(PUESTOS)]),
+        'AREA': select(AREAS[i % len(AREAS)])
+    }
+
+
+def inventario_page(i):
+    return {'DESCRIPCIÓN': title(f"ACCESORIO {i % 3000:04d}")}
+
+
+def proyecto_page(i):
+    return {
+        'NOMBRE': title(f"PROYECTO {i}"),
+        'CODIGO PROYECTO E': rich_text(f"E-{i:05d}"),
+        'REQUIERE ACCESORIOS': select('SI' if i % 3 else 'NO'),
+        'ESTATUS ACCESORIOS': formula('string', f"{i % 4} pendientes" if i % 4 else 'completo'),
+        'ARCHIVADOS 2.0': formula('number', 1 if i % 10 == 0 else 0)
+    }
+
+
+# nombre -> (variable de entorno del id, páginas por omisión, generador)
+FIXTURES = {
+    'partidas': ('NOTION_DATABASE_ID_LOGISTICA', 20000, partida_page),
+    'material': ('NOTION_DATABASE_ID_MATERIAL', 800, material_page),
+    'planeacion': ('NOTION_DATABASE_ID_PLANEACION', 10000, planeacion_page),
+    'clientes': ('NOTION_DATABASE_ID_CLIENTES', 3000, cliente_page),
+    'usuarios': ('NOTION_DATABASE_ID_USUARIOS', 500, usuario_page),
+    'cotizaciones': ('NOTION_DATABASE_ID_COTIZACIONES', 5000, cotizacion_page),
+    'inventario': ('NOTION_DATABASE_ID_INVENTARIO', 6000, inventario_page),
+    'proyectos': ('NOTION_DATABASE_ID_PROYECTOS', 2000, proyecto_page)
+}
+
+
+def environment():
+    """Variables de entorno con los ids de las bases de datos imitadas."""
+    return {variable: database_id(name) for name, (variable, _, _) in FIXTURES.items()}
+
+
+class Database:
+    """Páginas y esquema de una base de datos imitada."""
+
+    def __init__(self, name, count, generate, extra_properties):
+        self.name = name
+        self.id = database_id(name)
+        sample = generate(0)
+        extras = [f"EXTRA {n:02d}" for n in range(extra_properties)]
+        self.schema = {}
+        for prop_name, prop in list(sample.items()) + [(extra, rich_text('')) for extra in extras]:
+            # Notion usa el id "title" para la propiedad de título y ids cortos para las demás
+            prop_id = 'title' if prop['type'] == 'title' else hashlib.md5(prop_name.encode('utf-8')).hexdigest()[:4]
+            self.schema[prop_name] = {'id': prop_id, 'name': prop_name, 'type': prop['type'], prop['type']: {}}
+
+        self.pages = []
+        for i in range(count):
+            properties = generate(i)
+            for extra in extras:
+                properties[extra] = rich_text(f"valor {i}")
+            for prop_name, prop in properties.items():
+                prop['id'] = self.schema[prop_name]['id']
+            edited = (EDITED_BASE + timedelta(seconds=i)).isoformat(timespec='milliseconds') + 'Z'
+            self.pages.append({
+                'object': 'page',
+                'id': f"{self.name[:4]}{i:028d}",
+                'created_time': edited,
+                'last_edited_time': edited,
+                'archived': False,
+                'properties': properties
+            })
+        self._filtered = {}
+        self._lock = threading.Lock()
+
+    def describe(self):
+        return {'object': 'database', 'id': self.id, 'title': [title(self.name)], 'properties': self.schema}
+
+    def matching(self, query_filter):
+        """Páginas que cumplen el filtro (memorizado: los fragmentos repiten el mismo filtro en cada página)."""
+        key = json.dumps(query_filter, sort_keys=True)
+        with self._lock:
+            pages = self._filtered.get(key)
+        if pages is None:
+            pages = [page for page in self.pages if matches(page, query_filter)]
+            with self._lock:
+                self._filtered[key] = pages
+        return pages
+
+
+def _moment(text):
+    if not text:
+        return None
+    value = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    return value.replace(tzinfo=None)
+
+
+_DATE_OPERATORS = {
+    'equals': lambda a, b: a == b,
+    'before': lambda a, b: a < b,
+    'after': lambda a, b: a > b,
+    'on_or_before': lambda a, b: a <= b,
+    'on_or_after': lambda a, b: a >= b
+}
+
+
+def _compare_dates(value, condition):
+    moment = _moment(value)
+    for operator, target in condition.items():
+        if operator in ('is_empty', 'is_not_empty'):
+            if (moment is None) != (operator == 'is_empty'):
+                return False
+        elif moment is None or not _DATE_OPERATORS[operator](moment, _moment(target)):
+            return False
+    return True
+
+
+def _compare(value, condition):
+    for operator, target in condition.items():
+        if operator == 'equals' and value != target:
+            return False
+        if operator == 'does_not_equal' and value == target:
+            return False
+        if operator == 'contains' and (value is None or str(target).lower() not in str(value).lower()):
+            return False
+        if operator == 'is_empty' and value not in (None, '', []):
+            return False
+        if operator == 'is_not_empty' and value in (None, '', []):
+            return False
+    return True
+
+
+def _plain(prop):
+    kind = prop.get('type')
+    value = prop.get(kind)
+    if kind in ('title', 'rich_text'):
+        return value[0]['plain_text'] if value else None
+    if kind == 'select':
+        return value['name'] if value else None
+    if kind == 'date':
+        return value['start'] if value else None
+    if kind == 'relation':
+        return value
+    return value
+
+
+def matches(page, query_filter):
+    if not query_filter:
+        return True
+    if 'and' in query_filter:
+        return all(matches(page, f) for f in query_filter['and'])
+    if 'or' in query_filter:
+        return any(matches(page, f) for f in query_filter['or'])
+    if query_filter.get('timestamp') == 'last_edited_time':
+        return _compare_dates(page['last_edited_time'], query_filter['last_edited_time'])
+
+    prop = page['properties'].get(query_filter.get('property'))
+    if prop is None:
+        return False
+    if 'date' in query_filter:
+        return _compare_dates(_plain(prop), query_filter['date'])
+    if 'formula' in query_filter:
+        result = prop.get('formula') or {}
+        (kind, condition), = query_filter['formula'].items()
+        return _compare(result.get(kind), condition)
+    for kind in ('title', 'rich_text', 'select', 'relation', 'number'):
+        if kind in query_filter:
+            return _compare(_plain(prop), query_filter[kind])
+    return True
+
+
+class MockNotion:
+    """Estado del servidor: bases de datos, latencia simulada e inyección de 429."""
+
+    def __init__(self, pages=None, extra_properties=20, latency_ms=0.0, rate_429=0.0, retry_after=1, seed=1):
+        pages = pages or {}
+        self.databases = {}
+        for name, (_, default_count, generate) in FIXTURES.items():
+            db = Database(name, pages.get(name, default_count), generate, extra_properties)
+            self.databases[db.id] = db
+        self.latency = latency_ms / 1000.0
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+    def throttle(self):
+        with self.lock:
+            self.requests += 1
+            if self.rate_429 and self.random.random() < self.rate_429:
+                self.throttled += 1
+                return True
+        return False
+
+    def query(self, db, body, filter_properties):
+        pages = db.matching(body.get('filter'))
+        start = int(body.get('start_cursor') or 0)
+        size = min(int(body.get('page_size') or 100), 100)
+        chunk = pages[start:start + size]
+        if filter_properties:
+            wanted = set(filter_properties)
+            chunk = [{**page, 'properties': {name: prop for name, prop in page['properties'].items()
+                                             if prop['id'] in wanted}} for page in chunk]
+        has_more = start + size < len(pages)
+        return {'object': 'list', 'results': chunk, 'next_cursor': str(start + size) if has_more else None,
+                'has_more': has_more, 'type': 'page_or_database', 'page_or_database': {}}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    mock = None
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        body = {}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = json.loads(self.rfile.read(length))
+
+        if self.mock.latency:
+            time.sleep(self.mock.latency)
+        if self.mock.throttle():
+            return self._send(429, {'object': 'error', 'status': 429, 'code': 'rate_limited',
+                                    'message': 'Rate limited'}, {'Retry-After': str(self.mock.retry_after)})
+
+        if len(parts) < 3 or parts[0] != 'v1' or parts[1] != 'databases':
+            return self._send(404, {'object': 'error', 'status': 404, 'code': 'invalid_request_url'})
+        db = self.mock.databases.get(parts[2].replace('-', ''))
+        if db is None:
+            return self._send(404, {'object': 'error', 'status': 404, 'code': 'object_not_found',
+                                    'message': f"Could not find database with ID: {parts[2]}"})
+        if method == 'GET' and len(parts) == 3:
+            return self._send(200, db.describe())
+        if method == 'POST' and len(parts) == 4 and parts[3] == 'query':
+            filter_properties = parse_qs(url.query).get('filter_properties')
+            return self._send(200, self.mock.query(db, body, filter_properties))
+        return self._send(400, {'object': 'error', 'status': 400, 'code': 'invalid_request'})
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(mock, port=0, host='127.0.0.1'):
+    """Inicia el servidor en un hilo y lo devuelve (`server.server_address` tiene el puerto real)."""
+    handler = type('MockHandler', (Handler,), {'mock': mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_pages(values):
+    """`partidas=5000,planeacion=2000` -> dict; un número solo aplica a todas las bases."""
+    pages = {}
+    for value in values or []:
+        for item in value.split(','):
+            name, _, count = item.rpartition('=')
+            if name:
+                if name not in FIXTURES:
+                    raise ValueError(f"Base de datos desconocida: {name}")
+                pages[name] = int(count)
+            else:
+                pages.update({fixture: int(count) for fixture in FIXTURES})
+    return pages
+
+
+def add_arguments(parser):
+    parser.add_argument('--pages', action='append', help="Páginas por base (`5000` o `partidas=5000,...`)")
+    parser.add_argument('--extra-properties', type=int, default=20, help="Propiedades sin usar por página")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Latencia simulada por petición")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Fracción de peticiones que responden 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Segundos de Retry-After en los 429")
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def build_mock(args):
+    return MockNotion(parse_pages(args.pages), args.extra_properties, args.latency_ms, args.rate_429,
+                      args.retry_after, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    mock = build_mock(args)
+    server = serve(mock, args.port)
+    print(f"API de Notion local en http://127.0.0.1:{server.server_address[1]}/v1", flush=True)
+    for name, value in sorted(environment().items()):
+        print(f"{name}={value}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
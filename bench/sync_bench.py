@@ -0,0 +1,264 @@
+"""Benchmark de las sincronizaciones contra la API local de Notion (bench/mock_notion.py).
+
+Uso (desde la raíz del proyecto):
+    python bench/sync_bench.py                          # compara con bench/baselines.json
+    python bench/sync_bench.py --latency-ms 150 --rate-429 0.02
+    python bench/sync_bench.py --save-baseline          # guarda la medición como referencia
+    python bench/sync_bench.py --check                  # sale con 1 si hay regresiones
+
+Levanta el servidor simulado en un subproceso (para que no compita por el
+GIL con la sincronización medida), apunta `NOTION_API_URL` y los ids de las
+bases de datos hacia él y ejecuta `refresh_notion_cache`,
+`refresh_sales_cache`, `refresh_planeacion_cache` (completa e
+incremental), `refresh_inventory_cache`, `refresh_projects_cache` y todas
+a la vez ('todas', como en sync.py). `--engine asyncio` mide el motor de
+notion_async en lugar del de hilos. Por
+escenario se informa el tiempo de pared (mejor de `--repeat`), registros y
+peticiones por segundo y el pico de memoria de Python (`tracemalloc`, en
+una ejecución aparte porque el rastreo la hace más lenta).
+
+Las referencias guardadas dependen de la máquina y del perfil (páginas,
+latencia, 429): solo se comparan si el perfil coincide.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import platform
+import threading
+import subprocess
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_notion
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_mock(args):
+    """Inicia bench/mock_notion.py en un subproceso y espera a que acepte conexiones."""
+    port = free_port()
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_notion.py'),
+               '--port', str(port), '--extra-properties', str(args.extra_properties),
+               '--latency-ms', str(args.latency_ms), '--rate-429', str(args.rate_429),
+               '--retry-after', str(args.retry_after), '--seed', str(args.seed)]
+    for value in args.pages or []:
+        command += ['--pages', value]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    # La primera línea se imprime cuando las páginas ya están generadas y el puerto escuchando
+    if not process.stdout.readline():
+        raise RuntimeError("No se pudo iniciar la API local de Notion")
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+def configure_environment(url, workdir, args):
+    """Variables que deben existir antes de importar notion_api y los módulos."""
+    os.environ.update(mock_notion.environment())
+    os.environ.update({
+        'NOTION_API_URL': url,
+        'NOTION_TOKEN_LOGISTICA': 'bench-logistica',
+        'NOTION_TOKEN_VENTAS': 'bench-ventas',
+        'NOTION_TOKEN_PRODUCCION': 'bench-produccion',
+        'NOTION_TOKEN_DISENO': 'bench-diseno',
+        # El límite de tasa real (3/s) dominaría la medición salvo que se pida con --rate-limit
+        'NOTION_RATE_LIMIT': str(args.rate_limit),
+        'NOTION_RATE_BURST': str(max(args.rate_limit, 1)),
+        'NOTION_RATE_SHARED': '0',
+        # Nada de lo que escriba el benchmark toca instance/
+        'CACHE_SNAPSHOT_PATH': os.path.join(workdir, 'cache_snapshots.sqlite3'),
+        'OUTBOX_PATH': os.path.join(workdir, 'outbox.sqlite3'),
+        'USER_CACHE_PATH': os.path.join(workdir, 'user_cache.sqlite3'),
+        'SYNC_MODE': 'embedded',
+        'SYNC_ENGINE': getattr(args, 'engine', 'threads')
+    })
+
+
+def scenarios():
+    """(nombre, función de sincronización, argumentos, cachés que llena, preparación de cada ejecución)."""
+    from routes.logistics import refresh_notion_cache, PARTIDAS_CACHE, MATERIALES_CACHE, PARTIDAS_STATE, \
+        MATERIALES_STATE
+    from routes.sales import refresh_sales_cache, SALES_CACHES
+    from routes.production import refresh_planeacion_cache, PLANEACION_CACHE
+    from routes.design import refresh_inventory_cache, refresh_projects_cache, INVENTARIO_CACHE, PROYECTOS_CACHE
+
+    def reset_logistics():
+        # Logística no recibe `full_sync`: sin marca de agua la siguiente sincronización es completa
+        PARTIDAS_STATE.high_water = MATERIALES_STATE.high_water = None
+
+    def refresh_all():
+        # Todos los módulos en paralelo: compiten por el mismo limitador, como en el proceso de sincronización
+        jobs = [(refresh_notion_cache, {}), (refresh_sales_cache, {'full_sync': True}),
+                (refresh_planeacion_cache, {'full_sync': True}), (refresh_inventory_cache, {}),
+                (refresh_projects_cache, {})]
+        threads = [threading.Thread(target=fn, kwargs=kwargs) for fn, kwargs in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    all_caches = (PARTIDAS_CACHE, MATERIALES_CACHE, *SALES_CACHES.values(), PLANEACION_CACHE, INVENTARIO_CACHE,
+                  PROYECTOS_CACHE)
+    return [
+        ('logistica', refresh_notion_cache, {}, (PARTIDAS_CACHE, MATERIALES_CACHE), reset_logistics),
+        ('ventas', refresh_sales_cache, {'full_sync': True}, tuple(SALES_CACHES.values()), None),
+        ('planeacion', refresh_planeacion_cache, {'full_sync': True}, (PLANEACION_CACHE,), None),
+        # Después de una completa: solo las páginas editadas desde la marca de agua
+        ('planeacion_delta', refresh_planeacion_cache, {}, (PLANEACION_CACHE,), None),
+        ('inventario', refresh_inventory_cache, {}, (INVENTARIO_CACHE,), None),
+        ('proyectos', refresh_projects_cache, {}, (PROYECTOS_CACHE,), None),
+        ('todas', refresh_all, {}, all_caches, reset_logistics)
+    ]
+
+
+def run_once(fn, kwargs, caches, prepare=None):
+    import notion_api
+    if prepare is not None:
+        prepare()
+    before = dict(notion_api.NOTION_STATS)
+    start = time.perf_counter()
+    # Las funciones están envueltas por SingleFlight: los errores quedan en el grupo, no se propagan
+    fn(**kwargs)
+    elapsed = time.perf_counter() - start
+    for flight in {id(cache.flight): cache.flight for cache in caches}.values():
+        if flight.last_error:
+            raise RuntimeError(flight.last_error)
+    after = notion_api.NOTION_STATS
+    return {
+        'wall': elapsed,
+        'records': sum(len(cache['data']) for cache in caches),
+        'requests': after['requests'] - before['requests'],
+        'throttled': after['throttled'] - before['throttled']
+    }
+
+
+def measure(fn, kwargs, caches, prepare, repeat):
+    runs = [run_once(fn, kwargs, caches, prepare) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r['wall'])
+
+    tracemalloc.start()
+    run_once(fn, kwargs, caches, prepare)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'wall_s': round(best['wall'], 4),
+        'records': best['records'],
+        'requests': best['requests'],
+        'throttled': best['throttled'],
+        'records_per_s': round(best['records'] / best['wall'], 1) if best['wall'] else None,
+        'requests_per_s': round(best['requests'] / best['wall'], 1) if best['wall'] else None,
+        'peak_mb': round(peak / 2 ** 20, 2)
+    }
+
+
+def profile(args):
+    """Parámetros que deben coincidir para comparar contra una referencia."""
+    return {
+        'pages': {name: count for name, count in sorted(mock_notion.parse_pages(args.pages).items())}
+                 or 'default',
+        'extra_properties': args.extra_properties,
+        'latency_ms': args.latency_ms,
+        'rate_429': args.rate_429,
+        'rate_limit': args.rate_limit,
+        'engine': args.engine
+    }
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    """Imprime la comparación y devuelve los escenarios con regresión."""
+    regressions = []
+    print(f"\n{'Escenario':<18} {'Pared':>10} {'Ref.':>10} {'Δ':>8} {'Memoria':>10} {'Ref.':>10} {'Δ':>8}")
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"{name:<18} {result['wall_s']:>9.3f}s {'-':>10}")
+            continue
+        wall_delta = result['wall_s'] / reference['wall_s'] - 1 if reference['wall_s'] else 0.0
+        mem_delta = result['peak_mb'] / reference['peak_mb'] - 1 if reference['peak_mb'] else 0.0
+        flag = ''
+        # En escenarios cortos el ruido relativo es grande: se exige además una diferencia absoluta
+        slower = wall_delta > tolerance and result['wall_s'] - reference['wall_s'] > min_seconds
+        if slower or mem_delta > tolerance:
+            regressions.append(name)
+            flag = '  <- regresión'
+        print(f"{name:<18} {result['wall_s']:>9.3f}s {reference['wall_s']:>9.3f}s {wall_delta:>+7.0%} "
+              f"{result['peak_mb']:>8.2f}MB {reference['peak_mb']:>8.2f}MB {mem_delta:>+7.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    mock_notion.add_arguments(parser)
+    parser.add_argument('--rate-limit', type=float, default=1000.0, help="NOTION_RATE_LIMIT durante la medición")
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads',
+                        help="SYNC_ENGINE durante la medición")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', action='append', help="Escenarios a medir (por omisión, todos)")
+    parser.add_argument('--baseline', default=BASELINES_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="Guarda los resultados como referencia")
+    parser.add_argument('--check', action='store_true', help="Sale con código 1 si hay regresiones")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Regresión permitida (0.25 = 25%%)")
+    parser.add_argument('--min-seconds', type=float, default=0.5, help="Diferencia mínima de tiempo a reportar")
+    args = parser.parse_args()
+
+    process, url = start_mock(args)
+    workdir = tempfile.mkdtemp(prefix='reyper-bench-')
+    try:
+        configure_environment(url, workdir, args)
+        results = {}
+        print(f"{'Escenario':<18} {'Pared':>10} {'Registros':>10} {'Reg/s':>10} {'Peticiones':>11} "
+              f"{'429':>5} {'Memoria':>10}")
+        for name, fn, kwargs, caches, prepare in scenarios():
+            if args.only and name not in args.only:
+                continue
+            # Calentamiento: esquemas de Notion y, para el escenario incremental, la sincronización completa
+            run_once(fn, {**kwargs, 'full_sync': True} if name.endswith('_delta') else kwargs, caches, prepare)
+            result = results[name] = measure(fn, kwargs, caches, prepare, args.repeat)
+            print(f"{name:<18} {result['wall_s']:>9.3f}s {result['records']:>10} {result['records_per_s']:>10} "
+                  f"{result['requests']:>11} {result['throttled']:>5} {result['peak_mb']:>8.2f}MB")
+    finally:
+        process.terminate()
+        process.wait()
+
+    current_profile = profile(args)
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+    key = json.dumps(current_profile, sort_keys=True)
+
+    if args.save_baseline:
+        entry = baselines.setdefault(key, {'profile': current_profile, 'results': {}})
+        entry['results'].update(results)
+        entry['machine'] = f"{platform.machine()}, {os.cpu_count()} CPU, Python {platform.python_version()}"
+        entry['recorded'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"\nReferencia guardada en {args.baseline}")
+        return
+
+    entry = baselines.get(key)
+    if entry is None:
+        print("\nNo hay referencia para este perfil (use --save-baseline)")
+        return
+    print(f"\nReferencia: {entry.get('machine')} ({entry.get('recorded')})")
+    regressions = compare(results, entry['results'], args.tolerance, args.min_seconds)
+    if regressions and args.check:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
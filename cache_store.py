@@ -0,0 +1,246 @@
+"""Persistencia en disco de las cachés sincronizadas desde Notion.
+
+Cada caché se guarda como una instantánea en SQLite después de cada
+sincronización exitosa y se restaura al arrancar, de modo que un worker
+recién iniciado sirve datos de inmediato en lugar de listas vacías.
+
+El mismo archivo es el almacén compartido entre el proceso de
+sincronización (`python sync.py`) y los workers web cuando
+`SYNC_MODE=external`: el proceso de sincronización publica y los workers
+solo leen.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_SNAPSHOT_PATH = os.getenv('CACHE_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'instance', 'cache_snapshots.sqlite3'))
+
+# 'embedded': cada proceso web sincroniza por su cuenta. 'external': lo hace sync.py
+SYNC_MODE = os.getenv('SYNC_MODE', 'embedded')
+# Cada cuántos segundos los workers revisan si hay instantáneas nuevas
+CACHE_WATCH_INTERVAL = float(os.getenv('CACHE_WATCH_INTERVAL', '5'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    name TEXT PRIMARY KEY,
+    timestamp TEXT,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_requests (
+    name TEXT PRIMARY KEY,
+    requested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Cachés registradas en este proceso, por nombre
+CACHE_REGISTRY = {}
+
+# Funciones `fn(name, cache)` a invocar cada vez que una caché cambia de contenido
+_listeners = []
+
+# Conversión de la instantánea JSON a la representación en memoria, por caché (ver `register`)
+_decoders = {}
+
+
+def _connect():
+    directory = os.path.dirname(CACHE_SNAPSHOT_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(CACHE_SNAPSHOT_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def serialize(data):
+    # Las tablas en columnas (ver columnar.py) producen su propio JSON
+    if hasattr(data, 'to_json'):
+        return data.to_json()
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def content_version(payload):
+    """Huella corta del contenido serializado de una caché."""
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def save_snapshot(name, data, timestamp, payload=None):
+    """Guarda atómicamente la instantánea de una caché."""
+    payload = payload if payload is not None else serialize(data)
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (name, timestamp, payload) VALUES (?, ?, ?)",
+                (name, timestamp.isoformat() if timestamp else None, payload)
+            )
+    finally:
+        conn.close()
+
+
+def load_snapshot(name):
+    """Devuelve `(data, timestamp, version)` de la última instantánea o `None` si no existe."""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT timestamp, payload FROM snapshots WHERE name = ?", (name,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    timestamp = datetime.fromisoformat(row[0]) if row[0] else None
+    return json.loads(row[1]), timestamp, content_version(row[1])
+
+
+def save_meta(name, value):
+    """Guarda un valor JSON auxiliar (p. ej. el estado del programador) visible para todos los procesos."""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                         (name, json.dumps(value, ensure_ascii=False)))
+    finally:
+        conn.close()
+
+
+def load_meta(name):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def add_listener(fn):
+    """Registra una función a invocar tras cada publicación o restauración de caché."""
+    _listeners.append(fn)
+
+
+def _notify(name, cache):
+    for fn in _listeners:
+        try:
+            fn(name, cache)
+        except Exception as e:
+            logger.error(f"Error procesando la actualización de {name}: {e}")
+
+
+def publish(name, cache, data, timestamp=None):
+    """Actualiza una caché en memoria y persiste su instantánea."""
+    timestamp = timestamp or datetime.now()
+    payload = serialize(data)
+    # Datos, fecha y versión se reemplazan juntos (ver synced_cache)
+    cache.swap(data, timestamp, content_version(payload))
+    _notify(name, cache)
+    try:
+        save_snapshot(name, data, timestamp, payload)
+    except Exception as e:
+        logger.error(f"No se pudo guardar la instantánea de {name}: {e}")
+
+
+def restore_cache(name, cache):
+    """Carga la instantánea guardada en la caché, conservando su fecha original."""
+    try:
+        snapshot = load_snapshot(name)
+    except Exception as e:
+        logger.error(f"No se pudo leer la instantánea de {name}: {e}")
+        return False
+    if snapshot is None:
+        return False
+    data, timestamp, version = snapshot
+    decode = _decoders.get(name)
+    cache.swap(decode(data) if decode else data, timestamp, version)
+    logger.info(f"Caché {name} restaurada desde disco ({len(cache['data'])} registros, {cache['timestamp']})")
+    _notify(name, cache)
+    return True
+
+
+def register(name, cache, decode=None):
+    """Registra una caché (`synced_cache.SyncedCache`) en el almacén y la restaura desde su instantánea.
+
+    `decode` convierte la lista de registros guardada en la representación
+    que la caché usa en memoria (p. ej. una `ColumnarTable`).
+    """
+    CACHE_REGISTRY[name] = cache
+    if decode is not None:
+        _decoders[name] = decode
+    restore_cache(name, cache)
+    return cache
+
+
+def is_external_sync():
+    return SYNC_MODE == 'external'
+
+
+def trigger_sync(name, target, *args):
+    """Lanza una sincronización manual.
+
+    En modo externo solo se deja la solicitud en el almacén para que la
+    atienda el proceso de sincronización; en modo embebido se ejecuta en un
+    hilo de este proceso.
+    """
+    if is_external_sync():
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO sync_requests (name, requested_at) VALUES (?, ?)",
+                             (name, datetime.now().isoformat()))
+        finally:
+            conn.close()
+        return
+    threading.Thread(target=target, args=args, daemon=True).start()
+
+
+def pop_sync_requests():
+    """Devuelve y elimina los nombres de las sincronizaciones solicitadas."""
+    conn = _connect()
+    try:
+        with conn:
+            names = [row[0] for row in conn.execute("SELECT name FROM sync_requests")]
+            conn.execute("DELETE FROM sync_requests")
+    finally:
+        conn.close()
+    return names
+
+
+def _snapshot_timestamps():
+    conn = _connect()
+    try:
+        return dict(conn.execute("SELECT name, timestamp FROM snapshots").fetchall())
+    finally:
+        conn.close()
+
+
+def reload_changed():
+    """Recarga las cachés registradas cuya instantánea es más reciente que la copia en memoria."""
+    for name, stamp in _snapshot_timestamps().items():
+        cache = CACHE_REGISTRY.get(name)
+        if cache is None:
+            continue
+        current = cache['timestamp'].isoformat() if cache['timestamp'] else None
+        if stamp != current:
+            restore_cache(name, cache)
+
+
+def start_store_watcher():
+    """Inicia el hilo que mantiene las cachés de un worker web al día con el almacén."""
+    def run():
+        while True:
+            try:
+                reload_changed()
+            except Exception as e:
+                logger.error(f"Error leyendo el almacén de cachés: {e}")
+            time.sleep(CACHE_WATCH_INTERVAL)
+
+    threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,226 @@
+"""Almacenamiento en columnas para cachés grandes de registros homogéneos.
+
+En lugar de una lista de diccionarios (un dict de ~12 claves por registro,
+con las mismas cadenas repetidas miles de veces), cada campo se guarda en
+una columna:
+
+- `text`: lista de cadenas, deduplicadas dentro de la tabla.
+- `category`: códigos enteros en un `array` más la lista de categorías
+  (máquinas, operadores, áreas...). Filtrar por categoría compara enteros.
+- `date`: milisegundos desde la época en un `array('q')`, tomando la hora
+  local escrita en Notion (sin aplicar el desfase), de modo que fechas con
+  y sin hora se comparan en el mismo calendario. La cadena ISO original se
+  reconstruye exactamente al serializar.
+
+`to_json()` produce el mismo JSON que `json.dumps(lista_de_dicts)` y se
+calcula una sola vez: las tablas no se modifican después de construirse.
+"""
+import json
+from array import array
+from json.encoder import encode_basestring
+from datetime import datetime, timedelta
+
+# Valor de una fecha vacía en las columnas `date`
+NULL_DATE = -(2 ** 63)
+
+EPOCH = datetime(1970, 1, 1)
+_ONE_MS = timedelta(milliseconds=1)
+
+
+def _encode(value):
+    if isinstance(value, str):
+        return encode_basestring(value)
+    return 'null' if value is None else json.dumps(value, ensure_ascii=False)
+
+
+def parse_date(value):
+    """Convierte una fecha ISO de Notion en `(milisegundos, formato)`; `None` si no se puede representar."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    millis = (parsed.replace(tzinfo=None) - EPOCH) // _ONE_MS
+    if len(value) == 10:
+        return millis, ''
+    rest = value[19:]
+    fraction = rest[:4] if rest.startswith('.') else ''
+    return millis, (fraction and '.') + rest[len(fraction):]
+
+
+def format_date(millis, fmt):
+    """Operación inversa de `parse_date`."""
+    moment = EPOCH + timedelta(milliseconds=millis)
+    if not fmt:
+        return moment.date().isoformat()
+    text = moment.isoformat(timespec='seconds')
+    if fmt.startswith('.'):
+        return f"{text}.{moment.microsecond // 1000:03d}{fmt[1:]}"
+    return text + fmt
+
+
+class TextColumn:
+    def __init__(self):
+        self.values = []
+        self._pool = {}
+
+    def append(self, value):
+        if isinstance(value, str):
+            value = self._pool.setdefault(value, value)
+        self.values.append(value)
+
+    def get(self, index):
+        return self.values[index]
+
+    def encoded(self):
+        encoded = {}
+        return [encoded.get(value) or encoded.setdefault(value, _encode(value)) for value in self.values]
+
+
+class CategoryColumn:
+    def __init__(self):
+        self.codes = array('I')
+        self.categories = []
+        self.index = {}
+
+    def code(self, value):
+        """Código de `value`, o `None` si no aparece en la columna."""
+        return self.index.get(value)
+
+    def append(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.categories)
+            self.categories.append(value)
+        self.codes.append(code)
+
+    def get(self, index):
+        return self.categories[self.codes[index]]
+
+    def encoded(self):
+        encoded = [_encode(value) for value in self.categories]
+        return [encoded[code] for code in self.codes]
+
+
+class DateColumn:
+    def __init__(self):
+        self.millis = array('q')
+        self.formats = array('B')
+        self.format_names = []
+        self._format_index = {}
+        # Cadenas que no se pueden reconstruir desde (milisegundos, formato): se guardan tal cual
+        self.overflow = {}
+
+    def append(self, value):
+        parsed = parse_date(value) if value is not None else None
+        if parsed is None or format_date(*parsed) != value:
+            if value is not None:
+                self.overflow[len(self.millis)] = value
+            parsed = (NULL_DATE if parsed is None else parsed[0]), ''
+        millis, fmt = parsed
+        code = self._format_index.get(fmt)
+        if code is None:
+            code = self._format_index[fmt] = len(self.format_names)
+            self.format_names.append(fmt)
+        self.millis.append(millis)
+        self.formats.append(code)
+
+    def get(self, index):
+        if index in self.overflow:
+            return self.overflow[index]
+        millis = self.millis[index]
+        if millis == NULL_DATE:
+            return None
+        return format_date(millis, self.format_names[self.formats[index]])
+
+    def encoded(self):
+        # Muchas filas comparten fecha: cada combinación se formatea una sola vez
+        encoded = {}
+        result = []
+        for index, key in enumerate(zip(self.millis, self.formats)):
+            if index in self.overflow:
+                result.append(_encode(self.overflow[index]))
+                continue
+            text = encoded.get(key)
+            if text is None:
+                text = encoded[key] = _encode(self.get(index))
+            result.append(text)
+        return result
+
+
+COLUMN_TYPES = {
+    'text': TextColumn,
+    'category': CategoryColumn,
+    'date': DateColumn
+}
+
+
+class Row:
+    """Vista de un registro de la tabla; se comporta como un diccionario de solo lectura."""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.table.columns[key].get(self.index)
+
+    def get(self, key, default=None):
+        column = self.table.columns.get(key)
+        return default if column is None else column.get(self.index)
+
+    def keys(self):
+        return self.table.names
+
+    def to_dict(self):
+        return {name: column.get(self.index) for name, column in self.table.columns.items()}
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class ColumnarTable:
+    """Tabla inmutable en columnas construida a partir de registros tipo diccionario.
+
+    `schema` es `{campo: 'text' | 'category' | 'date'}` y define también el
+    orden de las claves en el JSON.
+    """
+
+    def __init__(self, schema, records=()):
+        self.schema = dict(schema)
+        self.names = list(self.schema)
+        self.columns = {name: COLUMN_TYPES[kind]() for name, kind in self.schema.items()}
+        self.size = 0
+        self._json = None
+        for record in records:
+            for name, column in self.columns.items():
+                column.append(record.get(name))
+            self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return (Row(self, index) for index in range(self.size))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Row(self, i) for i in range(*index.indices(self.size))]
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        return Row(self, index)
+
+    def records(self):
+        """Registros como lista de diccionarios (la forma anterior de la caché)."""
+        return [row.to_dict() for row in self]
+
+    def to_json(self):
+        """JSON idéntico a serializar `records()` con separadores compactos."""
+        if self._json is None:
+            template = '{' + ','.join(f"{_encode(name).replace('%', '%%')}:%s" for name in self.names) + '}'
+            columns = [column.encoded() for column in self.columns.values()]
+            self._json = '[' + ','.join(map(template.__mod__, zip(*columns))) + ']'
+        return self._json
@@ -0,0 +1,140 @@
+"""Notificaciones en vivo (Server-Sent Events) de las actualizaciones de caché.
+
+Cada vez que una caché se publica o se restaura desde el almacén (ver
+`cache_store.add_listener`) se envía a los navegadores suscritos un evento
+ligero `{dataset, version, timestamp, count}`; la pantalla vuelve a pedir
+sus datos solo si la versión cambió (y esa petición responde 304 si ya los
+tiene). En modo `SYNC_MODE=external` los workers reciben las publicaciones
+de `sync.py` a través del vigilante del almacén, así que el aviso llega a
+cualquier worker.
+
+Cada conexión abierta ocupa un hilo (o greenlet) del worker: con gunicorn
+se deben usar workers `gthread` o `gevent`, no `sync`, donde un solo flujo
+abierto bloquearía el proceso. Por eso los eventos están apagados salvo con
+`SSE_ENABLED=1` (gunicorn.conf.py lo activa con esas clases de worker) y,
+mientras tanto, las pantallas siguen consultando periódicamente. Para no agotarlos,
+el número de suscriptores por proceso está limitado (`SSE_MAX_CLIENTS`) y
+cada flujo se cierra tras `SSE_MAX_AGE` segundos; `EventSource` se
+reconecta solo y recibe en ese momento las versiones actuales.
+"""
+import os
+import json
+import time
+import logging
+import threading
+import cache_store
+from http_cache import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Solo con workers que atienden varias peticiones a la vez (ver gunicorn.conf.py)
+SSE_ENABLED = os.getenv('SSE_ENABLED', '0') == '1'
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', '100'))
+# Segundos entre comentarios de mantenimiento (evitan que proxies cierren la conexión)
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+SSE_MAX_AGE = float(os.getenv('SSE_MAX_AGE', '300'))
+# Espera sugerida al navegador antes de reconectar (milisegundos)
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', '5000'))
+
+
+def cache_event(name, cache):
+    """Evento con la versión actual de una caché."""
+    data = cache.get('data')
+    return {
+        'dataset': name,
+        'version': cache.get('version'),
+        'timestamp': format_timestamp(cache.get('timestamp')),
+        'count': len(data) if data is not None else 0
+    }
+
+
+class Subscriber:
+    """Eventos pendientes de una conexión; solo se conserva el último por dataset."""
+
+    def __init__(self, datasets):
+        self.datasets = set(datasets)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+
+    def push(self, event):
+        with self.lock:
+            self.pending[event['dataset']] = event
+        self.ready.set()
+
+    def take(self, timeout):
+        """Espera hasta `timeout` segundos y devuelve los eventos pendientes (posiblemente ninguno)."""
+        self.ready.wait(timeout)
+        with self.lock:
+            self.ready.clear()
+            events, self.pending = list(self.pending.values()), {}
+        return events
+
+
+class EventHub:
+    def __init__(self, max_clients):
+        self.max_clients = max_clients
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.sequence = 0
+
+    def subscribe(self, datasets):
+        """Nuevo suscriptor de `datasets`, o `None` si se alcanzó el máximo de conexiones."""
+        with self.lock:
+            if len(self.subscribers) >= self.max_clients:
+                logger.warning(f"Se alcanzó el máximo de {self.max_clients} conexiones de eventos")
+                return None
+            subscriber = Subscriber(datasets)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = [s for s in self.subscribers if event['dataset'] in s.datasets]
+        for subscriber in subscribers:
+            subscriber.push(event)
+
+    def next_id(self):
+        with self.lock:
+            self.sequence += 1
+            return self.sequence
+
+
+HUB = EventHub(SSE_MAX_CLIENTS)
+
+
+def _on_cache_update(name, cache):
+    HUB.publish(cache_event(name, cache))
+
+
+cache_store.add_listener(_on_cache_update)
+
+
+def format_sse(event, event_id):
+    return f"id: {event_id}\nevent: cache\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def stream(subscriber, max_age=None):
+    """Genera el flujo SSE de un suscriptor: versiones actuales primero y luego cada cambio."""
+    max_age = SSE_MAX_AGE if max_age is None else max_age
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        for name in sorted(subscriber.datasets):
+            yield format_sse(cache_event(name, cache_store.CACHE_REGISTRY[name]), HUB.next_id())
+
+        deadline = time.monotonic() + max_age
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            events = subscriber.take(min(SSE_HEARTBEAT, remaining))
+            for event in events:
+                yield format_sse(event, HUB.next_id())
+            if not events:
+                yield ": ping\n\n"
+    finally:
+        HUB.unsubscribe(subscriber)
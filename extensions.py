@@ -1,11 +1,100 @@
+"""Clientes de Supabase compartidos por las rutas.
+
+- `supabase`: cliente con la clave de servicio (`SUPABASE_SERVICE_KEY`) para
+  leer y escribir tablas (`profiles`). No guarda sesión de usuario, así que
+  las peticiones concurrentes no se pisan; el control de acceso lo hacen
+  las rutas (`login_required`, roles).
+- `auth_client()`: presta un cliente aislado con la clave pública
+  (`SUPABASE_KEY`) para las operaciones de autenticación, que sí guardan
+  sesión (`sign_in_with_password`, `set_session`, `update_user`...). Antes
+  todas compartían un único cliente: dos inicios de sesión simultáneos se
+  mezclaban y las consultas corrían con la sesión del último usuario. Los
+  clientes se reutilizan (`SUPABASE_AUTH_POOL` libres como máximo) y al
+  devolverlos se cierra su sesión de Supabase; la sesión de la aplicación
+  es la de Flask-Login.
+"""
 import os
-from supabase import create_client, Client
+import logging
+from queue import LifoQueue, Empty, Full
+from contextlib import contextmanager
+from supabase import create_client, Client, ClientOptions
+from supabase_auth import SyncMemoryStorage
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 url: str = os.getenv("SUPABASE_URL")
 key: str = os.getenv("SUPABASE_KEY")
+service_key: str = os.getenv("SUPABASE_SERVICE_KEY")
+# Clientes de autenticación libres que se conservan para reutilizar
+SUPABASE_AUTH_POOL = int(os.getenv('SUPABASE_AUTH_POOL', '8'))
+
+
+def _client_options(storage=None):
+    # Sin hilo de renovación y con la sesión en memoria del propio cliente (nunca en `storage`)
+    return ClientOptions(auto_refresh_token=False, persist_session=False,
+                         storage=storage if storage is not None else SyncMemoryStorage())
+
+
+class AuthClientPool:
+    """Clientes de Supabase con sesión propia, prestados uno por petición.
+
+    No hay un límite de clientes prestados (si no queda ninguno libre se
+    crea otro), así que los inicios de sesión no esperan unos a otros; solo
+    se conservan `size` clientes libres para no pagar de nuevo la creación
+    de sus conexiones.
+    """
+
+    def __init__(self, url, key, size):
+        self.url = url
+        self.key = key
+        self.idle = LifoQueue(maxsize=size)
+        # Solo guarda el verificador PKCE de `reset_password_for_email`, que el enlace del correo
+        # canjea después (`exchange_code_for_session`) posiblemente con otro cliente del grupo
+        self.storage = SyncMemoryStorage()
+
+    def _create(self):
+        return create_client(self.url, self.key, options=_client_options(self.storage))
+
+    @contextmanager
+    def client(self):
+        try:
+            client = self.idle.get_nowait()
+        except Empty:
+            client = self._create()
+        try:
+            yield client
+        finally:
+            self._release(client)
+
+    def _release(self, client):
+        try:
+            # Cierra solo la sesión de este cliente (la de la aplicación es la de Flask-Login)
+            if client.auth.get_session() is not None:
+                client.auth.sign_out({"scope": "local"})
+        except Exception as e:
+            # Estado incierto: el cliente se descarta en lugar de volver al grupo
+            logger.warning(f"No se pudo cerrar la sesión de Supabase del cliente de autenticación: {e}")
+            return
+        try:
+            self.idle.put_nowait(client)
+        except Full:
+            pass
+
+
+if url and key and not service_key:
+    logger.warning("SUPABASE_SERVICE_KEY no está definida; las tablas se consultan con SUPABASE_KEY "
+                   "y las políticas RLS pueden ocultar perfiles")
+
+# Initialize clients only if keys are present
+supabase: Client = create_client(url, service_key or key, options=_client_options()) if url and key else None
+_auth_pool = AuthClientPool(url, key, SUPABASE_AUTH_POOL) if url and key else None
+
 
-# Initialize client only if keys are present
-supabase: Client = create_client(url, key) if url and key else None
+def auth_client():
+    """Presta un cliente de autenticación aislado: `with auth_client() as client: ...`."""
+    if _auth_pool is None:
+        raise RuntimeError("Supabase no está configurado (SUPABASE_URL, SUPABASE_KEY)")
+    return _auth_pool.client()
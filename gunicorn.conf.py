@@ -0,0 +1,103 @@
+"""Configuración de gunicorn para producción.
+
+Uso: `gunicorn -c gunicorn.conf.py` (el CMD del Dockerfile).
+
+Clases de worker (`GUNICORN_WORKER_CLASS`):
+- `gthread` (por omisión): `GUNICORN_THREADS` peticiones simultáneas por
+  worker. Un webhook lento de n8n o un inicio de sesión en Supabase solo
+  ocupa su hilo. Los flujos SSE (ver events.py) también ocupan un hilo,
+  así que por omisión se limitan a la mitad de los hilos de cada worker.
+- `gevent`: cientos de conexiones por worker
+  (`GUNICORN_WORKER_CONNECTIONS`), para muchos navegadores con SSE
+  abiertos. Como gevent parchea la biblioteca estándar al iniciar cada
+  worker, la aplicación no se precarga en el maestro.
+
+Los workers (`WEB_CONCURRENCY`, por omisión uno por CPU) arrancan con
+`SYNC_MODE=external` y solo leen el almacén de cachés. Las
+sincronizaciones con Notion, el programador y la bandeja de salida corren
+una sola vez por despliegue en `python sync.py`, que el maestro inicia y
+reinicia si termina. Si la sincronización corre en otro contenedor, usar
+`GUNICORN_SYNC_PROCESS=0`.
+"""
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CPU_COUNT = os.cpu_count() or 1
+
+GUNICORN_WORKER_CLASS = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '8'))
+GUNICORN_WORKER_CONNECTIONS = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+# Iniciar `python sync.py` desde el maestro ('0' si corre en otro contenedor)
+GUNICORN_SYNC_PROCESS = os.getenv('GUNICORN_SYNC_PROCESS', '1') == '1'
+# Segundos de espera antes de reiniciar sync.py si termina
+SYNC_RESTART_DELAY = float(os.getenv('SYNC_RESTART_DELAY', '10'))
+
+# Los workers solo leen el almacén: cada uno tiene sus propias cachés en memoria
+os.environ.setdefault('SYNC_MODE', 'external')
+# Los flujos SSE solo con workers que atienden varias peticiones a la vez (ver events.py)
+if GUNICORN_WORKER_CLASS in ('gthread', 'gevent'):
+    os.environ.setdefault('SSE_ENABLED', '1')
+if GUNICORN_WORKER_CLASS == 'gthread':
+    os.environ.setdefault('SSE_MAX_CLIENTS', str(max(1, GUNICORN_THREADS // 2)))
+
+wsgi_app = 'app:create_app()'
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = GUNICORN_WORKER_CLASS
+workers = int(os.getenv('WEB_CONCURRENCY', str(max(2, CPU_COUNT))))
+threads = GUNICORN_THREADS
+worker_connections = GUNICORN_WORKER_CONNECTIONS
+# Con gevent, los módulos deben importarse después de parchear la biblioteca estándar
+preload_app = GUNICORN_WORKER_CLASS != 'gevent'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+_sync = {'process': None, 'stopping': False}
+
+
+def _run_sync_process(server):
+    while not _sync['stopping']:
+        # El proceso de sincronización es el que publica: no hereda el modo externo de los workers
+        env = dict(os.environ, SYNC_MODE='embedded')
+        process = _sync['process'] = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, 'sync.py')],
+                                                      cwd=BASE_DIR, env=env)
+        server.log.info(f"Proceso de sincronización iniciado (pid {process.pid})")
+        code = process.wait()
+        # Terminado junto con el maestro (p. ej. Ctrl+C o SIGTERM al grupo de procesos)
+        if _sync['stopping'] or code in (-signal.SIGTERM, -signal.SIGINT):
+            return
+        server.log.error(f"El proceso de sincronización terminó ({code}); reinicio en {SYNC_RESTART_DELAY:g}s")
+        time.sleep(SYNC_RESTART_DELAY)
+
+
+def when_ready(server):
+    if os.environ['SYNC_MODE'] != 'external':
+        if workers > 1:
+            server.log.warning("SYNC_MODE=embedded con varios workers: cada worker sincronizará por su cuenta")
+        return
+    if GUNICORN_SYNC_PROCESS:
+        threading.Thread(target=_run_sync_process, args=(server,), name='sync-process', daemon=True).start()
+
+
+def post_worker_init(worker):
+    # Después del fork (y del parcheo de gevent): los hilos del worker no se heredan del maestro
+    from app import start_background_tasks
+    start_background_tasks()
+
+
+def on_exit(server):
+    _sync['stopping'] = True
+    process = _sync['process']
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=graceful_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,168 @@
+"""Respuestas precalculadas y condicionales para las APIs respaldadas por caché.
+
+Cada endpoint registra una vez cómo construir su cuerpo (`register_payload`).
+Cuando una de sus cachés se publica, el JSON final se serializa y se
+comprime (gzip y, si está instalado, brotli) una sola vez; las peticiones
+solo eligen la variante según `Accept-Encoding` y copian los bytes.
+
+El ETag se deriva de la versión de contenido que `cache_store` calcula al
+sincronizar, de modo que si el cliente ya tiene esa versión se responde 304
+sin cuerpo. La cabecera `X-Cache-Versions` (`partidas=<versión>,...`) dice
+qué versión de cada caché se entregó, para que la pantalla la compare con
+los avisos en vivo (ver static/js/cache_events.js).
+"""
+import gzip
+import json
+import hashlib
+import threading
+from flask import request, Response
+import cache_store
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def format_timestamp(timestamp):
+    return timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+
+
+def compute_etag(caches, *extra):
+    """ETag de una respuesta construida a partir de `caches` más valores adicionales."""
+    parts = []
+    for cache in caches:
+        # Lectura de la instantánea completa; si está vencida se revalida en segundo plano
+        snapshot = cache.read()
+        timestamp = snapshot.timestamp.isoformat() if snapshot.timestamp else ''
+        parts.append(f"{snapshot.version or ''}:{timestamp}:{cache.is_syncing}")
+    parts.extend(str(value) for value in extra)
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:20]
+
+
+class RawJSON(str):
+    """Fragmento ya serializado (p. ej. `ColumnarTable.to_json()`) que se inserta tal cual en el cuerpo."""
+
+
+def _dumps(value):
+    if isinstance(value, RawJSON):
+        return value
+    if isinstance(value, dict) and any(isinstance(v, (RawJSON, dict)) for v in value.values()):
+        items = (f"{json.dumps(str(k), ensure_ascii=False)}:{_dumps(v)}" for k, v in value.items())
+        return '{' + ','.join(items) + '}'
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _encode(body):
+    raw = _dumps(body).encode('utf-8')
+    variants = {'identity': raw, 'gzip': gzip.compress(raw, GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(raw, quality=BROTLI_QUALITY)
+    return variants
+
+
+class PrecomputedPayload:
+    """Cuerpo de un endpoint serializado y comprimido por versión de sus cachés.
+
+    `build(is_syncing)` devuelve el diccionario de la respuesta; se
+    precalculan ambas variantes del indicador de sincronización para que el
+    cambio de estado no obligue a serializar durante una petición.
+    """
+
+    def __init__(self, key, caches, build):
+        self.key = key
+        self.caches = caches
+        self.build = build
+        self.stamp = None
+        self.variants = {}
+        self.lock = threading.Lock()
+
+    def _stamp(self):
+        return tuple(c.snapshot()[1:] for c in self.caches.values())
+
+    def render(self):
+        stamp = self._stamp()
+        if stamp != self.stamp:
+            with self.lock:
+                if stamp != self.stamp:
+                    self.variants = {flag: _encode(self.build(flag)) for flag in (False, True)}
+                    self.stamp = stamp
+        return self.variants
+
+    def is_syncing(self):
+        return any(c.is_syncing for c in self.caches.values())
+
+
+PAYLOADS = {}
+
+
+def register_payload(key, caches, build):
+    """Registra el cuerpo precalculado de un endpoint. `caches` es `{nombre: caché}`."""
+    PAYLOADS[key] = PrecomputedPayload(key, caches, build)
+    return PAYLOADS[key]
+
+
+def _warm(name, cache):
+    for payload in list(PAYLOADS.values()):
+        if name in payload.caches:
+            payload.render()
+
+
+def _negotiate(variants):
+    accepted = request.accept_encodings
+    if 'br' in variants and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return 'identity'
+
+
+def _versions(caches):
+    versions = ((cache.name, cache.snapshot().version) for cache in caches)
+    return ','.join(f"{name}={version}" for name, version in versions if version)
+
+
+def _revalidate(response, etag, caches):
+    response.set_etag(etag)
+    response.headers['X-Cache-Versions'] = _versions(caches)
+    # Datos privados de usuarios autenticados: el navegador debe revalidar siempre
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def payload_response(key):
+    """Responde 304 si el cliente ya tiene la versión actual; si no, envía los bytes precalculados."""
+    payload = PAYLOADS[key]
+    caches = payload.caches.values()
+    etag = compute_etag(caches)
+    if request.if_none_match.contains(etag):
+        return _revalidate(Response(status=304), etag, caches)
+
+    variants = payload.render()[payload.is_syncing()]
+    encoding = _negotiate(variants)
+    response = Response(variants[encoding], mimetype='application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return _revalidate(response, etag, caches)
+
+
+def query_response(caches, build, *extra):
+    """Respuesta calculada por petición (p. ej. una consulta filtrada) con ETag y 304.
+
+    El ETag se deriva de `caches` y de `extra` (normalmente los parámetros
+    de la consulta); `build()` solo se invoca si el cliente no tiene ya esa
+    versión.
+    """
+    etag = compute_etag(caches, *extra)
+    if request.if_none_match.contains(etag):
+        return _revalidate(Response(status=304), etag, caches)
+    return _revalidate(Response(_dumps(build()), mimetype='application/json'), etag, caches)
+
+
+# Serializar y comprimir en el momento de la sincronización, no en la petición
+cache_store.add_listener(_warm)
@@ -1,4 +1,5 @@
 import os
+import sys
 import requests
 import json
 from dotenv import load_dotenv
@@ -49,7 +50,38 @@ def check(p):
                 return True
     return False
 
-print("Checking Files/Media filter...")
-if not check(payload_files):
-    print("Checking Rollup filter...")
-    check(payload)
+def show_schema():
+    """Imprime el esquema de la base de datos y cómo lo resuelve el extractor de Planeación."""
+    import notion_schema
+    from routes.production import PLANEACION_SPEC
+
+    schema = notion_schema.fetch_schema(token, db_id)
+    for name, (prop_id, prop_type) in sorted(schema.properties.items()):
+        print(f"{name!r}: {prop_type} (id {prop_id})")
+    extractor = PLANEACION_SPEC.compile(schema)
+    for output, name, reader, _ in extractor.plan:
+        print(f"{output} <- {name!r} ({reader.__name__ if reader else 'sin propiedad'})")
+
+def record(path, limit=500):
+    """Guarda páginas reales de Planeación en `path` para el micro-benchmark (bench/extractor.py)."""
+    pages = []
+    body = {"page_size": 100}
+    while len(pages) < limit:
+        data = requests.post(url, headers=headers, json=body).json()
+        pages.extend(data.get('results', []))
+        if not data.get('has_more'):
+            break
+        body["start_cursor"] = data['next_cursor']
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(pages[:limit], f, ensure_ascii=False)
+    print(f"{len(pages[:limit])} páginas guardadas en {path}")
+
+if '--schema' in sys.argv:
+    show_schema()
+elif '--record' in sys.argv:
+    record(sys.argv[sys.argv.index('--record') + 1])
+else:
+    print("Checking Files/Media filter...")
+    if not check(payload_files):
+        print("Checking Rollup filter...")
+        check(payload)
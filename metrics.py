@@ -0,0 +1,284 @@
+"""Métricas del proceso en formato de texto de Prometheus (`/metrics`).
+
+Antes solo había líneas de log como "Sincronización ... completada". Ahora
+cada módulo registra sus mediciones aquí:
+
+- `sync_duration_seconds{flight}`: duración de cada sincronización con
+  Notion (ver `synced_cache.SingleFlight`) y `sync_runs_total{flight,result}`.
+- `notion_request_seconds{endpoint}`, `notion_responses_total{endpoint,status}`
+  y `notion_query_pages_total{label}`: latencia, códigos de respuesta y
+  páginas por consulta (ver `notion_api`).
+- `webhook_delivery_seconds{kind}` y `webhook_deliveries_total{kind,status}`:
+  entregas de la bandeja de salida a n8n por formulario (ver `outbox`).
+- `http_request_seconds{endpoint,method}` y
+  `http_responses_total{endpoint,method,status}`: latencia por ruta de Flask.
+- Tamaño, antigüedad y estado de las cachés y de las tareas del
+  programador, calculados al momento de cada consulta.
+
+Las métricas son por proceso: cada worker de gunicorn expone las suyas y
+con `SYNC_MODE=external` las de sincronización viven en `python sync.py`,
+que las sirve en `METRICS_PORT`. Sin dependencias: no se usa
+`prometheus_client`.
+"""
+import os
+import re
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# `/metrics` acepta `Authorization: Bearer <METRICS_TOKEN>`; sin token, la ruta de Flask exige iniciar
+# sesión y el servidor de `sync.py` rechaza todas las peticiones
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Puerto del servidor de métricas de `sync.py` (0 = deshabilitado)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Límites de los histogramas en segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SYNC_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+                                for key, value in values]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Conteo por intervalo (el último es +Inf), suma y total
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[0][bisect.bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def collect(self):
+        with self._lock:
+            values = sorted((key, (list(c[0]), c[1], c[2])) for key, c in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', _number(bound))])} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Gauge(Metric):
+    """Valor calculado al consultar: `collect_fn()` devuelve `[(valores de etiquetas, valor)]`."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), collect_fn=None):
+        super().__init__(name, documentation, labels)
+        self.collect_fn = collect_fn
+
+    def collect(self):
+        try:
+            values = list(self.collect_fn())
+        except Exception as e:
+            logger.error(f"No se pudo calcular la métrica {self.name}: {e}")
+            values = []
+        return self.header() + [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+                                for key, value in values if value is not None]
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def counter(name, documentation, labels=()):
+    return _register(Counter(name, documentation, labels))
+
+
+def histogram(name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, documentation, labels, buckets))
+
+
+def gauge(name, documentation, labels=(), collect_fn=None):
+    return _register(Gauge(name, documentation, labels, collect_fn))
+
+
+SYNC_DURATION = histogram('sync_duration_seconds', 'Duración de las sincronizaciones con Notion.',
+                          ('flight',), SYNC_BUCKETS)
+SYNC_RUNS = counter('sync_runs_total', 'Sincronizaciones por resultado (ok, error o coalesced).',
+                    ('flight', 'result'))
+
+NOTION_LATENCY = histogram('notion_request_seconds', 'Latencia de las peticiones a la API de Notion.',
+                           ('endpoint',))
+NOTION_RESPONSES = counter('notion_responses_total', 'Respuestas de la API de Notion por código.',
+                           ('endpoint', 'status'))
+NOTION_PAGES = counter('notion_query_pages_total', 'Páginas de resultados leídas por consulta.', ('label',))
+
+WEBHOOK_LATENCY = histogram('webhook_delivery_seconds', 'Latencia de las entregas a los webhooks de n8n.',
+                            ('kind',))
+WEBHOOK_DELIVERIES = counter('webhook_deliveries_total', 'Entregas a n8n por código (error = sin respuesta).',
+                             ('kind', 'status'))
+
+HTTP_LATENCY = histogram('http_request_seconds', 'Latencia de las peticiones por ruta.', ('endpoint', 'method'))
+HTTP_RESPONSES = counter('http_responses_total', 'Respuestas por ruta y código.', ('endpoint', 'method', 'status'))
+
+
+def _cache_stat(field):
+    def collect():
+        import synced_cache
+        return [((name,), cache.stats()[field]) for name, cache in sorted(synced_cache.CACHES.items())]
+    return collect
+
+
+def _job_stat(field):
+    def collect():
+        import scheduler
+        return [((job['name'],), job[field]) for job in scheduler.SCHEDULER.states()]
+    return collect
+
+
+def _cache_flag(field):
+    collect = _cache_stat(field)
+    return lambda: [(key, int(value)) for key, value in collect()]
+
+
+gauge('cache_records', 'Registros en cada caché.', ('dataset',), _cache_stat('records'))
+gauge('cache_age_seconds', 'Segundos desde la última sincronización de cada caché.', ('dataset',),
+      _cache_stat('age'))
+gauge('cache_ttl_seconds', 'TTL de cada caché.', ('dataset',), _cache_stat('ttl'))
+gauge('cache_stale', '1 si la caché superó su TTL.', ('dataset',), _cache_flag('stale'))
+gauge('cache_syncing', '1 si la caché se está sincronizando.', ('dataset',), _cache_flag('syncing'))
+gauge('scheduler_job_runs', 'Ejecuciones de cada tarea programada.', ('job',), _job_stat('runs'))
+gauge('scheduler_job_last_duration_seconds', 'Duración de la última ejecución de cada tarea.', ('job',),
+      _job_stat('last_duration'))
+
+
+_ID_SEGMENT = re.compile(r'/[0-9a-fA-F-]{32,36}(?=/|$)')
+
+
+def notion_endpoint(method, path):
+    """`POST /databases/:id/query` a partir de la ruta concreta (sin ids, para no multiplicar series)."""
+    return f"{method} {_ID_SEGMENT.sub('/:id', path.split('?', 1)[0])}"
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def authorized(header):
+    """Valida la cabecera `Authorization` contra `METRICS_TOKEN` (sin token configurado, nada pasa)."""
+    return bool(METRICS_TOKEN) and header == f"Bearer {METRICS_TOKEN}"
+
+
+def init_app(app):
+    """Mide la latencia de cada petición de Flask por endpoint."""
+    from flask import request, g
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # Se usa el nombre del endpoint (p. ej. `sales.quotation`), no la URL, para acotar las series
+            endpoint = request.endpoint or 'not_found'
+            HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+            HTTP_RESPONSES.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        return response
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        if not authorized(self.headers.get('Authorization')):
+            self.send_error(401)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=None):
+    """Sirve `/metrics` en un hilo (para `sync.py`, que no corre Flask)."""
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = ThreadingHTTPServer(('0.0.0.0', port), _Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Métricas disponibles en el puerto {port} (/metrics)")
+    if not METRICS_TOKEN:
+        logger.warning("METRICS_TOKEN no está definido: el servidor de métricas rechazará todas las peticiones")
+    return server
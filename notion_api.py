@@ -0,0 +1,597 @@
+"""Cliente HTTP compartido para la API de Notion.
+
+Todas las sincronizaciones (Logística, Ventas, Producción y Diseño) pasan por
+este módulo para reutilizar conexiones keep-alive en lugar de abrir una
+conexión TCP+TLS nueva por cada página de resultados.
+
+Cada petición consume una ficha del limitador del token (Notion admite unas
+3 peticiones por segundo por integración); ante un 429 se respeta
+`Retry-After` y se reintenta la misma página en lugar de abandonar la
+paginación.
+
+Las respuestas de las consultas se decodifican en streaming
+(`iter_response_results`): solo se conserva un fragmento del cuerpo y la
+página en curso, que se proyecta al registro de la caché y se descarta.
+"""
+import os
+import re
+import json
+import time
+import codecs
+import hashlib
+import logging
+import threading
+from queue import Queue, Full
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rate_limit import TokenBucket, SharedTokenBucket
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Sobrescribible para apuntar a la API local de bench/mock_notion.py
+NOTION_API_URL = os.getenv('NOTION_API_URL', "https://api.notion.com/v1")
+NOTION_VERSION = "2022-06-28"
+
+# Configuración (sobrescribible desde .env)
+NOTION_TIMEOUT = float(os.getenv('NOTION_TIMEOUT', '30'))
+NOTION_MAX_RETRIES = int(os.getenv('NOTION_MAX_RETRIES', '3'))
+NOTION_BACKOFF = float(os.getenv('NOTION_BACKOFF', '0.5'))
+NOTION_POOL_SIZE = int(os.getenv('NOTION_POOL_SIZE', '8'))
+# Cada cuántas horas la sincronización incremental hace una reconciliación completa
+NOTION_FULL_SYNC_HOURS = float(os.getenv('NOTION_FULL_SYNC_HOURS', '6'))
+# Presupuesto de peticiones por token y reintentos ante 429
+NOTION_RATE_LIMIT = float(os.getenv('NOTION_RATE_LIMIT', '3'))
+NOTION_RATE_BURST = float(os.getenv('NOTION_RATE_BURST', '3'))
+NOTION_MAX_429_RETRIES = int(os.getenv('NOTION_MAX_429_RETRIES', '6'))
+# Número de rangos de fechas en que se divide una consulta grande (ver date_shard_filters)
+NOTION_SHARDS = int(os.getenv('NOTION_SHARDS', '4'))
+# Tamaño de los fragmentos leídos del cuerpo de cada respuesta
+NOTION_STREAM_CHUNK = int(os.getenv('NOTION_STREAM_CHUNK', str(64 * 1024)))
+# Páginas decodificadas que pueden esperar en la cola de una consulta paralela
+NOTION_SHARD_QUEUE = int(os.getenv('NOTION_SHARD_QUEUE', '500'))
+# Con NOTION_RATE_SHARED=1 el presupuesto se comparte entre procesos mediante SQLite
+NOTION_RATE_SHARED = os.getenv('NOTION_RATE_SHARED', '1') == '1'
+NOTION_RATE_PATH = os.getenv('NOTION_RATE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              'instance', 'notion_rate.sqlite3'))
+
+# Una sesión por token: cada integración conserva su propio pool de conexiones
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Un limitador por token
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+# Contadores acumulados para medir el efecto del pool
+NOTION_STATS = {
+    'requests': 0,
+    'pages': 0,
+    'errors': 0,
+    'throttled': 0,
+    'seconds': 0.0
+}
+_stats_lock = threading.Lock()
+
+
+_RESULTS_KEY = re.compile(r'"results"\s*:\s*\[')
+_json_decoder = json.JSONDecoder()
+
+
+class NotionAPIError(Exception):
+    """Error devuelto por la API de Notion durante una consulta."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+def _build_session(token):
+    """Crea una sesión con pool keep-alive, cabeceras fijas y reintentos."""
+    session = requests.Session()
+    session.headers.update({
+        "Authorization": f"Bearer {token}",
+        "Notion-Version": NOTION_VERSION,
+        "Content-Type": "application/json"
+    })
+    retry = Retry(
+        total=NOTION_MAX_RETRIES,
+        connect=NOTION_MAX_RETRIES,
+        read=NOTION_MAX_RETRIES,
+        backoff_factor=NOTION_BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+        # Las consultas a Notion son POST pero de solo lectura, por lo que es seguro reintentarlas
+        allowed_methods=frozenset(['GET', 'POST']),
+        # Los 429 los reintenta notion_request pausando el limitador; urllib3 no debe reintentarlos por su cuenta
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=NOTION_POOL_SIZE, pool_maxsize=NOTION_POOL_SIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(token):
+    """Devuelve la sesión compartida asociada a un token de integración."""
+    session = _sessions.get(token)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(token)
+            if session is None:
+                session = _build_session(token)
+                _sessions[token] = session
+    return session
+
+
+def get_limiter(token):
+    """Devuelve el limitador de tasa asociado a un token de integración."""
+    limiter = _limiters.get(token)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(token)
+            if limiter is None:
+                if NOTION_RATE_SHARED:
+                    # Nunca se guarda el token en disco, solo su huella
+                    key = hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+                    limiter = SharedTokenBucket(NOTION_RATE_PATH, key, NOTION_RATE_LIMIT, NOTION_RATE_BURST)
+                else:
+                    limiter = TokenBucket(NOTION_RATE_LIMIT, NOTION_RATE_BURST)
+                _limiters[token] = limiter
+    return limiter
+
+
+def _retry_after(response, attempt):
+    try:
+        return max(float(response.headers.get('Retry-After')), 0.5)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 30)
+
+
+def _record(method, path, elapsed, status_code):
+    ok = status_code < 400
+    with _stats_lock:
+        NOTION_STATS['requests'] += 1
+        NOTION_STATS['seconds'] += elapsed
+        if ok:
+            NOTION_STATS['pages'] += 1
+        else:
+            NOTION_STATS['errors'] += 1
+    endpoint = metrics.notion_endpoint(method, path)
+    metrics.NOTION_LATENCY.observe(elapsed, endpoint=endpoint)
+    metrics.NOTION_RESPONSES.inc(endpoint=endpoint, status=status_code)
+
+
+def _record_throttled():
+    with _stats_lock:
+        NOTION_STATS['throttled'] += 1
+
+
+def notion_request(token, method, path, timeout=None, **kwargs):
+    """Ejecuta una petición a la API de Notion respetando el límite de tasa del token.
+
+    Las respuestas 429 se reintentan tras esperar `Retry-After`, pausando
+    también al resto de consumidores del mismo token.
+    """
+    session = get_session(token)
+    limiter = get_limiter(token)
+    attempt = 0
+    while True:
+        limiter.acquire()
+        start = time.perf_counter()
+        response = session.request(method, f"{NOTION_API_URL}{path}", timeout=timeout or NOTION_TIMEOUT, **kwargs)
+        _record(method, path, time.perf_counter() - start, response.status_code)
+        if response.status_code != 429 or attempt >= NOTION_MAX_429_RETRIES:
+            return response
+
+        response.close()
+        attempt += 1
+        wait = _retry_after(response, attempt)
+        _record_throttled()
+        logger.warning(f"Notion devolvió 429; reintentando {path} en {wait:.1f}s (intento {attempt})")
+        limiter.pause(wait)
+
+
+class SyncBudget:
+    """Presupuesto de una sincronización: registros guardados y bytes descargados.
+
+    Cuando se agota, la paginación se detiene y se conserva lo obtenido
+    hasta ese momento (igual que con `max_pages`). Se crea uno por
+    sincronización y se comparte entre los fragmentos de una consulta
+    paralela.
+    """
+
+    def __init__(self, max_records=None, max_mb=None):
+        self.max_records = max_records or None
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self.records = 0
+        self.bytes = 0
+        self.exceeded = None
+        self.lock = threading.Lock()
+
+    def add_bytes(self, count):
+        with self.lock:
+            self.bytes += count
+            if self.max_bytes is not None and self.bytes > self.max_bytes and not self.exceeded:
+                self.exceeded = f"{self.bytes / 1048576:.1f} MB descargados (límite {self.max_bytes / 1048576:.1f} MB)"
+            return self.exceeded
+
+    def add_record(self):
+        with self.lock:
+            self.records += 1
+            if self.max_records is not None and self.records >= self.max_records and not self.exceeded:
+                self.exceeded = f"{self.records} registros (límite {self.max_records})"
+            return self.exceeded
+
+
+class ResultsDecoder:
+    """Decodificador incremental del cuerpo de una consulta: recibe fragmentos y devuelve los `results` completos.
+
+    Solo se mantiene en memoria el texto pendiente y el resultado en curso,
+    en lugar del árbol completo de hasta 100 páginas. Lo usan
+    `iter_response_results` (requests) y notion_async (aiohttp).
+    """
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.head = None  # Campos previos al arreglo de resultados (normalmente solo "object")
+        self.tail = None  # Campos posteriores (has_more, next_cursor...), una vez cerrado el arreglo
+        self.bytes = 0
+
+    def feed(self, chunk):
+        """Agrega un fragmento del cuerpo y devuelve la lista de resultados que quedaron completos."""
+        self.bytes += len(chunk)
+        text = self.decoder.decode(chunk)
+        if self.tail is not None:
+            self.tail += text
+            return []
+        self.buffer += text
+        if self.head is None:
+            match = _RESULTS_KEY.search(self.buffer)
+            if not match:
+                return []
+            self.head = self.buffer[:match.start()]
+            self.buffer = self.buffer[match.end():]
+
+        items = []
+        buffer, pos = self.buffer, self.pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                buffer, pos = '', 0
+                break
+            if buffer[pos] == ']':
+                self.tail = buffer[pos + 1:]
+                buffer, pos = '', 0
+                break
+            try:
+                item, end = _json_decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Página incompleta: se vuelve a intentar con el siguiente fragmento
+                break
+            pos = end
+            items.append(item)
+            if pos > len(buffer) // 2:
+                buffer, pos = buffer[pos:], 0
+        self.buffer, self.pos = buffer, pos
+        return items
+
+    def finish(self):
+        """Resto de campos de la respuesta, una vez recibido todo el cuerpo."""
+        if self.head is None:
+            raise ValueError("Respuesta de Notion sin 'results'")
+        if self.tail is None:
+            raise ValueError("Respuesta de Notion truncada")
+        return json.loads(self.head + '"results":[]' + self.tail)
+
+
+def iter_response_results(response, envelope, chunk_size=None):
+    """Decodifica de forma incremental el cuerpo de una consulta y entrega cada elemento de `results`.
+
+    Al terminar, `envelope` recibe el resto de campos de la respuesta
+    (`has_more`, `next_cursor`); `envelope['bytes']` lleva los bytes leídos
+    hasta el momento.
+    """
+    decoder = ResultsDecoder()
+    envelope['bytes'] = 0
+    for chunk in response.iter_content(chunk_size or NOTION_STREAM_CHUNK):
+        items = decoder.feed(chunk)
+        envelope['bytes'] = decoder.bytes
+        yield from items
+    envelope.update(decoder.finish())
+
+
+def _async_engine():
+    # Importación diferida: notion_async importa este módulo
+    import notion_async
+    return notion_async if notion_async.enabled() else None
+
+
+def iter_query_results(token, database_id, payload=None, filter_properties=None, max_pages=None, timeout=None,
+                       label=None, raise_on_error=True, budget=None):
+    """Itera sobre los resultados paginados de una consulta a una base de datos.
+
+    Si Notion responde con un error persistente se lanza `NotionAPIError`
+    para no dar por completo un resultado truncado. Con
+    `raise_on_error=False` se detiene la paginación y se conserva lo
+    obtenido hasta ese momento. Con `budget` (ver `SyncBudget`) la
+    paginación se detiene al superar los bytes permitidos.
+    """
+    engine = _async_engine()
+    if engine is not None:
+        yield from engine.iter_query_results(token, database_id, payload, filter_properties, max_pages, timeout,
+                                             label, budget=budget, raise_on_error=raise_on_error)
+        return
+
+    payload = dict(payload or {})
+    params = [('filter_properties', p) for p in (filter_properties or [])]
+    label = label or database_id
+
+    has_more = True
+    next_cursor = None
+    pages_fetched = 0
+    start = time.perf_counter()
+
+    while has_more and (max_pages is None or pages_fetched < max_pages):
+        if next_cursor:
+            payload["start_cursor"] = next_cursor
+        response = notion_request(token, 'POST', f"/databases/{database_id}/query",
+                                  params=params, json=payload, timeout=timeout, stream=True)
+        try:
+            if not response.ok:
+                logger.error(f"Error API Notion ({label}): {response.status_code} {response.text}")
+                if raise_on_error:
+                    raise NotionAPIError(response.status_code, response.text)
+                break
+
+            envelope = {}
+            counted = 0
+            for page in iter_response_results(response, envelope):
+                if budget is not None and budget.add_bytes(envelope['bytes'] - counted):
+                    logger.warning(f"Consulta Notion {label} detenida: {budget.exceeded}")
+                    return
+                counted = envelope['bytes']
+                yield page
+        finally:
+            response.close()
+
+        if budget is not None:
+            budget.add_bytes(envelope['bytes'] - counted)
+        has_more = envelope.get('has_more', False)
+        next_cursor = envelope.get('next_cursor')
+        pages_fetched += 1
+
+    metrics.NOTION_PAGES.inc(pages_fetched, label=label)
+    logger.info(f"Consulta Notion {label}: {pages_fetched} páginas en {time.perf_counter() - start:.2f}s")
+
+
+def query_database(token, database_id, payload=None, filter_properties=None, max_pages=None, timeout=None,
+                   label=None, raise_on_error=True):
+    """Devuelve la lista completa de resultados de una consulta paginada."""
+    return list(iter_query_results(token, database_id, payload, filter_properties, max_pages, timeout,
+                                   label, raise_on_error))
+
+
+def edited_since_filter(since):
+    """Filtro de Notion para páginas editadas a partir de `since` (ISO 8601)."""
+    return {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}}
+
+
+def _combine_filters(base_filter, *extra_filters):
+    extra = list(extra_filters)
+    if not base_filter:
+        return extra[0] if len(extra) == 1 else {"and": extra}
+    if 'and' in base_filter:
+        return {"and": base_filter['and'] + extra}
+    return {"and": [base_filter] + extra}
+
+
+def date_shard_filters(property_name, start, end=None, count=None, open_span=timedelta(days=60)):
+    """Divide una consulta en rangos disjuntos de la propiedad de fecha `property_name`.
+
+    Devuelve una lista de condiciones (una por fragmento) que cubren desde
+    `start` hasta `end`. Sin `end`, los fragmentos se reparten en
+    `open_span` y el último queda abierto hacia adelante. Cada página cae en
+    un único fragmento porque los límites usan `on_or_after`/`before`.
+    """
+    count = max(1, count or NOTION_SHARDS)
+    last = end or start + open_span
+    step = (last - start) / count
+    bounds = [start + step * i for i in range(count)] + [last]
+
+    shards = []
+    for i in range(count):
+        conditions = [{"property": property_name, "date": {"on_or_after": bounds[i].isoformat()}}]
+        if i < count - 1:
+            conditions.append({"property": property_name, "date": {"before": bounds[i + 1].isoformat()}})
+        elif end is not None:
+            conditions.append({"property": property_name, "date": {"on_or_before": end.isoformat()}})
+        shards.append(conditions)
+    return shards
+
+
+def iter_sharded_query_results(token, database_id, shards, payload=None, filter_properties=None, max_pages=None,
+                               timeout=None, label=None, budget=None):
+    """Pagina varios fragmentos de una consulta en paralelo y entrega las páginas sin duplicados.
+
+    Los cursores de Notion son secuenciales, pero cada fragmento tiene el
+    suyo, así que el tiempo total escala con el número de fragmentos y no
+    con el de páginas. Todas las peticiones siguen pasando por el limitador
+    del token. `max_pages` se aplica a cada fragmento; `budget` se comparte
+    entre todos. La cola entre hilos está acotada para que los fragmentos no
+    acumulen páginas decodificadas más rápido de lo que se consumen.
+
+    Con `SYNC_ENGINE=asyncio` los fragmentos son tareas del bucle compartido
+    (ver notion_async) en lugar de hilos propios.
+    """
+    engine = _async_engine()
+    if engine is not None:
+        yield from engine.iter_query_results(token, database_id, payload, filter_properties, max_pages, timeout,
+                                             label, shards=shards, budget=budget)
+        return
+
+    payload = dict(payload or {})
+    label = label or database_id
+    base_filter = payload.get('filter')
+    queue = Queue(maxsize=NOTION_SHARD_QUEUE)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+
+    def run_shard(index, conditions):
+        shard_payload = dict(payload)
+        shard_payload['filter'] = _combine_filters(base_filter, *conditions)
+        try:
+            for page in iter_query_results(token, database_id, shard_payload, filter_properties, max_pages,
+                                           timeout, f"{label} [{index + 1}/{len(shards)}]", budget=budget):
+                if not put(page):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    seen = set()
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        for index, conditions in enumerate(shards):
+            executor.submit(run_shard, index, conditions)
+
+        try:
+            pending = len(shards)
+            error = None
+            while pending:
+                item = queue.get()
+                if item is done:
+                    pending -= 1
+                elif isinstance(item, Exception):
+                    error = error or item
+                elif error is None and item['id'] not in seen:
+                    seen.add(item['id'])
+                    yield item
+            if error is not None:
+                raise error
+        finally:
+            # Si el consumidor se detiene (p. ej. por presupuesto), los fragmentos dejan de paginar
+            stop.set()
+
+
+class IncrementalState:
+    """Estado de la sincronización incremental de una consulta de Notion.
+
+    Guarda los registros extraídos indexados por id de página y la marca de
+    agua (`last_edited_time` más reciente observado) para pedir a Notion
+    solamente las páginas modificadas desde entonces.
+    """
+
+    def __init__(self, full_sync_hours=None):
+        self.records = {}
+        self.high_water = None
+        self.last_full_sync = None
+        self.full_sync_interval = timedelta(hours=full_sync_hours if full_sync_hours is not None else NOTION_FULL_SYNC_HOURS)
+        self.lock = threading.Lock()
+
+    def needs_full_sync(self):
+        if self.high_water is None or self.last_full_sync is None:
+            return True
+        return datetime.now() - self.last_full_sync >= self.full_sync_interval
+
+    def _advance(self, edited_time):
+        if edited_time and (self.high_water is None or edited_time > self.high_water):
+            self.high_water = edited_time
+
+    def values(self):
+        return list(self.records.values())
+
+
+def sync_pages(token, database_id, parse_page, state, payload=None, filter_properties=None, max_pages=None,
+               timeout=None, label=None, force_full=False, shards=None, budget=None):
+    """Sincroniza `state` con Notion y devuelve `(registros, fue_completa)`.
+
+    `parse_page` convierte una página en el registro a guardar, o `None` si
+    la página no debe aparecer en la caché. La sincronización completa
+    reemplaza todos los registros; la incremental consulta únicamente las
+    páginas editadas desde la marca de agua, aplica los cambios y elimina las
+    que ya no cumplen el filtro. Las páginas borradas o archivadas solo se
+    detectan en la reconciliación completa periódica.
+
+    Con `shards` (ver `date_shard_filters`) la sincronización completa
+    pagina los fragmentos en paralelo. Con `budget` (ver `SyncBudget`) la
+    sincronización completa se detiene al agotar registros o bytes.
+    """
+    payload = dict(payload or {})
+    label = label or database_id
+
+    with state.lock:
+        if force_full or state.needs_full_sync():
+            records = {}
+            high_water = None
+            if shards and len(shards) > 1:
+                pages = iter_sharded_query_results(token, database_id, shards, payload, filter_properties,
+                                                   max_pages, timeout, label, budget)
+            else:
+                pages = iter_query_results(token, database_id, payload, filter_properties, max_pages, timeout, label,
+                                           budget=budget)
+            try:
+                for page in pages:
+                    edited = page.get('last_edited_time')
+                    if edited and (high_water is None or edited > high_water):
+                        high_water = edited
+                    record = parse_page(page)
+                    if record is None:
+                        continue
+                    records[page['id']] = record
+                    if budget is not None and budget.add_record():
+                        logger.warning(f"Sincronización {label} detenida: {budget.exceeded}")
+                        break
+            finally:
+                pages.close()
+
+            state.records = records
+            state.high_water = high_water
+            state.last_full_sync = datetime.now()
+            return state.values(), True
+
+        since = state.high_water
+        changed = {}
+        upserts = {}
+
+        delta_payload = dict(payload)
+        delta_payload['filter'] = _combine_filters(payload.get('filter'), edited_since_filter(since))
+        for page in iter_query_results(token, database_id, delta_payload, filter_properties, None, timeout,
+                                       f"{label} (delta)"):
+            changed[page['id']] = page.get('last_edited_time')
+            upserts[page['id']] = parse_page(page)
+
+        # Páginas editadas que ya no cumplen el filtro del dataset: se deben retirar. Sin filtro propio
+        # la consulta delta ya las incluye a todas y repetirla duplicaría las peticiones
+        if payload.get('filter'):
+            for page in iter_query_results(token, database_id, {"filter": edited_since_filter(since)}, ['title'],
+                                           None, timeout, f"{label} (editadas)"):
+                changed[page['id']] = page.get('last_edited_time')
+
+        removed = 0
+        for page_id, edited in changed.items():
+            record = upserts.get(page_id)
+            if record is None:
+                if state.records.pop(page_id, None) is not None:
+                    removed += 1
+            else:
+                state.records[page_id] = record
+            state._advance(edited)
+
+        logger.info(f"Delta Notion {label}: {len(upserts)} actualizadas, {removed} retiradas desde {since}")
+        return state.values(), False
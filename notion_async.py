@@ -0,0 +1,306 @@
+"""Motor asyncio para las consultas paginadas a Notion (`SYNC_ENGINE=asyncio`).
+
+Con el motor de hilos cada consulta fragmentada abre su propio
+`ThreadPoolExecutor` (uno por rango de fechas) y cada hilo se bloquea en
+`requests` esperando a Notion. Con `SYNC_ENGINE=asyncio` todas las
+peticiones de todos los módulos corren como tareas de un único bucle de
+eventos en un hilo dedicado (`notion-async`), con un cliente `aiohttp`
+compartido:
+
+- Los fragmentos y las consultas de distintos módulos se paginan a la vez
+  y todas pasan por el mismo limitador por token que el motor de hilos
+  (`notion_api.get_limiter`), así que el presupuesto de Notion es uno.
+- `sync_pages` y los módulos no cambian: `notion_api.iter_query_results` y
+  `iter_sharded_query_results` delegan aquí y siguen entregando páginas a
+  quien las consume, decodificadas por fragmentos (sin cargar cada
+  respuesta completa) y con una cola acotada.
+- Si quien consume deja de leer (presupuesto agotado, error) la consulta
+  se cancela en el bucle. Cada consulta completa tiene un tiempo máximo
+  (`NOTION_QUERY_TIMEOUT`, por dataset con `NOTION_QUERY_TIMEOUTS`).
+
+`aiohttp` es opcional: si no está instalado se sigue usando el motor de
+hilos.
+"""
+import os
+import time
+import asyncio
+import atexit
+import logging
+import threading
+from queue import Queue, Full
+import notion_api
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp es opcional: sin él se usa el motor de hilos
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+# 'threads' (requests y un hilo por fragmento) o 'asyncio' (este módulo)
+SYNC_ENGINE = os.getenv('SYNC_ENGINE', 'threads')
+# Conexiones simultáneas del cliente asíncrono hacia Notion (todas las consultas)
+NOTION_ASYNC_CONNECTIONS = int(os.getenv('NOTION_ASYNC_CONNECTIONS', '16'))
+# Segundos máximos de una consulta completa (todas sus páginas y fragmentos)
+NOTION_QUERY_TIMEOUT = float(os.getenv('NOTION_QUERY_TIMEOUT', '900'))
+# Por dataset: "Partidas=600,Planeación=300" (nombre de la consulta, ver `label` en los módulos)
+NOTION_QUERY_TIMEOUTS = {
+    name.strip(): float(value)
+    for name, _, value in (item.partition('=') for item in os.getenv('NOTION_QUERY_TIMEOUTS', '').split(','))
+    if value
+}
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_DONE = object()
+_warned = False
+
+
+def enabled():
+    global _warned
+    if SYNC_ENGINE != 'asyncio':
+        return False
+    if aiohttp is None:
+        if not _warned:
+            _warned = True
+            logger.warning("SYNC_ENGINE=asyncio requiere aiohttp; se usa el motor de hilos")
+        return False
+    return True
+
+
+def query_timeout(label):
+    # "Planeación (delta)" y "Planeación [1/4]" usan el límite de "Planeación"
+    name = label.split(' (')[0].split(' [')[0]
+    return NOTION_QUERY_TIMEOUTS.get(name, NOTION_QUERY_TIMEOUT)
+
+
+class Engine:
+    """Bucle de eventos compartido con un cliente HTTP para todas las consultas del proceso."""
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='notion-async', daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+                logger.info("Motor asyncio de Notion iniciado")
+
+    def close(self):
+        """Cierra el cliente HTTP y detiene el bucle (al salir del proceso)."""
+        with self._lock:
+            if self.loop is None:
+                return
+            if self.session is not None:
+                try:
+                    asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result(timeout=5)
+                except Exception as e:
+                    logger.warning(f"No se pudo cerrar el cliente de Notion: {e}")
+                self.session = None
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+            self.loop = self.thread = None
+
+    def submit(self, coro):
+        """Programa `coro` en el bucle compartido; devuelve un `concurrent.futures.Future`."""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _client(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=NOTION_ASYNC_CONNECTIONS)
+            self.session = aiohttp.ClientSession(connector=connector, headers={
+                "Notion-Version": notion_api.NOTION_VERSION,
+                "Content-Type": "application/json"
+            })
+        return self.session
+
+    async def request(self, token, method, path, params=None, payload=None, timeout=None, read=None):
+        """Petición a Notion con el limitador del token; devuelve `(status, resultado)`.
+
+        Igual que `notion_api.notion_request`: los 429 esperan `Retry-After`
+        pausando a todos los consumidores del token, y los 5xx o errores de
+        conexión se reintentan con espera exponencial. Con `read`, una
+        respuesta correcta se entrega sin leer a `await read(response)` (y
+        `resultado` es lo que devuelva); si no, `resultado` es el cuerpo.
+        Los errores al leer el cuerpo no se reintentan: `read` pudo haber
+        entregado ya parte de los resultados.
+        """
+        limiter = notion_api.get_limiter(token)
+        headers = {"Authorization": f"Bearer {token}"}
+        client_timeout = aiohttp.ClientTimeout(total=timeout or notion_api.NOTION_TIMEOUT)
+        throttled = 0
+        failures = 0
+        while True:
+            await limiter.acquire_async()
+            start = time.perf_counter()
+            try:
+                response = await self._client().request(method, f"{notion_api.NOTION_API_URL}{path}", params=params,
+                                                        json=payload, headers=headers, timeout=client_timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                failures += 1
+                if failures > notion_api.NOTION_MAX_RETRIES:
+                    raise
+                logger.warning(f"Error de conexión con Notion en {path} ({e}); reintento {failures}")
+                await asyncio.sleep(notion_api.NOTION_BACKOFF * 2 ** (failures - 1))
+                continue
+            status = response.status
+            notion_api._record(method, path, time.perf_counter() - start, status)
+
+            try:
+                if status == 429 and throttled < notion_api.NOTION_MAX_429_RETRIES:
+                    throttled += 1
+                    retry_wait = notion_api._retry_after(response, throttled)
+                    notion_api._record_throttled()
+                    logger.warning(f"Notion devolvió 429; reintentando {path} en {retry_wait:.1f}s "
+                                   f"(intento {throttled})")
+                elif status in RETRY_STATUSES and failures < notion_api.NOTION_MAX_RETRIES:
+                    failures += 1
+                    retry_wait = None
+                elif status < 400 and read is not None:
+                    return status, await read(response)
+                else:
+                    return status, await response.read()
+                # Cuerpo corto del 429/5xx: leerlo deja la conexión disponible para el reintento
+                await response.read()
+            finally:
+                response.release()
+
+            if retry_wait is not None:
+                await asyncio.to_thread(limiter.pause, retry_wait)
+            else:
+                await asyncio.sleep(notion_api.NOTION_BACKOFF * 2 ** (failures - 1))
+
+    async def paginate(self, token, database_id, payload, filter_properties, max_pages, timeout, label, budget,
+                       emit):
+        """Recorre las páginas de una consulta y entrega los resultados por lotes con `await emit(lote)`.
+
+        El cuerpo se decodifica por fragmentos con `notion_api.ResultsDecoder`,
+        como en el motor de hilos: nunca se carga una respuesta completa, y
+        `budget` (ver `SyncBudget`) cuenta los bytes de cada fragmento antes
+        de decodificarlo y detiene la consulta al superar el límite.
+        """
+        payload = dict(payload or {})
+        params = [('filter_properties', p) for p in (filter_properties or [])]
+        next_cursor = None
+        pages_fetched = 0
+        start = time.perf_counter()
+
+        async def read(response):
+            decoder = notion_api.ResultsDecoder()
+            async for chunk in response.content.iter_chunked(notion_api.NOTION_STREAM_CHUNK):
+                if budget is not None and budget.add_bytes(len(chunk)):
+                    return None
+                items = decoder.feed(chunk)
+                if items:
+                    await emit(items)
+            return decoder.finish()
+
+        while max_pages is None or pages_fetched < max_pages:
+            if next_cursor:
+                payload["start_cursor"] = next_cursor
+            status, envelope = await self.request(token, 'POST', f"/databases/{database_id}/query", params,
+                                                  payload, timeout, read=read)
+            if status >= 400:
+                text = envelope.decode('utf-8', 'replace')
+                logger.error(f"Error API Notion ({label}): {status} {text}")
+                raise notion_api.NotionAPIError(status, text)
+            if envelope is None:
+                logger.warning(f"Consulta Notion {label} detenida: {budget.exceeded}")
+                break
+            pages_fetched += 1
+            if not envelope.get('has_more'):
+                break
+            next_cursor = envelope.get('next_cursor')
+
+        notion_api.metrics.NOTION_PAGES.inc(pages_fetched, label=label)
+        logger.info(f"Consulta Notion {label}: {pages_fetched} páginas en {time.perf_counter() - start:.2f}s")
+
+    async def query(self, token, database_id, shards, payload, filter_properties, max_pages, timeout, label,
+                    budget, emit):
+        """Pagina todos los fragmentos a la vez; el primer error cancela a los demás."""
+        base_filter = (payload or {}).get('filter')
+        async with asyncio.timeout(query_timeout(label)):
+            if not shards:
+                await self.paginate(token, database_id, payload, filter_properties, max_pages, timeout, label,
+                                    budget, emit)
+                return
+            try:
+                async with asyncio.TaskGroup() as group:
+                    for index, conditions in enumerate(shards):
+                        shard_payload = dict(payload or {})
+                        shard_payload['filter'] = notion_api._combine_filters(base_filter, *conditions)
+                        group.create_task(self.paginate(token, database_id, shard_payload, filter_properties,
+                                                        max_pages, timeout, f"{label} [{index + 1}/{len(shards)}]",
+                                                        budget, emit))
+            except ExceptionGroup as group_error:
+                raise group_error.exceptions[0]
+
+
+ENGINE = Engine()
+
+
+def iter_query_results(token, database_id, payload=None, filter_properties=None, max_pages=None, timeout=None,
+                       label=None, shards=None, budget=None, raise_on_error=True):
+    """Páginas de una consulta (o de sus `shards` en paralelo) obtenidas en el bucle compartido.
+
+    Se entregan en el hilo que llama, sin duplicados entre fragmentos. Si el
+    generador se cierra antes de terminar, la consulta se cancela.
+    """
+    label = label or database_id
+    # Los lotes son los resultados completos de un fragmento del cuerpo (unas decenas de páginas)
+    queue = Queue(maxsize=max(2, notion_api.NOTION_SHARD_QUEUE // 20))
+    stop = threading.Event()
+
+    async def emit(batch):
+        # La cola es del hilo consumidor: se espera sin bloquear el bucle
+        while not stop.is_set():
+            try:
+                queue.put_nowait(batch)
+                return
+            except Full:
+                await asyncio.sleep(0.02)
+        raise asyncio.CancelledError()
+
+    async def produce():
+        try:
+            await ENGINE.query(token, database_id, shards, payload, filter_properties, max_pages, timeout, label,
+                               budget, emit)
+            result = _DONE
+        except TimeoutError:
+            result = TimeoutError(f"La consulta Notion {label} superó {query_timeout(label):g}s")
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            result = e
+        while not stop.is_set():
+            try:
+                queue.put_nowait(result)
+                return
+            except Full:
+                await asyncio.sleep(0.02)
+
+    future = ENGINE.submit(produce())
+    seen = set()
+    try:
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                if raise_on_error or not isinstance(item, notion_api.NotionAPIError):
+                    raise item
+                return
+            for page in item:
+                if page['id'] not in seen:
+                    seen.add(page['id'])
+                    yield page
+    finally:
+        stop.set()
+        future.cancel()
@@ -0,0 +1,297 @@
+"""Extracción de propiedades de Notion guiada por el esquema de cada base de datos.
+
+Cada módulo declara qué propiedades necesita con un `DatasetSpec`
+(campo de salida -> `Field(propiedad, tipo, valor por defecto)`). La
+primera vez que se sincroniza una base de datos se consulta su esquema
+(`GET /databases/{id}`) y la especificación se compila en una función extractora:
+los nombres de propiedad se resuelven una sola vez (sin distinguir
+mayúsculas, o hacia la propiedad de título con `TITLE`) y cada campo queda
+asociado directamente a la función que lee su tipo, sin recorrer todas las
+propiedades ni decidir el tipo en cada página.
+
+El esquema se guarda en memoria y se vuelve a validar cada
+`NOTION_SCHEMA_TTL` segundos; si cambió (propiedad renombrada o de otro
+tipo) el extractor se recompila.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import unquote
+from collections import namedtuple
+import notion_api
+
+logger = logging.getLogger(__name__)
+
+NOTION_SCHEMA_TTL = float(os.getenv('NOTION_SCHEMA_TTL', '3600'))
+
+# Nombre especial que se resuelve a la propiedad de tipo título de la base de datos
+TITLE = '@title'
+
+# `property` puede ser un nombre o una lista de candidatos (se usa el primero que exista).
+# `kind` es el tipo de Notion a leer ('formula_string': solo fórmulas de texto), o 'text' para decidirlo
+# según el esquema entre los tipos de `TEXT_READERS`.
+Field = namedtuple('Field', ['property', 'kind', 'default'], defaults=['text', None])
+
+
+def _plain_text(bits):
+    if bits:
+        return bits[0].get('plain_text') or None
+    return None
+
+
+def _read_title(prop):
+    return _plain_text(prop.get('title'))
+
+
+def _read_rich_text(prop):
+    return _plain_text(prop.get('rich_text'))
+
+
+def _read_select(prop):
+    option = prop.get('select')
+    return option.get('name') or None if option else None
+
+
+def _read_status(prop):
+    option = prop.get('status')
+    return option.get('name') or None if option else None
+
+
+def _read_multi_select(prop):
+    return [option.get('name') for option in prop.get('multi_select') or []]
+
+
+def _read_date(prop):
+    date = prop.get('date')
+    return date.get('start') if date else None
+
+
+def _read_date_end(prop):
+    date = prop.get('date')
+    return date.get('end') if date else None
+
+
+def _read_formula(prop):
+    formula = prop.get('formula') or {}
+    value = formula.get(formula.get('type'))
+    if isinstance(value, dict):  # Fórmulas de tipo fecha
+        return value.get('start')
+    return value
+
+
+def _read_formula_string(prop):
+    # Solo fórmulas de texto: un número, booleano o fecha se trata como ausente (se usa el valor por omisión)
+    formula = prop.get('formula') or {}
+    return formula.get('string') or None if formula.get('type') == 'string' else None
+
+
+def _read_relation(prop):
+    relations = prop.get('relation')
+    return relations[0].get('id') or None if relations else None
+
+
+def _read_rollup(prop):
+    rollup = prop.get('rollup') or {}
+    if rollup.get('type') != 'array':
+        return _read_formula({'formula': rollup})
+    items = rollup.get('array')
+    if not items:
+        return None
+    # Usualmente el primer elemento tiene el texto
+    reader = READERS.get(items[0].get('type'))
+    return reader(items[0]) if reader else None
+
+
+def _read_files(prop):
+    files = prop.get('files')
+    if not files:
+        return None
+    first_file = files[0]
+    return (first_file.get(first_file.get('type')) or {}).get('url') or None
+
+
+def _read_value(prop):
+    return prop.get(prop.get('type'))
+
+
+READERS = {
+    'title': _read_title,
+    'rich_text': _read_rich_text,
+    'select': _read_select,
+    'status': _read_status,
+    'multi_select': _read_multi_select,
+    'date': _read_date,
+    'date_end': _read_date_end,
+    'formula': _read_formula,
+    'formula_string': _read_formula_string,
+    'relation': _read_relation,
+    'rollup': _read_rollup,
+    'files': _read_files,
+    'number': _read_value,
+    'checkbox': _read_value,
+    'url': _read_value,
+    'email': _read_value,
+    'phone_number': _read_value,
+    'created_time': _read_value,
+    'last_edited_time': _read_value,
+    'unique_id': lambda prop: (prop.get('unique_id') or {}).get('number')
+}
+
+
+# Tipos que se leen como texto con kind='text'; cualquier otro tipo se trata como ausente
+TEXT_READERS = {
+    'title': _read_title,
+    'rich_text': _read_rich_text,
+    'select': _read_select,
+    'formula': _read_formula_string
+}
+
+
+def _read_any_text(prop):
+    """Lector sin esquema: decide el tipo en cada página (solo como respaldo)."""
+    reader = TEXT_READERS.get(prop.get('type'))
+    return reader(prop) if reader else None
+
+
+# Esquemas por base de datos: database_id -> (Schema, momento de la consulta)
+_SCHEMAS = {}
+_schemas_lock = threading.Lock()
+
+
+class Schema:
+    """Propiedades de una base de datos: nombre -> (id, tipo)."""
+
+    def __init__(self, properties):
+        self.properties = {name: (prop.get('id'), prop.get('type')) for name, prop in properties.items()}
+        self.by_casefold = {name.casefold(): name for name in self.properties}
+        self.title = next((name for name, (_, kind) in self.properties.items() if kind == 'title'), None)
+        signature = '|'.join(f"{name}:{pid}:{kind}" for name, (pid, kind) in sorted(self.properties.items()))
+        self.signature = hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
+    def resolve(self, candidates):
+        """Nombre real de la primera propiedad candidata que exista en el esquema."""
+        for candidate in candidates:
+            if candidate == TITLE:
+                if self.title:
+                    return self.title
+            elif candidate in self.properties:
+                return candidate
+            elif candidate.casefold() in self.by_casefold:
+                return self.by_casefold[candidate.casefold()]
+        return None
+
+
+def fetch_schema(token, database_id):
+    """Consulta el esquema de una base de datos en Notion."""
+    response = notion_api.notion_request(token, 'GET', f"/databases/{database_id}")
+    if not response.ok:
+        raise notion_api.NotionAPIError(response.status_code, response.text)
+    return Schema(response.json().get('properties', {}))
+
+
+def get_schema(token, database_id, refresh=False):
+    """Esquema en caché de `database_id`; se vuelve a consultar al vencer `NOTION_SCHEMA_TTL`."""
+    entry = _SCHEMAS.get(database_id)
+    if entry and not refresh and time.monotonic() - entry[1] < NOTION_SCHEMA_TTL:
+        return entry[0]
+    schema = fetch_schema(token, database_id)
+    with _schemas_lock:
+        _SCHEMAS[database_id] = (schema, time.monotonic())
+    return schema
+
+
+def invalidate_schema(database_id):
+    with _schemas_lock:
+        _SCHEMAS.pop(database_id, None)
+
+
+def _build_extractor(plan, filter_properties=None, signature=None):
+    """Función extractora de un plan `(salida, propiedad, lector, valor por omisión)`: `extract(page) -> dict`.
+
+    La función lleva como atributos el `plan`, los ids para
+    `filter_properties` (Notion solo devuelve esas propiedades; None sin
+    esquema) y la `signature` del esquema con el que se compiló.
+    """
+    def extract(page):
+        properties = page.get('properties') or {}
+        record = {}
+        for output, name, reader, default in plan:
+            prop = properties.get(name) if name is not None else None
+            value = reader(prop) if prop else None
+            record[output] = default if value is None else value
+        return record
+
+    extract.plan = plan
+    extract.filter_properties = filter_properties
+    extract.signature = signature
+    return extract
+
+
+class DatasetSpec:
+    """Declaración de los campos que un módulo extrae de una base de datos de Notion."""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self._compiled = {}
+        self.lock = threading.Lock()
+
+    def _candidates(self, field):
+        return [field.property] if isinstance(field.property, str) else list(field.property)
+
+    def compile(self, schema=None):
+        """Compila la especificación contra `schema` (o sin esquema, con lectura dinámica)."""
+        plan = []
+        filter_properties = []
+        for output, field in self.fields.items():
+            candidates = self._candidates(field)
+            if schema is None:
+                name = next((c for c in candidates if c != TITLE), None)
+                reader = _read_any_text if field.kind == 'text' else READERS[field.kind]
+            else:
+                name = schema.resolve(candidates)
+                if name is None:
+                    logger.warning(f"Extractor {self.name}: no existe la propiedad {candidates[0]!r} en el esquema")
+                    plan.append((output, None, None, field.default))
+                    continue
+                prop_id, prop_type = schema.properties[name]
+                if field.kind == 'text':
+                    reader = TEXT_READERS.get(prop_type)
+                    if reader is None:
+                        logger.warning(f"Extractor {self.name}: {name!r} es de tipo {prop_type}, "
+                                       f"no se puede leer como texto")
+                        plan.append((output, None, None, field.default))
+                        continue
+                else:
+                    expected = {'date_end': 'date', 'formula_string': 'formula'}.get(field.kind, field.kind)
+                    if expected != prop_type:
+                        logger.warning(f"Extractor {self.name}: {name!r} es de tipo {prop_type}, "
+                                       f"se esperaba {field.kind}")
+                    reader = READERS[field.kind]
+                # Los ids vienen codificados para URL; requests los vuelve a codificar
+                if prop_id and unquote(prop_id) not in filter_properties:
+                    filter_properties.append(unquote(prop_id))
+            plan.append((output, name, reader, field.default))
+        return _build_extractor(tuple(plan), filter_properties if schema else None,
+                                schema.signature if schema else None)
+
+    def extractor(self, token, database_id):
+        """Extractor compilado para `database_id`, recompilado si su esquema cambió."""
+        compiled = self._compiled.get(database_id)
+        try:
+            schema = get_schema(token, database_id)
+        except Exception as e:
+            logger.warning(f"No se pudo consultar el esquema de {self.name}: {e}")
+            return compiled or self.compile()
+
+        if compiled is None or compiled.signature != schema.signature:
+            with self.lock:
+                compiled = self._compiled.get(database_id)
+                if compiled is None or compiled.signature != schema.signature:
+                    if compiled is not None:
+                        logger.info(f"El esquema de {self.name} cambió; recompilando extractor")
+                    compiled = self.compile(schema)
+                    self._compiled[database_id] = compiled
+        return compiled
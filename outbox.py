@@ -0,0 +1,218 @@
+"""Bandeja de salida durable para los envíos a los webhooks de n8n.
+
+Los formularios (Logística, Ventas y Diseño) ya no esperan a n8n: el envío
+se guarda en SQLite, se responde de inmediato con un id de seguimiento y
+unos hilos en segundo plano lo entregan con conexiones reutilizadas y
+reintentos con espera exponencial. Si el proceso se reinicia, los envíos
+pendientes se retoman al arrancar.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', os.path.join(BASE_DIR, 'instance', 'outbox.sqlite3'))
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '2'))
+OUTBOX_TIMEOUT = float(os.getenv('OUTBOX_TIMEOUT', '15'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', '5'))
+OUTBOX_BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', '3600'))
+# Un envío en 'delivering' más tiempo que esto se considera abandonado (proceso caído)
+OUTBOX_STALE_SECONDS = float(os.getenv('OUTBOX_STALE_SECONDS', '300'))
+
+PENDING = 'pending'
+DELIVERING = 'delivering'
+DELIVERED = 'delivered'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_by TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    response_status INTEGER,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+_wakeup = threading.Event()
+_session = None
+_session_lock = threading.Lock()
+
+
+def _connect():
+    directory = os.path.dirname(OUTBOX_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(OUTBOX_PATH, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _get_session():
+    """Sesión compartida con pool keep-alive hacia n8n."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(OUTBOX_WORKERS, 4))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def enqueue(kind, url, payload, created_by=None):
+    """Guarda un envío en la bandeja y devuelve su id de seguimiento."""
+    outbox_id = uuid.uuid4().hex
+    now = datetime.now().isoformat()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO outbox (id, kind, url, payload, created_by, status, attempts, next_attempt_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)",
+            (outbox_id, kind, url, json.dumps(payload, ensure_ascii=False), created_by, PENDING, time.time(), now, now)
+        )
+    finally:
+        conn.close()
+    logger.info(f"Envío {kind} encolado en la bandeja de salida ({outbox_id})")
+    _wakeup.set()
+    return outbox_id
+
+
+def get_status(outbox_id):
+    """Estado de un envío, o `None` si no existe."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT id, kind, created_by, status, attempts, response_status, last_error, created_at, updated_at "
+            "FROM outbox WHERE id = ?", (outbox_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+def _claim_next():
+    """Toma de forma atómica el siguiente envío vencido (seguro entre procesos)."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        row = conn.execute(
+            "SELECT * FROM outbox WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT 1",
+            (PENDING, now)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE outbox SET status = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+            (DELIVERING, now + OUTBOX_STALE_SECONDS, datetime.now().isoformat(), row['id'])
+        )
+        conn.execute("COMMIT")
+        return dict(row)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _finish(outbox_id, status, attempts, response_status=None, error=None, next_attempt_at=None):
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE outbox SET status = ?, attempts = ?, response_status = ?, last_error = ?, "
+            "next_attempt_at = COALESCE(?, next_attempt_at), updated_at = ? WHERE id = ?",
+            (status, attempts, response_status, error, next_attempt_at, datetime.now().isoformat(), outbox_id)
+        )
+    finally:
+        conn.close()
+
+
+def _recover_stale():
+    """Devuelve a pendiente los envíos que quedaron a medias por un proceso caído."""
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE outbox SET status = ?, updated_at = ? WHERE status = ? AND next_attempt_at <= ?",
+            (PENDING, datetime.now().isoformat(), DELIVERING, time.time())
+        )
+        if cursor.rowcount:
+            logger.warning(f"{cursor.rowcount} envíos abandonados devueltos a la bandeja de salida")
+    finally:
+        conn.close()
+
+
+def deliver(item):
+    """Intenta entregar un envío y registra el resultado."""
+    attempts = item['attempts'] + 1
+    status_code = None
+    started = time.perf_counter()
+    try:
+        response = _get_session().post(item['url'], data=item['payload'].encode('utf-8'),
+                                       headers={'Content-Type': 'application/json'}, timeout=OUTBOX_TIMEOUT)
+        status_code = response.status_code
+        metrics.WEBHOOK_LATENCY.observe(time.perf_counter() - started, kind=item['kind'])
+        metrics.WEBHOOK_DELIVERIES.inc(kind=item['kind'], status=status_code)
+        if response.ok:
+            logger.info(f"Envío {item['kind']} entregado ({item['id']}, status {status_code})")
+            _finish(item['id'], DELIVERED, attempts, status_code)
+            return True
+        error = f"Status {status_code}: {response.text[:500]}"
+    except Exception as e:
+        error = str(e)
+        metrics.WEBHOOK_LATENCY.observe(time.perf_counter() - started, kind=item['kind'])
+        metrics.WEBHOOK_DELIVERIES.inc(kind=item['kind'], status='error')
+
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        logger.error(f"Envío {item['kind']} descartado tras {attempts} intentos ({item['id']}): {error}")
+        _finish(item['id'], FAILED, attempts, status_code, error)
+    else:
+        delay = min(OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX)
+        logger.warning(f"Envío {item['kind']} falló (intento {attempts}, reintento en {delay:.0f}s): {error}")
+        _finish(item['id'], PENDING, attempts, status_code, error, time.time() + delay)
+    return False
+
+
+def _worker():
+    while True:
+        try:
+            item = _claim_next()
+            if item is not None:
+                deliver(item)
+                continue
+            _recover_stale()
+        except Exception as e:
+            logger.exception(f"Error en la bandeja de salida: {e}")
+        _wakeup.wait(timeout=5)
+        _wakeup.clear()
+
+
+def start_outbox_workers(count=None):
+    """Inicia los hilos que entregan los envíos pendientes."""
+    _recover_stale()
+    for _ in range(count or OUTBOX_WORKERS):
+        threading.Thread(target=_worker, daemon=True).start()
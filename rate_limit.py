@@ -0,0 +1,149 @@
+"""Limitadores de tasa (token bucket) para las llamadas a APIs externas.
+
+`TokenBucket` limita dentro del proceso. `SharedTokenBucket` guarda el
+estado del cubo en SQLite para que todos los procesos de la máquina (workers
+de gunicorn y `sync.py`) compartan el mismo presupuesto.
+"""
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+
+
+class TokenBucket:
+    """Cubo de fichas en memoria, seguro entre hilos."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _reserve(self):
+        """Toma una ficha o devuelve cuántos segundos hay que esperar."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Bloquea hasta obtener una ficha."""
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Como `acquire`, pero sin bloquear el bucle de eventos (ver notion_async)."""
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Detiene a todos los consumidores durante `seconds` (p. ej. tras un 429)."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+class SharedTokenBucket:
+    """Cubo de fichas compartido entre procesos a través de SQLite."""
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL,
+        blocked_until REAL NOT NULL DEFAULT 0
+    )
+    """
+
+    def __init__(self, path, key, rate, burst):
+        self.path = path
+        self.key = key
+        self.rate = float(rate)
+        self.burst = float(burst)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(self._SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _reserve(self):
+        # Se usa el reloj de pared porque el monotónico no es comparable entre procesos
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated, blocked_until FROM buckets WHERE key = ?", (self.key,)).fetchone()
+            tokens, updated, blocked_until = row if row else (self.burst, now, 0.0)
+            if now < blocked_until:
+                wait = blocked_until - now
+            else:
+                tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                updated = now
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 - tokens) / self.rate
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated, blocked_until) VALUES (?, ?, ?, ?)",
+                         (self.key, tokens, updated, blocked_until))
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def acquire(self):
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            # SQLite puede esperar a otro proceso: la reserva se hace fuera del bucle de eventos
+            wait = await asyncio.to_thread(self._reserve)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute("SELECT blocked_until FROM buckets WHERE key = ?", (self.key,)).fetchone()
+            blocked_until = max(row[0] if row else 0.0, now + seconds)
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated, blocked_until) VALUES (?, 0, ?, ?)",
+                         (self.key, now, blocked_until))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
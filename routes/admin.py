@@ -2,6 +2,10 @@ from flask import Blueprint, render_template, session, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from extensions import supabase
 from constants import SYSTEM_MODULES
+import user_cache
+import cache_store
+import scheduler
+import synced_cache
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -49,8 +53,47 @@ def user_update():
             "status": new_status,
             "roles": new_roles
         }).eq('id', target_id).execute()
+        # Que el cambio de estado o roles aplique en la siguiente petición del usuario
+        user_cache.invalidate(target_id)
         flash('Usuario actualizado correctamente.', 'success')
     except Exception as e:
         flash(f'Error al actualizar: {str(e)}', 'error')
         
     return redirect(url_for('admin.users'))
+
+@admin_bp.route('/scheduler')
+@login_required
+def scheduler_status():
+    if not current_user.is_admin:
+        flash('Acceso restringido a Administradores.', 'error')
+        return redirect(url_for('main.dashboard'))
+
+    # Tareas programadas (de este proceso o, en modo externo, las que publicó sync.py)
+    jobs = scheduler.job_states()
+    caches = [dict(cache.stats(), name=name) for name, cache in sorted(synced_cache.CACHES.items())]
+
+    return render_template('admin_scheduler.html',
+                         jobs=jobs,
+                         caches=caches,
+                         external=cache_store.is_external_sync(),
+                         user=current_user,
+                         roles=current_user.roles,
+                         modules=SYSTEM_MODULES)
+
+@admin_bp.route('/scheduler/run/<name>', methods=['POST'])
+@login_required
+def scheduler_run(name):
+    if not current_user.is_admin:
+        flash('No tienes permisos.', 'error')
+        return redirect(url_for('main.dashboard'))
+
+    cache = synced_cache.CACHES.get(name)
+    if cache is None or cache.flight.target is None:
+        flash(f'Caché desconocida: {name}', 'error')
+    elif cache.is_syncing:
+        flash(f'La sincronización de {name} ya está en curso.', 'success')
+    else:
+        cache_store.trigger_sync(name, cache.flight.target)
+        flash(f'Sincronización de {name} solicitada.', 'success')
+
+    return redirect(url_for('admin.scheduler_status'))
@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
 from flask_login import login_user, logout_user, login_required
-from extensions import supabase
+from extensions import supabase, auth_client
 from models import User
+import user_cache
 import re
 import os
 
@@ -13,7 +14,9 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         try:
-            response = supabase.auth.sign_in_with_password({"email": email, "password": password})
+            # Cliente aislado: los inicios de sesión simultáneos no comparten sesión de Supabase
+            with auth_client() as client:
+                response = client.auth.sign_in_with_password({"email": email, "password": password})
             user_id = response.user.id
             
             # Verificar estado en la tabla de perfiles
@@ -33,7 +36,6 @@ def login():
             
             # Validar estado
             if profile_status != 'Aprobado':
-                supabase.auth.sign_out()
                 if profile_status == 'Pendiente':
                     flash('Tu cuenta está pendiente de aprobación por un administrador.', 'error')
                 else:
@@ -43,6 +45,7 @@ def login():
             # Create User object and login
             user = User(id=user_id, email=email, username=username, roles=user_roles)
             login_user(user)
+            user_cache.remember(user)
             
             # Legacy session support (optional but good for modules reading session directly)
             session['roles'] = user_roles
@@ -85,7 +88,8 @@ def register():
                 flash('El nombre de usuario ya está en uso.', 'error')
                 return render_template('register.html') 
                 
-            response = supabase.auth.sign_up({"email": email, "password": password})
+            with auth_client() as client:
+                response = client.auth.sign_up({"email": email, "password": password})
             
             if response.user:
                 # Actualizar perfil con datos extra
@@ -107,8 +111,9 @@ def register():
 
 @auth_bp.route('/logout')
 def logout():
-    supabase.auth.sign_out()
+    # La sesión de Supabase ya se cerró al terminar el inicio de sesión (ver extensions.auth_client)
     logout_user() # Flask-Login logout
+    user_cache.forget()
     session.pop('roles', None)
     return redirect(url_for('main.index'))
 
@@ -122,7 +127,8 @@ def forgot_password():
             reset_path = url_for('auth.reset_password')
             redirect_url = f"{site_url}{reset_path}"
             
-            supabase.auth.reset_password_for_email(email, {"redirect_to": redirect_url})
+            with auth_client() as client:
+                client.auth.reset_password_for_email(email, {"redirect_to": redirect_url})
             flash('Si el correo está registrado, recibirás un enlace para restablecer tu contraseña.', 'success')
             return redirect(url_for('auth.login'))
         except Exception as e:
@@ -149,17 +155,18 @@ def reset_password():
             access_token = request.args.get('access_token') or request.form.get('access_token')
             refresh_token = request.args.get('refresh_token') or request.form.get('refresh_token')
             
-            if access_token and refresh_token:
-                supabase.auth.set_session(access_token, refresh_token)
-            else:
-                try:
-                    supabase.auth.verify_otp({"token_hash": form_code, "type": "recovery"})
-                except Exception:
-                    # Last resort: exchange_code
-                    supabase.auth.exchange_code_for_session({"auth_code": form_code})
-            
-            # 2. Update the password
-            supabase.auth.update_user({"password": new_password})
+            with auth_client() as client:
+                if access_token and refresh_token:
+                    client.auth.set_session(access_token, refresh_token)
+                else:
+                    try:
+                        client.auth.verify_otp({"token_hash": form_code, "type": "recovery"})
+                    except Exception:
+                        # Last resort: exchange_code
+                        client.auth.exchange_code_for_session({"auth_code": form_code})
+
+                # 2. Update the password
+                client.auth.update_user({"password": new_password})
             
             flash('Contraseña actualizada exitosamente. Ya puedes iniciar sesión.', 'success')
             return redirect(url_for('auth.login'))
@@ -1,12 +1,14 @@
 from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 import os
-import requests
-import threading
-import time
 import logging
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+import cache_store
+import scheduler
+from synced_cache import SingleFlight, SyncedCache
+import http_cache
+import outbox
 
 logistics_bp = Blueprint('logistics', __name__, url_prefix='/dashboard/logistica')
 
@@ -43,31 +45,46 @@ def capture_materials():
                          roles=current_roles, 
                          tools=LOGISTICS_TOOLS)
 
-# Caché en memoria para evitar consultas excesivas a Notion
-PARTIDAS_CACHE = {
-    'data': [],
-    'timestamp': None,
-    'is_syncing': False
-}
+# Caché en memoria para evitar consultas excesivas a Notion; Partidas y Materiales se sincronizan juntas
+LOGISTICS_SYNC = SingleFlight('logistica')
+# Vencen tras dos ciclos de sincronización (3 horas) sin publicar
+PARTIDAS_CACHE = SyncedCache('partidas', LOGISTICS_SYNC, ttl=6 * 3600)
+MATERIALES_CACHE = SyncedCache('materiales', LOGISTICS_SYNC, ttl=6 * 3600)
 
-MATERIALES_CACHE = {
-    'data': [],
-    'timestamp': None,
-    'is_syncing': False
-}
+# Arranque en caliente: servir la última instantánea mientras llega la primera sincronización
+cache_store.register('partidas', PARTIDAS_CACHE)
+cache_store.register('materiales', MATERIALES_CACHE)
 
 from concurrent.futures import ThreadPoolExecutor
+import notion_api
+
+# Límite de páginas de 100 registros por consulta (en total, aunque se pagine por fragmentos)
+MAX_PAGES = 100
+# Presupuesto de descarga de cada sincronización completa de Partidas (0 = sin límite)
+PARTIDAS_MAX_MB = float(os.getenv('PARTIDAS_MAX_MB', '256'))
+
+# Estado de sincronización incremental (registros por página y marca de agua)
+PARTIDAS_STATE = notion_api.IncrementalState()
+MATERIALES_STATE = notion_api.IncrementalState()
+
+def _first_title(page, property_name):
+    title_prop = page.get('properties', {}).get(property_name, {}).get('title', [])
+    if title_prop:
+        return title_prop[0].get('plain_text', '') or None
+    return None
+
+def parse_partida_page(page):
+    """Extrae el código de pieza de una página de Partidas."""
+    return _first_title(page, '01-CODIGO PIEZA')
+
+def parse_material_page(page):
+    """Extrae el nombre de una página de Materiales."""
+    return _first_title(page, 'MATERIAL')
 
 def fetch_logistics_data_parallel(token, database_id, material_db_id):
     """Función auxiliar para realizar las peticiones a Notion en paralelo."""
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Notion-Version": "2022-06-28",
-        "Content-Type": "application/json"
-    }
 
     def fetch_partidas():
-        url = f"https://api.notion.com/v1/databases/{database_id}/query?filter_properties=title"
         today = datetime.now()
         one_year_ago = (today - timedelta(days=365)).strftime('%Y-%m-%d')
         one_year_ahead = (today + timedelta(days=365)).strftime('%Y-%m-%d')
@@ -84,102 +101,81 @@ def fetch_logistics_data_parallel(token, database_id, material_db_id):
             }
         }
         
-        results_list = []
-        has_more = True
-        next_cursor = None
-        MAX_PAGES = 100
-        pages_fetched = 0
-
-        while has_more and pages_fetched < MAX_PAGES:
-            if next_cursor: payload["start_cursor"] = next_cursor
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            if response.ok:
-                data = response.json()
-                for page in data.get('results', []):
-                    title_prop = page.get('properties', {}).get('01-CODIGO PIEZA', {}).get('title', [])
-                    if title_prop:
-                        text = title_prop[0].get('plain_text', '')
-                        if text: results_list.append(text)
-                has_more = data.get('has_more', False)
-                next_cursor = data.get('next_cursor')
-                pages_fetched += 1
-            else: break
-        return sorted(results_list)
+        # La ventana de dos años se pagina en paralelo por rangos de FECHA DE CREACION
+        shards = notion_api.date_shard_filters("FECHA DE CREACION", (today - timedelta(days=365)).date(),
+                                               (today + timedelta(days=365)).date())
+        # `max_pages` se aplica a cada fragmento: el tope total de MAX_PAGES se reparte entre ellos
+        partidas, _ = notion_api.sync_pages(token, database_id, parse_partida_page, PARTIDAS_STATE, payload,
+                                            filter_properties=['title'], max_pages=max(1, MAX_PAGES // len(shards)),
+                                            label='Partidas',
+                                            shards=shards, budget=notion_api.SyncBudget(max_mb=PARTIDAS_MAX_MB))
+        return sorted(partidas)
 
     def fetch_materiales():
         if not material_db_id: return []
-        url = f"https://api.notion.com/v1/databases/{material_db_id}/query?filter_properties=title"
         payload = {"filter": {"property": "MATERIAL", "title": {"is_not_empty": True}}}
         
-        results_list = []
-        has_more = True
-        next_cursor = None
-        MAX_PAGES = 100
-        pages_fetched = 0
-
-        while has_more and pages_fetched < MAX_PAGES:
-            if next_cursor: payload["start_cursor"] = next_cursor
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            if response.ok:
-                data = response.json()
-                for page in data.get('results', []):
-                    title_prop = page.get('properties', {}).get('MATERIAL', {}).get('title', [])
-                    if title_prop:
-                        text = title_prop[0].get('plain_text', '')
-                        if text: results_list.append(text)
-                has_more = data.get('has_more', False)
-                next_cursor = data.get('next_cursor')
-                pages_fetched += 1
-            else: break
-        return sorted(results_list)
+        materiales, _ = notion_api.sync_pages(token, material_db_id, parse_material_page, MATERIALES_STATE,
+                                              payload, filter_properties=['title'], max_pages=MAX_PAGES,
+                                              label='Materiales')
+        return sorted(materiales)
 
     with ThreadPoolExecutor(max_workers=2) as executor:
         f_partidas = executor.submit(fetch_partidas)
         f_materiales = executor.submit(fetch_materiales)
         return f_partidas.result(), f_materiales.result()
 
+@LOGISTICS_SYNC.job
 def refresh_notion_cache():
     """Función para sincronizar datos de Notion (Partidas y Materiales) en paralelo."""
-    global PARTIDAS_CACHE, MATERIALES_CACHE
-    if PARTIDAS_CACHE['is_syncing'] or MATERIALES_CACHE['is_syncing']:
+    load_dotenv()
+    token = os.getenv('NOTION_TOKEN_LOGISTICA')
+    database_id = os.getenv('NOTION_DATABASE_ID_LOGISTICA')
+    material_db_id = os.getenv('NOTION_DATABASE_ID_MATERIAL')
+
+    if not token or not database_id:
         return
-    
-    PARTIDAS_CACHE['is_syncing'] = True
-    MATERIALES_CACHE['is_syncing'] = True
-    try:
-        load_dotenv()
-        token = os.getenv('NOTION_TOKEN_LOGISTICA')
-        database_id = os.getenv('NOTION_DATABASE_ID_LOGISTICA')
-        material_db_id = os.getenv('NOTION_DATABASE_ID_MATERIAL')
-        
-        if not token or not database_id:
-            return
 
-        partidas, materiales = fetch_logistics_data_parallel(token, database_id, material_db_id)
-        
-        now = datetime.now()
-        PARTIDAS_CACHE['data'] = partidas
-        PARTIDAS_CACHE['timestamp'] = now
-        MATERIALES_CACHE['data'] = materiales
-        MATERIALES_CACHE['timestamp'] = now
-        
-        logger.info(f"Sincronización paralela de Logística completada. Partidas: {len(partidas)}, Materiales: {len(materiales)}")
-        
-    except Exception as e:
-        logger.exception(f"ERROR en sincronización de Notion: {str(e)}")
-    finally:
-        PARTIDAS_CACHE['is_syncing'] = False
-        MATERIALES_CACHE['is_syncing'] = False
+    partidas, materiales = fetch_logistics_data_parallel(token, database_id, material_db_id)
+
+    now = datetime.now()
+    cache_store.publish('partidas', PARTIDAS_CACHE, partidas, now)
+    cache_store.publish('materiales', MATERIALES_CACHE, materiales, now)
+
+    logger.info(f"Sincronización paralela de Logística completada. Partidas: {len(partidas)}, Materiales: {len(materiales)}")
 
 def start_background_sync():
-    """Inicia el hilo de sincronización cada 3 horas."""
-    def run_sync():
-        while True:
-            refresh_notion_cache()
-            time.sleep(10800) # 3 horas
-    
-    thread = threading.Thread(target=run_sync, daemon=True)
-    thread.start()
+    """Programa la sincronización cada 3 horas (`SCHEDULE_LOGISTICA`, ver scheduler)."""
+    scheduler.add_job('logistica', refresh_notion_cache, 'interval:10800', run_at_startup=True,
+                      caches=(PARTIDAS_CACHE, MATERIALES_CACHE))
+
+# Respuestas precalculadas al sincronizar (ver http_cache)
+http_cache.register_payload('logistics.partidas', {'partidas': PARTIDAS_CACHE}, lambda is_syncing: {
+    'success': True,
+    'partidas': PARTIDAS_CACHE['data'],
+    'timestamp': http_cache.format_timestamp(PARTIDAS_CACHE['timestamp']),
+    'is_syncing': is_syncing
+})
+
+http_cache.register_payload('logistics.materiales', {'materiales': MATERIALES_CACHE}, lambda is_syncing: {
+    'success': True,
+    'materiales': MATERIALES_CACHE['data'],
+    'timestamp': http_cache.format_timestamp(MATERIALES_CACHE['timestamp']),
+    'is_syncing': is_syncing
+})
+
+http_cache.register_payload('logistics.data', {'partidas': PARTIDAS_CACHE, 'materiales': MATERIALES_CACHE}, lambda is_syncing: {
+    'success': True,
+    'partidas': {
+        'data': PARTIDAS_CACHE['data'],
+        'timestamp': http_cache.format_timestamp(PARTIDAS_CACHE['timestamp'])
+    },
+    'materiales': {
+        'data': MATERIALES_CACHE['data'],
+        'timestamp': http_cache.format_timestamp(MATERIALES_CACHE['timestamp'])
+    },
+    'is_syncing': is_syncing
+})
 
 @logistics_bp.route('/api/partidas', methods=['GET'])
 @login_required
@@ -191,19 +187,13 @@ def get_partidas():
         
         if force_refresh:
             # Iniciar sincronización en segundo plano pero avisar al usuario
-            threading.Thread(target=refresh_notion_cache, daemon=True).start()
+            cache_store.trigger_sync('partidas', refresh_notion_cache)
             return jsonify({
                 'success': True, 
-                'partidas': PARTIDAS_CACHE['data'], 
                 'message': 'Sincronización iniciada en segundo plano...'
             })
 
-        return jsonify({
-            'success': True, 
-            'partidas': PARTIDAS_CACHE['data'], 
-            'timestamp': PARTIDAS_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if PARTIDAS_CACHE['timestamp'] else None,
-            'is_syncing': PARTIDAS_CACHE['is_syncing']
-        })
+        return http_cache.payload_response('logistics.partidas')
             
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -212,14 +202,8 @@ def get_partidas():
 @login_required
 def get_materiales():
     """Sirve la lista de materiales desde la caché sincronizada."""
-    global MATERIALES_CACHE
     try:
-        return jsonify({
-            'success': True, 
-            'materiales': MATERIALES_CACHE['data'], 
-            'timestamp': MATERIALES_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if MATERIALES_CACHE['timestamp'] else None,
-            'is_syncing': MATERIALES_CACHE['is_syncing']
-        })
+        return http_cache.payload_response('logistics.materiales')
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -227,24 +211,12 @@ def get_materiales():
 @login_required
 def get_all_data():
     """Endpoint unificado para obtener todos los datos de logística."""
-    global PARTIDAS_CACHE, MATERIALES_CACHE
-    return jsonify({
-        'success': True,
-        'partidas': {
-            'data': PARTIDAS_CACHE['data'],
-            'timestamp': PARTIDAS_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if PARTIDAS_CACHE['timestamp'] else None
-        },
-        'materiales': {
-            'data': MATERIALES_CACHE['data'],
-            'timestamp': MATERIALES_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if MATERIALES_CACHE['timestamp'] else None
-        },
-        'is_syncing': PARTIDAS_CACHE['is_syncing'] or MATERIALES_CACHE['is_syncing']
-    })
+    return http_cache.payload_response('logistics.data')
 
 @logistics_bp.route('/api/submit', methods=['POST']) 
 @login_required
 def submit_capture():
-    """Recibe datos del formulario de materiales y los reenvía al Webhook de n8n."""
+    """Recibe datos del formulario de materiales y los encola para el Webhook de n8n."""
     try:
         load_dotenv() # Forzar recarga de .env
         data = request.json
@@ -261,15 +233,13 @@ def submit_capture():
             'source': 'AutoIntelli Web App - Logística'
         }
 
-        # Enviar a n8n
-        response = requests.post(webhook_url, json=data, timeout=15)
-        logger.info(f"Webhook response status: {response.status_code}")
-        
-        if response.ok: # Acepta cualquier 2xx
-            return jsonify({'success': True, 'message': 'Materiales registrados exitosamente'})
-        else:
-            logger.error(f"Webhook error body: {response.text}")
-            return jsonify({'success': False, 'message': f'Error en el servidor de destino (Status: {response.status_code}): {response.text[:100]}'}), 500
+        # Encolar para n8n: la entrega (con reintentos) ocurre en segundo plano
+        tracking_id = outbox.enqueue('logistica', webhook_url, data, current_user.email)
+        return jsonify({
+            'success': True,
+            'message': 'Materiales registrados exitosamente',
+            'tracking_id': tracking_id
+        }), 202
             
     except Exception as e:
         import traceback
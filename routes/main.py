@@ -1,9 +1,20 @@
-from flask import Blueprint, render_template, session, redirect, url_for
+from flask import Blueprint, Response, render_template, session, redirect, url_for, request, jsonify
 from flask_login import login_required, current_user
 from constants import get_allowed_modules
+import search_index
+import outbox
+import cache_store
+import events
+import metrics
+import http_cache
 
 main_bp = Blueprint('main', __name__)
 
+@main_bp.app_context_processor
+def inject_events():
+    # Sin eventos en vivo las pantallas no abren EventSource y siguen consultando periódicamente
+    return {'sse_enabled': events.SSE_ENABLED}
+
 @main_bp.route('/')
 def index():
     return render_template('index.html')
@@ -19,3 +30,89 @@ def dashboard():
     allowed_modules = get_allowed_modules(user_roles)
                 
     return render_template('dashboard.html', user=current_user, roles=user_roles, modules=allowed_modules)
+
+@main_bp.route('/api/search')
+@login_required
+def search():
+    """Búsqueda para los selectores (typeahead) sobre los índices construidos al sincronizar."""
+    dataset = request.args.get('dataset', '')
+    if dataset not in search_index.SEARCHABLE_DATASETS:
+        return jsonify({'success': False, 'message': f'Dataset desconocido: {dataset}'}), 400
+
+    query = request.args.get('q', '')
+    prefix = request.args.get('prefix') or None
+    limit = request.args.get('limit', search_index.DEFAULT_LIMIT, type=int)
+
+    return jsonify({
+        'success': True,
+        'dataset': dataset,
+        'results': search_index.search(dataset, query, limit, prefix)
+    })
+
+@main_bp.route('/api/status')
+@login_required
+def cache_status():
+    """Registros y última sincronización de las cachés indicadas en `datasets`, sin sus datos.
+
+    Las pantallas de captura solo necesitan saber si hay datos o si se están
+    sincronizando; las sugerencias de los selectores salen de `/api/search`.
+    """
+    names = [name for name in request.args.get('datasets', '').split(',') if name]
+    unknown = [name for name in names if name not in cache_store.CACHE_REGISTRY]
+    if not names:
+        return jsonify({'success': False, 'message': 'Falta el parámetro datasets'}), 400
+    if unknown:
+        return jsonify({'success': False, 'message': f"Dataset desconocido: {', '.join(unknown)}"}), 400
+    caches = [cache_store.CACHE_REGISTRY[name] for name in names]
+
+    def build():
+        return {
+            'success': True,
+            **{
+                name: {'count': len(cache['data'] or []), 'timestamp': http_cache.format_timestamp(cache['timestamp'])}
+                for name, cache in zip(names, caches)
+            },
+            'is_syncing': any(cache.is_syncing for cache in caches)
+        }
+
+    return http_cache.query_response(caches, build, ','.join(names))
+
+@main_bp.route('/api/outbox/<tracking_id>')
+@login_required
+def outbox_status(tracking_id):
+    """Estado de entrega de un envío a n8n (pending, delivering, delivered o failed)."""
+    item = outbox.get_status(tracking_id)
+    if item is None or (item['created_by'] != current_user.email and not current_user.is_admin):
+        return jsonify({'success': False, 'message': 'Envío no encontrado'}), 404
+    return jsonify({'success': True, **item})
+
+@main_bp.route('/api/events')
+@login_required
+def cache_events():
+    """Flujo SSE con la versión de las cachés indicadas en `datasets` (separadas por comas; todas si se omite)."""
+    if not events.SSE_ENABLED:
+        return jsonify({'success': False, 'message': 'Eventos en vivo deshabilitados (SSE_ENABLED)'}), 404
+    names = [name for name in request.args.get('datasets', '').split(',') if name] or list(cache_store.CACHE_REGISTRY)
+    unknown = [name for name in names if name not in cache_store.CACHE_REGISTRY]
+    if unknown:
+        return jsonify({'success': False, 'message': f"Dataset desconocido: {', '.join(unknown)}"}), 400
+
+    subscriber = events.HUB.subscribe(names)
+    if subscriber is None:
+        # El navegador reintentará; mientras tanto las pantallas siguen consultando como antes
+        return jsonify({'success': False, 'message': 'Demasiadas conexiones de eventos'}), 503
+
+    response = Response(events.stream(subscriber), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Sin búfer en nginx para que cada evento salga de inmediato
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(lambda: events.HUB.unsubscribe(subscriber))
+    return response
+
+@main_bp.route('/metrics')
+def prometheus_metrics():
+    """Métricas del proceso en formato Prometheus (con `METRICS_TOKEN` o, si no está definido, con sesión)."""
+    if not metrics.authorized(request.headers.get('Authorization')):
+        if metrics.METRICS_TOKEN or not current_user.is_authenticated:
+            return Response('No autorizado\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
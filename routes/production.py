@@ -1,12 +1,19 @@
 import os
-import requests
-import threading
-import time
 import logging
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
+import notion_api
+import notion_schema
+from notion_schema import Field
+import cache_store
+import scheduler
+from synced_cache import SingleFlight, SyncedCache
+import http_cache
+from columnar import ColumnarTable
+from table_index import TableIndex, to_millis, DEFAULT_LIMIT
+from timeline import Timeline, DEFAULT_WIDTH
 
 production_bp = Blueprint('production', __name__, url_prefix='/dashboard/produccion')
 
@@ -18,24 +25,87 @@ PRODUCTION_TOOLS = [
     {'name': 'planeacion', 'label': 'Planeación', 'icon': 'ph-calendar-blank', 'route': 'production.planning'}
 ]
 
-# Caché en memoria para Planeación
-PLANEACION_CACHE = {
-    'data': [],
-    'timestamp': None,
-    'is_syncing': False
+# Columnas de la caché de Planeación; el orden es el de las claves en el JSON
+PLANEACION_COLUMNS = {
+    'id': 'text',
+    'n': 'text',
+    'partida': 'text',
+    'nombre_pieza': 'text',
+    'partida_id': 'text',
+    'imagen_url': 'text',
+    'fecha_creacion': 'date',
+    'fecha_planeada': 'date',
+    'fecha_planeada_fin': 'date',
+    'maquina': 'category',
+    'operador': 'category',
+    'area': 'category'
 }
 
-def fetch_notion_planeacion(token, database_id):
-    """Obtiene los registros de planeación de Notion."""
-    url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Notion-Version": "2022-06-28",
-        "Content-Type": "application/json"
+# Estado incremental de Planeación y frecuencia de sincronización (segundos)
+PLANEACION_STATE = notion_api.IncrementalState()
+PLANEACION_SYNC_INTERVAL = int(os.getenv('PLANEACION_SYNC_INTERVAL', '300'))
+
+# Caché en memoria para Planeación (tabla en columnas, ver columnar.py); vence tras dos ciclos sin publicar
+PLANEACION_SYNC = SingleFlight('produccion')
+PLANEACION_CACHE = SyncedCache('planeacion', PLANEACION_SYNC, ttl=2 * PLANEACION_SYNC_INTERVAL,
+                               data=ColumnarTable(PLANEACION_COLUMNS))
+
+# Arranque en caliente desde la última instantánea en disco
+cache_store.register('planeacion', PLANEACION_CACHE, decode=lambda data: ColumnarTable(PLANEACION_COLUMNS, data))
+# Presupuesto de cada sincronización completa (0 = sin límite); antes no había tope de páginas
+PLANEACION_MAX_RECORDS = int(os.getenv('PLANEACION_MAX_RECORDS', '20000'))
+PLANEACION_MAX_MB = float(os.getenv('PLANEACION_MAX_MB', '256'))
+
+# Propiedades de Planeación que consume el frontend (ver notion_schema)
+PLANEACION_SPEC = notion_schema.DatasetSpec('Planeación', {
+    'n': Field('N', 'title', ''),
+    'fecha_creacion': Field('FECHA DE CREACION', 'date'),
+    'fecha_planeada': Field('FECHA PLANEADA', 'date'),
+    'fecha_planeada_fin': Field('FECHA PLANEADA', 'date_end'),
+    'maquina': Field('MAQUINA', 'select', ''),
+    'operador': Field('OPERADOR', 'select', ''),
+    'area': Field('AREA', 'formula_string', ''),
+    'partida_id': Field('PARTIDA', 'relation', ''),
+    'partida_codigo': Field('4Make', 'formula_string', ''),  # Código 85-...
+    'nombre_pieza': Field('NOMBRE PIEZA', 'rollup', ''),
+    'imagen_url': Field('A MOSTRAR', 'files', '')
+})
+
+def parse_planeacion_page(page, extract):
+    """Convierte una página de Planeación en el registro que consume el frontend.
+
+    `extract` es el extractor compilado de `PLANEACION_SPEC`.
+    """
+    values = extract(page)
+    n_value = values['n']
+    if not n_value:
+        return None
+
+    return {
+        'id': page.get('id'),
+        'n': n_value,
+        'partida': values['partida_codigo'] or values['nombre_pieza'] or n_value, # Código 85-... o Nombre
+        'nombre_pieza': values['nombre_pieza'] or n_value,
+        'partida_id': values['partida_id'],
+        'imagen_url': values['imagen_url'],
+        'fecha_creacion': values['fecha_creacion'],
+        'fecha_planeada': values['fecha_planeada'],
+        'fecha_planeada_fin': values['fecha_planeada_fin'],
+        'maquina': values['maquina'],
+        'operador': values['operador'],
+        'area': values['area']
     }
-    
+
+def fetch_notion_planeacion(token, database_id, state=None, full_sync=False):
+    """Obtiene los registros de planeación de Notion.
+
+    Con `state` solo se consultan las páginas editadas desde la última
+    sincronización y se combinan con los registros ya conocidos. Devuelve
+    una `ColumnarTable` con las columnas de `PLANEACION_COLUMNS`.
+    """
     # Filtrar registros de hoy menos 3 días hacia adelante
-    corte = (datetime.now() - timedelta(days=3)).isoformat()
+    inicio = (datetime.now() - timedelta(days=3)).date()
+    corte = inicio.isoformat()
     
     # Payload con filtro y ordenamiento
     payload = {
@@ -53,187 +123,82 @@ def fetch_notion_planeacion(token, database_id):
         ]
     }
     
-    results_list = []
-    has_more = True
-    next_cursor = None
-    
-    try:
-        while has_more:
-            if next_cursor:
-                payload["start_cursor"] = next_cursor
-                
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            if response.ok:
-                data = response.json()
-                for page in data.get('results', []):
-                    props = page.get('properties', {})
-                    
-                    # Extraer "N" (Title)
-                    n_prop = props.get('N', {})
-                    n_value = ""
-                    if n_prop.get('type') == 'title':
-                        title_list = n_prop.get('title', [])
-                        if title_list:
-                            n_value = title_list[0].get('plain_text', '')
-                    
-                    # Extraer "FECHA DE CREACION" (Fecha)
-                    fecha_prop = props.get('FECHA DE CREACION', {})
-                    fecha_value = None
-                    if fecha_prop.get('type') == 'date':
-                        date_obj = fecha_prop.get('date')
-                        if date_obj:
-                            fecha_value = date_obj.get('start')
-
-                    # Extraer "FECHA PLANEADA" (Fecha)
-                    planeada_prop = props.get('FECHA PLANEADA', {})
-                    planeada_start = None
-                    planeada_end = None
-                    if planeada_prop.get('type') == 'date':
-                        date_obj = planeada_prop.get('date')
-                        if date_obj:
-                            planeada_start = date_obj.get('start')
-                            planeada_end = date_obj.get('end')
-                    
-                    # Extraer "MAQUINA" (Select)
-                    maquina_prop = props.get('MAQUINA', {})
-                    maquina_value = ""
-                    if maquina_prop.get('type') == 'select':
-                        select_obj = maquina_prop.get('select')
-                        if select_obj:
-                            maquina_value = select_obj.get('name', '')
-
-                    # Extraer "OPERADOR" (Select)
-                    operador_prop = props.get('OPERADOR', {})
-                    operador_value = ""
-                    if operador_prop.get('type') == 'select':
-                        select_obj = operador_prop.get('select')
-                        if select_obj:
-                            operador_value = select_obj.get('name', '')
-
-                    # Extraer "AREA" (Formula)
-                    area_prop = props.get('AREA', {})
-                    area_value = ""
-                    if area_prop.get('type') == 'formula':
-                        formula_obj = area_prop.get('formula', {})
-                        if formula_obj.get('type') == 'string':
-                            area_value = formula_obj.get('string', '')
-                    
-                    # Extraer "PARTIDA" (Relation) y "NOMBRE PIEZA" (Rollup)
-                    partida_prop = props.get('PARTIDA', {})
-                    partida_id = ""
-                    if partida_prop.get('type') == 'relation':
-                        relations = partida_prop.get('relation', [])
-                        if relations:
-                            partida_id = relations[0].get('id', '')
-
-                    # Extraer "4Make" (Formula con el código 85-...)
-                    make_prop = props.get('4Make', {})
-                    partida_codigo = ""
-                    if make_prop.get('type') == 'formula':
-                        formula_obj = make_prop.get('formula', {})
-                        if formula_obj.get('type') == 'string':
-                            partida_codigo = formula_obj.get('string', '')
-
-                    nombre_pieza_prop = props.get('NOMBRE PIEZA', {})
-                    nombre_pieza_value = ""
-                    if nombre_pieza_prop.get('type') == 'rollup':
-                        rollup_data = nombre_pieza_prop.get('rollup', {})
-                        if rollup_data.get('type') == 'array':
-                            array_data = rollup_data.get('array', [])
-                            if array_data:
-                                # Usualmente el primer elemento tiene el texto
-                                first_item = array_data[0]
-                                if first_item.get('type') == 'title':
-                                    title_list = first_item.get('title', [])
-                                    if title_list:
-                                        nombre_pieza_value = title_list[0].get('plain_text', '')
-                                elif first_item.get('type') == 'rich_text':
-                                    text_list = first_item.get('rich_text', [])
-                                    if text_list:
-                                        nombre_pieza_value = text_list[0].get('plain_text', '')
-
-                    # Extraer "A MOSTRAR" (Files/Media)
-                    imagen_prop = props.get('A MOSTRAR', {})
-                    imagen_url = ""
-                    if imagen_prop.get('type') == 'files':
-                        files_list = imagen_prop.get('files', [])
-                        if files_list:
-                            first_file = files_list[0]
-                            if first_file.get('type') == 'file':
-                                imagen_url = first_file.get('file', {}).get('url', '')
-                            elif first_file.get('type') == 'external':
-                                imagen_url = first_file.get('external', {}).get('url', '')
-
-                    if n_value:
-                        results_list.append({
-                            'id': page.get('id'),
-                            'n': n_value,
-                            'partida': partida_codigo or nombre_pieza_value or n_value, # Código 85-... o Nombre
-                            'nombre_pieza': nombre_pieza_value or n_value,
-                            'partida_id': partida_id,
-                            'imagen_url': imagen_url,
-                            'fecha_creacion': fecha_value,
-                            'fecha_planeada': planeada_start,
-                            'fecha_planeada_fin': planeada_end,
-                            'maquina': maquina_value,
-                            'operador': operador_value,
-                            'area': area_value
-                        })
-                
-                has_more = data.get('has_more', False)
-                next_cursor = data.get('next_cursor')
-            else:
-                logger.error(f"Error API Notion Planeación: {response.text}")
-                break
-    except Exception as e:
-        logger.error(f"Error en fetch_notion_planeacion: {e}")
-        
-    return results_list
+    # Rangos de FECHA PLANEADA paginados en paralelo; el último queda abierto hacia adelante
+    shards = notion_api.date_shard_filters("FECHA PLANEADA", inicio)
 
-def refresh_planeacion_cache(force=False):
-    """Sincroniza la caché de planeación."""
-    global PLANEACION_CACHE
-    if not force and PLANEACION_CACHE['is_syncing']:
-        return
-        
-    PLANEACION_CACHE['is_syncing'] = True
-    try:
-        load_dotenv()
-        token = os.getenv('NOTION_TOKEN_PRODUCCION')
-        db_planeacion = os.getenv('NOTION_DATABASE_ID_PLANEACION')
-        
-        if token and db_planeacion:
-            logger.info("Iniciando sincronización de Planeación de Producción...")
-            data = fetch_notion_planeacion(token, db_planeacion)
-            PLANEACION_CACHE['data'] = data
-            PLANEACION_CACHE['timestamp'] = datetime.now()
-            logger.info(f"Sincronización de Planeación completada ({len(data)} registros)")
-            if data:
-                logger.info(f"DEBUG - Primeros 3 registros: {data[:3]}")
-        else:
-            logger.warning("Faltan credenciales de Producción en el archivo .env")
-            
-    except Exception as e:
-        logger.exception(f"Error en refresh_planeacion_cache: {e}")
-    finally:
-        PLANEACION_CACHE['is_syncing'] = False
+    extract = PLANEACION_SPEC.extractor(token, database_id)
+    state = state or notion_api.IncrementalState()
+    results_list, _ = notion_api.sync_pages(token, database_id, lambda page: parse_planeacion_page(page, extract),
+                                            state, payload, filter_properties=extract.filter_properties,
+                                            label='Planeación', force_full=full_sync, shards=shards,
+                                            budget=notion_api.SyncBudget(PLANEACION_MAX_RECORDS, PLANEACION_MAX_MB))
+    # Mantener el orden por FECHA DE CREACION que antes devolvía Notion
+    results_list.sort(key=lambda r: r['fecha_creacion'] or '')
+    table = ColumnarTable(PLANEACION_COLUMNS, results_list)
+
+    # El estado incremental apunta a las filas de la tabla en lugar de conservar los diccionarios
+    with state.lock:
+        state.records = {row['id']: row for row in table}
+    return table
+
+@PLANEACION_SYNC.job
+def refresh_planeacion_cache(full_sync=False):
+    """Sincroniza la caché de planeación (incremental salvo `full_sync`); nunca dos a la vez."""
+    load_dotenv()
+    token = os.getenv('NOTION_TOKEN_PRODUCCION')
+    db_planeacion = os.getenv('NOTION_DATABASE_ID_PLANEACION')
+
+    if token and db_planeacion:
+        logger.info("Iniciando sincronización de Planeación de Producción...")
+        data = fetch_notion_planeacion(token, db_planeacion, PLANEACION_STATE, full_sync)
+        cache_store.publish('planeacion', PLANEACION_CACHE, data)
+        logger.info(f"Sincronización de Planeación completada ({len(data)} registros)")
+        if data:
+            logger.info(f"DEBUG - Primeros 3 registros: {data[:3]}")
+    else:
+        logger.warning("Faltan credenciales de Producción en el archivo .env")
 
 def start_production_sync():
-    """Inicia el hilo de sincronización en segundo plano."""
-    def run_sync():
-        # Sincronización inicial
-        refresh_planeacion_cache()
-        
-        while True:
-            # Sincronizar cada hora
-            time.sleep(3600)
-            refresh_planeacion_cache()
-            
-    thread = threading.Thread(target=run_sync, daemon=True)
-    thread.start()
+    """Programa la sincronización de Planeación (`SCHEDULE_PRODUCCION`, ver scheduler)."""
+    # Cambios incrementales cada pocos minutos; la reconciliación completa es periódica
+    scheduler.add_job('produccion', refresh_planeacion_cache, f'interval:{PLANEACION_SYNC_INTERVAL}',
+                      run_at_startup=True, caches=(PLANEACION_CACHE,))
+
+# Duración con la que se dibuja una tarea sin fecha de fin (2 horas, como en el Gantt)
+PLANEACION_MIN_DURATION = 2 * 60 * 60 * 1000
+
+# `(versión, índice, segmentos)` de Planeación: índices de consulta (ver table_index) y segmentos del
+# Gantt (ver timeline) junto con la versión de caché con la que se construyeron, reemplazados juntos
+# en cada publicación. La caché cambia de versión antes de que el índice se reconstruya, así que las
+# consultas usan esta versión (y no la de la caché) para su ETag.
+PLANEACION_VIEWS = (None, None, None)
 
-# Iniciar sincronización
-start_production_sync()
+def build_planeacion_index(name, cache):
+    """Reconstruye los índices por máquina, operador, área, ventana de fechas y texto."""
+    global PLANEACION_VIEWS
+    if name != 'planeacion':
+        return
+    snapshot = cache.snapshot()
+    index = TableIndex(snapshot.data,
+                       categories=('maquina', 'operador', 'area'),
+                       start_columns=('fecha_planeada', 'fecha_creacion'),
+                       end_column='fecha_planeada_fin',
+                       text_columns=('partida', 'nombre_pieza', 'n'),
+                       min_duration=PLANEACION_MIN_DURATION)
+    PLANEACION_VIEWS = (snapshot.version, index, Timeline(snapshot.data, index))
+
+cache_store.add_listener(build_planeacion_index)
+build_planeacion_index('planeacion', PLANEACION_CACHE)
+
+# Respuesta precalculada al sincronizar (ver http_cache)
+http_cache.register_payload('production.data', {'planeacion': PLANEACION_CACHE}, lambda is_syncing: {
+    'success': True,
+    'planeacion': {
+        'data': http_cache.RawJSON(PLANEACION_CACHE['data'].to_json()),
+        'timestamp': http_cache.format_timestamp(PLANEACION_CACHE['timestamp'])
+    },
+    'is_syncing': is_syncing
+})
 
 @production_bp.route('/')
 @login_required
@@ -267,15 +232,91 @@ def get_all_data():
     global PLANEACION_CACHE
     
     force_sync = request.args.get('force') == 'true'
-    if force_sync and not PLANEACION_CACHE['is_syncing']:
+    if force_sync and not PLANEACION_CACHE.is_syncing:
         # Iniciar sincronización en hilo para no bloquear la respuesta
-        threading.Thread(target=refresh_planeacion_cache, args=(True,)).start()
+        cache_store.trigger_sync('planeacion', refresh_planeacion_cache, True)
         
-    return jsonify({
-        'success': True,
-        'planeacion': {
-            'data': PLANEACION_CACHE['data'],
-            'timestamp': PLANEACION_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if PLANEACION_CACHE['timestamp'] else None
-        },
-        'is_syncing': PLANEACION_CACHE['is_syncing']
-    })
+    return http_cache.payload_response('production.data')
+
+def planeacion_response(version, build):
+    """Respuesta condicional de una consulta sobre los índices de la versión `version` de Planeación."""
+    response = http_cache.query_response([PLANEACION_CACHE], build, version, request.query_string.decode('utf-8'))
+    # Lo entregado corresponde a la versión del índice, aunque la caché ya tenga otra más nueva
+    response.headers['X-Cache-Versions'] = f"planeacion={version}" if version else ''
+    return response
+
+def planeacion_filters():
+    """Lee de la petición `(filtros, desde, hasta, texto)`; `ValueError` si una fecha es inválida."""
+    start = to_millis(request.args['desde']) if request.args.get('desde') else None
+    end = to_millis(request.args['hasta']) if request.args.get('hasta') else None
+    filters = {name: request.args.getlist(name) for name in ('maquina', 'operador', 'area') if name in request.args}
+    return filters, start, end, request.args.get('q', '')
+
+@production_bp.route('/api/planeacion')
+@login_required
+def query_planeacion():
+    """Consulta de planeación filtrada en el servidor.
+
+    Parámetros: `maquina`, `operador` y `area` (repetibles), `desde`/`hasta`
+    (ventana sobre FECHA PLANEADA, ISO), `q` (texto en partida, nombre de
+    pieza o N), `offset` y `limit`.
+    """
+    if request.args.get('force') == 'true' and not PLANEACION_CACHE.is_syncing:
+        cache_store.trigger_sync('planeacion', refresh_planeacion_cache, True)
+
+    try:
+        filters, start, end, text = planeacion_filters()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+
+    version, index, _ = PLANEACION_VIEWS
+
+    def build():
+        total, rows = index.query(filters, start, end, text, offset, limit)
+        return {
+            'success': True,
+            'data': [row.to_dict() for row in rows],
+            'total': total,
+            'offset': offset,
+            'maquinas': index.facet('maquina'),
+            'timestamp': http_cache.format_timestamp(PLANEACION_CACHE['timestamp']),
+            'is_syncing': PLANEACION_CACHE['is_syncing']
+        }
+
+    return planeacion_response(version, build)
+
+@production_bp.route('/api/planeacion/gantt')
+@login_required
+def planeacion_gantt():
+    """Segmentos del Gantt de la ventana `desde`/`hasta`, agrupados por pieza y listos para Plotly.
+
+    Acepta los mismos filtros que `/api/planeacion` más `ancho` (píxeles del
+    diagrama): con la vista alejada los segmentos diminutos se fusionan.
+    """
+    if request.args.get('force') == 'true' and not PLANEACION_CACHE.is_syncing:
+        cache_store.trigger_sync('planeacion', refresh_planeacion_cache, True)
+
+    try:
+        filters, start, end, text = planeacion_filters()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    width = request.args.get('ancho', DEFAULT_WIDTH, type=int)
+
+    version, _, timeline = PLANEACION_VIEWS
+
+    def build():
+        rows = timeline.index.match(filters, start, end, text)
+        result = timeline.window(rows, start, end, width)
+        result.update({
+            'success': True,
+            'total': len(rows),
+            'maquinas': timeline.lane_order(),
+            'timestamp': http_cache.format_timestamp(PLANEACION_CACHE['timestamp']),
+            'is_syncing': PLANEACION_CACHE['is_syncing']
+        })
+        return result
+
+    return planeacion_response(version, build)
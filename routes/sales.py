@@ -1,260 +1,188 @@
 import os
-import requests
-import threading
-import time
 import logging
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
 from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from constants import get_allowed_modules
+import notion_api
+import notion_schema
+from notion_schema import Field
+import cache_store
+import scheduler
+from synced_cache import SingleFlight, SyncedCache
+import http_cache
+import outbox
 
 sales_bp = Blueprint('sales', __name__, url_prefix='/dashboard/ventas')
 
 # Logger del módulo
 logger = logging.getLogger(__name__)
 
-# Caché en memoria para Ventas
-CLIENTES_CACHE = {'data': [], 'timestamp': None, 'is_syncing': False}
-USUARIOS_CACHE = {'data': [], 'timestamp': None, 'is_syncing': False}
-PUESTOS_CACHE = {'data': [], 'timestamp': None, 'is_syncing': False}
-AREAS_CACHE = {'data': [], 'timestamp': None, 'is_syncing': False}
-
-def fetch_notion_db(token, db_id, property_name):
-    """Auxiliar para consultar cualquier DB de Notion por una propiedad de título."""
+# Caché en memoria para Ventas; los cuatro catálogos se sincronizan juntos
+SALES_SYNC = SingleFlight('ventas')
+# Vencen tras dos ciclos de sincronización (10 minutos) sin publicar
+CLIENTES_CACHE = SyncedCache('clientes', SALES_SYNC, ttl=1200)
+USUARIOS_CACHE = SyncedCache('usuarios', SALES_SYNC, ttl=1200)
+PUESTOS_CACHE = SyncedCache('puestos', SALES_SYNC, ttl=1200)
+AREAS_CACHE = SyncedCache('areas', SALES_SYNC, ttl=1200)
+
+# Cachés de Ventas por nombre de catálogo
+SALES_CACHES = {
+    'clientes': CLIENTES_CACHE,
+    'usuarios': USUARIOS_CACHE,
+    'puestos': PUESTOS_CACHE,
+    'areas': AREAS_CACHE
+}
+
+# Arranque en caliente desde la última instantánea en disco
+for _name, _cache in SALES_CACHES.items():
+    cache_store.register(_name, _cache)
+
+# Estado de sincronización incremental por catálogo
+SALES_SYNC_STATES = {
+    'clientes': notion_api.IncrementalState(),
+    'usuarios': notion_api.IncrementalState(),
+    'puestos': notion_api.IncrementalState(),
+    'areas': notion_api.IncrementalState()
+}
+
+# Extractores por propiedad de catálogo; si la propiedad no existe se usa el título
+SALES_SPECS = {}
+
+def get_catalog_spec(property_name):
+    """Especificación de un catálogo que solo lee la propiedad `property_name`."""
+    spec = SALES_SPECS.get(property_name)
+    if spec is None:
+        spec = SALES_SPECS[property_name] = notion_schema.DatasetSpec(
+            property_name, {'value': Field([property_name, notion_schema.TITLE])})
+    return spec
+
+def fetch_notion_db(token, db_id, property_name, state=None, full_sync=False):
+    """Auxiliar para consultar cualquier DB de Notion por una propiedad de título.
+
+    Con `state` la consulta es incremental: solo se piden las páginas editadas
+    desde la última sincronización, salvo en la reconciliación completa.
+    """
     if not token or not db_id:
         return []
 
-    url = f"https://api.notion.com/v1/databases/{db_id}/query"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Notion-Version": "2022-06-28",
-        "Content-Type": "application/json"
-    }
-    
-    results_list = []
-    has_more = True
-    next_cursor = None
-
-    while has_more:
-        payload = {}
-        if next_cursor:
-            payload["start_cursor"] = next_cursor
-        
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            if response.ok:
-                data = response.json()
-                results = data.get('results', [])
-                for page in results:
-                    props = page.get('properties', {})
-                    # Intentar obtener por nombre exacto
-                    title_prop = props.get(property_name)
-                    
-                    # Si no se encuentra por nombre, buscar la primera propiedad de tipo 'title'
-                    if not title_prop:
-                        for p_name, p_val in props.items():
-                            if p_val.get('type') == 'title':
-                                title_prop = p_val
-                                break
-                    
-                    if not title_prop:
-                        continue
-
-                    content = ""
-                    if title_prop.get('type') == 'title':
-                        bits = title_prop.get('title', [])
-                        if bits: content = bits[0].get('plain_text', '')
-                    elif title_prop.get('type') == 'rich_text':
-                        bits = title_prop.get('rich_text', [])
-                        if bits: content = bits[0].get('plain_text', '')
-                    elif title_prop.get('type') == 'select':
-                        sel = title_prop.get('select')
-                        if sel: content = sel.get('name', '')
-                    elif title_prop.get('type') == 'formula':
-                        formula = title_prop.get('formula', {})
-                        f_type = formula.get('type')
-                        if f_type == 'string':
-                            content = formula.get('string', '')
-                        elif f_type == 'number':
-                            content = str(formula.get('number', ''))
-                    
-                    if content:
-                        results_list.append(content)
-                
-                has_more = data.get('has_more', False)
-                next_cursor = data.get('next_cursor')
-            else:
-                break
-        except Exception as e:
-            logger.error(f"Error fetching Notion DB {db_id}: {e}")
-            break
-            
-    return sorted(list(set(results_list)))
+    extract = get_catalog_spec(property_name).extractor(token, db_id)
+    state = state or notion_api.IncrementalState()
+    values, _ = notion_api.sync_pages(token, db_id, lambda page: extract(page)['value'], state,
+                                      filter_properties=extract.filter_properties, label=property_name,
+                                      force_full=full_sync)
+    return sorted(set(values))
 
 from concurrent.futures import ThreadPoolExecutor
 
 def fetch_notion_db_wrapper(args):
     return fetch_notion_db(*args)
 
-def refresh_sales_cache(force=False):
-    """Sincroniza Clientes, Usuarios, Puestos y Áreas en paralelo."""
-    global CLIENTES_CACHE, USUARIOS_CACHE, PUESTOS_CACHE, AREAS_CACHE
-    
-    # Si ya está sincronizando, no hacer nada a menos que sea forzado
-    if not force and any(c['is_syncing'] for c in [CLIENTES_CACHE, USUARIOS_CACHE, PUESTOS_CACHE, AREAS_CACHE]):
+@SALES_SYNC.job
+def refresh_sales_cache(full_sync=False):
+    """Sincroniza Clientes, Usuarios, Puestos y Áreas en paralelo.
+
+    Por defecto la sincronización es incremental; `full_sync` fuerza la
+    reconciliación completa para detectar registros eliminados. Si ya hay
+    una sincronización en curso la llamada no hace nada (ver `SingleFlight`).
+    """
+    load_dotenv()
+    token = os.getenv('NOTION_TOKEN_VENTAS')
+    db_clientes = os.getenv('NOTION_DATABASE_ID_CLIENTES')
+    db_usuarios = os.getenv('NOTION_DATABASE_ID_USUARIOS')
+    db_cotizaciones = os.getenv('NOTION_DATABASE_ID_COTIZACIONES')
+
+    logger.info(f"Iniciando sincronización paralela de Ventas... (Completa={full_sync})")
+    tasks = []
+    if db_clientes:
+        tasks.append(('clientes', (token, db_clientes, "RAZON SOCIAL", SALES_SYNC_STATES['clientes'], full_sync)))
+    if db_usuarios:
+        tasks.append(('usuarios', (token, db_usuarios, "NOMBRE COMPLETO", SALES_SYNC_STATES['usuarios'], full_sync)))
+    if db_cotizaciones:
+        tasks.append(('puestos', (token, db_cotizaciones, "PUESTO", SALES_SYNC_STATES['puestos'], full_sync)))
+        tasks.append(('areas', (token, db_cotizaciones, "AREA", SALES_SYNC_STATES['areas'], full_sync)))
+    if not tasks:
         return
 
-    # Marcar como sincronizando
-    for cache in [CLIENTES_CACHE, USUARIOS_CACHE, PUESTOS_CACHE, AREAS_CACHE]:
-        cache['is_syncing'] = True
-    
-    try:
-        load_dotenv()
-        token = os.getenv('NOTION_TOKEN_VENTAS')
-        db_clientes = os.getenv('NOTION_DATABASE_ID_CLIENTES')
-        db_usuarios = os.getenv('NOTION_DATABASE_ID_USUARIOS')
-        db_cotizaciones = os.getenv('NOTION_DATABASE_ID_COTIZACIONES')
-        
-        logger.info(f"Iniciando sincronización paralela de Ventas... (Force={force})")
-        tasks = []
-        if db_clientes:
-            tasks.append(('clientes', (token, db_clientes, "RAZON SOCIAL")))
-        if db_usuarios:
-            tasks.append(('usuarios', (token, db_usuarios, "NOMBRE COMPLETO")))
-        if db_cotizaciones:
-            tasks.append(('puestos', (token, db_cotizaciones, "PUESTO")))
-            tasks.append(('areas', (token, db_cotizaciones, "AREA")))
-
-        with ThreadPoolExecutor(max_workers=min(len(tasks), 4)) as executor:
-            future_to_key = {executor.submit(fetch_notion_db_wrapper, args): key for key, args in tasks}
-            for future in future_to_key:
-                key = future_to_key[future]
-                try:
-                    data = future.result()
-                    now = datetime.now()
-                    if key == 'clientes':
-                        CLIENTES_CACHE['data'] = data
-                        CLIENTES_CACHE['timestamp'] = now
-                    elif key == 'usuarios':
-                        USUARIOS_CACHE['data'] = data
-                        USUARIOS_CACHE['timestamp'] = now
-                    elif key == 'puestos':
-                        PUESTOS_CACHE['data'] = data
-                        PUESTOS_CACHE['timestamp'] = now
-                    elif key == 'areas':
-                        AREAS_CACHE['data'] = data
-                        AREAS_CACHE['timestamp'] = now
-                    logger.info(f"{key.capitalize()} sincronizados ({len(data)})")
-                except Exception as e:
-                    logger.error(f"Error sincronizando {key}: {e}")
-                
-    except Exception as e:
-        logger.exception(f"Error en refresh_sales_cache: {e}")
-    finally:
-        for cache in [CLIENTES_CACHE, USUARIOS_CACHE, PUESTOS_CACHE, AREAS_CACHE]:
-            cache['is_syncing'] = False
+    with ThreadPoolExecutor(max_workers=min(len(tasks), 4)) as executor:
+        future_to_key = {executor.submit(fetch_notion_db_wrapper, args): key for key, args in tasks}
+        for future in future_to_key:
+            key = future_to_key[future]
+            try:
+                data = future.result()
+                cache_store.publish(key, SALES_CACHES[key], data)
+                logger.info(f"{key.capitalize()} sincronizados ({len(data)})")
+            except Exception as e:
+                logger.error(f"Error sincronizando {key}: {e}")
 
 def start_sales_sync():
-    """Inicia el hilo de sincronización. Revisa cada 10 min si son las 6 AM."""
-    def run():
-        last_sync_date = None
-        while True:
-            now = datetime.now()
-            # Si son las 6 AM (o pasadas las 6 y no hemos sincronizado hoy)
-            if now.hour == 6 and last_sync_date != now.date():
-                logger.info("Sincronización programada de las 6 AM iniciada.")
-                refresh_sales_cache()
-                last_sync_date = now.date()
-            
-            # También sincronizar al inicio si la caché está vacía
-            if CLIENTES_CACHE['timestamp'] is None:
-                refresh_sales_cache()
-                last_sync_date = now.date()
+    """Programa la sincronización de Ventas (ver scheduler).
 
-            time.sleep(600) # Revisar cada 10 minutos
-    threading.Thread(target=run, daemon=True).start()
+    Cada 10 min aplica los cambios incrementales (`SCHEDULE_VENTAS`) y a las
+    6 AM hace la reconciliación completa del día (`SCHEDULE_VENTAS_COMPLETA`).
+    """
+    # Cambios incrementales (al inicio, con el estado vacío, equivale a una completa)
+    scheduler.add_job('ventas', refresh_sales_cache, 'interval:600', run_at_startup=True,
+                      caches=tuple(SALES_CACHES.values()))
+    scheduler.add_job('ventas_completa', refresh_sales_cache, 'cron:0 6 * * *', kwargs={'full_sync': True})
 
 @sales_bp.route('/api/refresh')
 @login_required
 def refresh_data():
     """Endpoint para forzar la actualización manual."""
     # Ejecutar en hilo para no bloquear la respuesta
-    threading.Thread(target=refresh_sales_cache, args=(True,), daemon=True).start()
+    cache_store.trigger_sync('clientes', refresh_sales_cache, True)
     return jsonify({
         'success': True,
         'message': 'Sincronización iniciada en segundo plano...'
     })
 
+# Respuestas precalculadas al sincronizar (ver http_cache)
+def _catalog_payload(cache):
+    return lambda is_syncing: {
+        'success': True,
+        'data': cache['data'],
+        'timestamp': http_cache.format_timestamp(cache['timestamp']),
+        'is_syncing': is_syncing
+    }
+
+for _name, _cache in SALES_CACHES.items():
+    http_cache.register_payload(f'sales.{_name}', {_name: _cache}, _catalog_payload(_cache))
+
+http_cache.register_payload('sales.data', SALES_CACHES, lambda is_syncing: {
+    'success': True,
+    **{
+        name: {'data': cache['data'], 'timestamp': http_cache.format_timestamp(cache['timestamp'])}
+        for name, cache in SALES_CACHES.items()
+    },
+    'is_syncing': is_syncing
+})
+
 @sales_bp.route('/api/clientes')
 @login_required
 def get_clientes():
-    global CLIENTES_CACHE
-    return jsonify({
-        'success': True,
-        'data': CLIENTES_CACHE['data'],
-        'timestamp': CLIENTES_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if CLIENTES_CACHE['timestamp'] else None,
-        'is_syncing': CLIENTES_CACHE['is_syncing']
-    })
+    return http_cache.payload_response('sales.clientes')
 
 @sales_bp.route('/api/usuarios')
 @login_required
 def get_usuarios():
-    global USUARIOS_CACHE
-    return jsonify({
-        'success': True,
-        'data': USUARIOS_CACHE['data'],
-        'timestamp': USUARIOS_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if USUARIOS_CACHE['timestamp'] else None,
-        'is_syncing': USUARIOS_CACHE['is_syncing']
-    })
+    return http_cache.payload_response('sales.usuarios')
 
 @sales_bp.route('/api/puestos')
 @login_required
 def get_puestos():
-    global PUESTOS_CACHE
-    return jsonify({
-        'success': True,
-        'data': PUESTOS_CACHE['data'],
-        'timestamp': PUESTOS_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if PUESTOS_CACHE['timestamp'] else None,
-        'is_syncing': PUESTOS_CACHE['is_syncing']
-    })
+    return http_cache.payload_response('sales.puestos')
 
 @sales_bp.route('/api/areas')
 @login_required
 def get_areas():
-    global AREAS_CACHE
-    return jsonify({
-        'success': True,
-        'data': AREAS_CACHE['data'],
-        'timestamp': AREAS_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if AREAS_CACHE['timestamp'] else None,
-        'is_syncing': AREAS_CACHE['is_syncing']
-    })
+    return http_cache.payload_response('sales.areas')
 
 @sales_bp.route('/api/data')
 @login_required
 def get_all_data():
     """Endpoint unificado para obtener todos los datos de ventas."""
-    global CLIENTES_CACHE, USUARIOS_CACHE, PUESTOS_CACHE, AREAS_CACHE
-    return jsonify({
-        'success': True,
-        'clientes': {
-            'data': CLIENTES_CACHE['data'],
-            'timestamp': CLIENTES_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if CLIENTES_CACHE['timestamp'] else None
-        },
-        'usuarios': {
-            'data': USUARIOS_CACHE['data'],
-            'timestamp': USUARIOS_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if USUARIOS_CACHE['timestamp'] else None
-        },
-        'puestos': {
-            'data': PUESTOS_CACHE['data'],
-            'timestamp': PUESTOS_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if PUESTOS_CACHE['timestamp'] else None
-        },
-        'areas': {
-            'data': AREAS_CACHE['data'],
-            'timestamp': AREAS_CACHE['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if AREAS_CACHE['timestamp'] else None
-        },
-        'is_syncing': any(c['is_syncing'] for c in [CLIENTES_CACHE, USUARIOS_CACHE, PUESTOS_CACHE, AREAS_CACHE])
-    })
+    return http_cache.payload_response('sales.data')
 
 # Herramientas del Módulo de Ventas
 SALES_TOOLS = [
@@ -288,7 +216,7 @@ def new_quotation():
 
 @sales_bp.route('/api/submit', methods=['POST']) 
 def submit_quotation():
-    """Recibe datos del formulario y los reenvía al Webhook de n8n."""
+    """Recibe datos del formulario y los encola para el Webhook de n8n."""
     if not current_user.is_authenticated: 
         return {'success': False, 'message': 'No autorizado'}, 401
     
@@ -307,14 +235,9 @@ def submit_quotation():
             'source': 'AutoIntelli Web App'
         }
 
-        # Enviar a n8n
-        # Timeout corto para no colgar la UI si n8n tarda
-        response = requests.post(webhook_url, json=data, timeout=10)
-        
-        if response.status_code == 200:
-            return {'success': True, 'message': 'Cotización enviada exitosamente'}
-        else:
-            return {'success': False, 'message': f'Error en n8n: {response.text}'}, 500
+        # Encolar para n8n: la UI no espera a que n8n responda
+        tracking_id = outbox.enqueue('cotizacion', webhook_url, data, current_user.email)
+        return {'success': True, 'message': 'Cotización enviada exitosamente', 'tracking_id': tracking_id}, 202
             
     except Exception as e:
         return {'success': False, 'message': f'Error interno: {str(e)}'}, 500
@@ -0,0 +1,280 @@
+"""Programador central de las sincronizaciones con Notion.
+
+Antes cada módulo tenía su propio hilo con `time.sleep` (Logística cada 3
+horas, Ventas revisando cada 10 minutos si eran las 6 AM, Diseño
+calculando las 7 AM...), y todos sincronizaban a la vez al arrancar. Ahora
+cada módulo registra sus tareas con `add_job` y un solo hilo las dispara:
+
+- Disparadores `interval:<segundos>` o `cron:<min> <hora> <día> <mes> <día semana>`
+  (campos con `*`, listas, rangos y pasos, como en cron). El de cada tarea
+  se puede cambiar sin tocar código con `SCHEDULE_<TAREA>` en el entorno.
+- Variación aleatoria (`SCHEDULER_JITTER` segundos) para que las tareas no
+  coincidan, y arranque escalonado: las tareas iniciales se separan
+  `SCHEDULER_STAGGER` segundos y se omiten si sus cachés restauradas del
+  disco siguen vigentes.
+- Ejecuciones atrasadas (proceso suspendido, reloj ajustado): se ejecutan
+  una sola vez aunque se hayan perdido varias; con `misfire_grace` se
+  omiten si el atraso supera ese margen.
+
+El estado (próxima y última ejecución, duración, resultado) se guarda en el
+almacén compartido para la vista de administración, también cuando las
+tareas corren en `python sync.py`.
+"""
+import os
+import time
+import heapq
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+import cache_store
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_JITTER = float(os.getenv('SCHEDULER_JITTER', '30'))
+SCHEDULER_STAGGER = float(os.getenv('SCHEDULER_STAGGER', '10'))
+# Máximo de segundos que el hilo duerme sin revisar (detecta cambios del reloj)
+MAX_SLEEP = 60
+
+STATE_KEY = 'scheduler'
+
+
+class IntervalTrigger:
+    def __init__(self, seconds):
+        self.seconds = float(seconds)
+
+    def next_after(self, moment):
+        return moment + timedelta(seconds=self.seconds)
+
+    def __str__(self):
+        return f"interval:{self.seconds:g}"
+
+
+def _parse_field(text, low, high):
+    values = set()
+    for part in text.split(','):
+        body, _, step = part.partition('/')
+        if body == '*':
+            start, end = low, high
+        elif '-' in body:
+            start, end = (int(v) for v in body.split('-', 1))
+        else:
+            start = end = int(body)
+        if start < low or end > high or start > end:
+            raise ValueError(f"Valor fuera de rango en '{text}'")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+
+class CronTrigger:
+    """Expresión cron de cinco campos (minuto, hora, día, mes, día de la semana con 0 = domingo)."""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expresión cron inválida: '{expression}'")
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7)}
+        # Como en cron: si se restringen día y día de la semana, basta con que coincida uno
+        self.any_day = fields[2] != '*' and fields[4] != '*'
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        return (day or weekday) if self.any_day else (day and weekday)
+
+    def next_after(self, moment):
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 4)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"La expresión cron '{self.expression}' nunca se cumple")
+
+    def __str__(self):
+        return f"cron:{self.expression}"
+
+
+def parse_trigger(spec):
+    """`interval:<segundos>` o `cron:<expresión>`."""
+    kind, _, value = spec.partition(':')
+    if kind == 'interval':
+        return IntervalTrigger(value)
+    if kind == 'cron':
+        return CronTrigger(value)
+    raise ValueError(f"Disparador desconocido: '{spec}'")
+
+
+class Job:
+    def __init__(self, name, target, trigger, args=(), kwargs=None, run_at_startup=False, caches=(),
+                 jitter=None, misfire_grace=None):
+        self.name = name
+        self.target = target
+        self.trigger = parse_trigger(os.getenv(f'SCHEDULE_{name.upper()}', trigger))
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.run_at_startup = run_at_startup
+        self.caches = caches
+        self.jitter = SCHEDULER_JITTER if jitter is None else jitter
+        self.misfire_grace = misfire_grace
+        self.next_run = None
+        self.last_run = None
+        self.last_duration = None
+        self.last_result = None
+        self.runs = 0
+        self.running = False
+
+    def schedule_after(self, moment):
+        self.next_run = self.trigger.next_after(moment) + timedelta(seconds=random.uniform(0, self.jitter))
+
+    def state(self):
+        stamp = lambda value: value.isoformat(timespec='seconds') if value else None
+        return {
+            'name': self.name,
+            'trigger': str(self.trigger),
+            'next_run': stamp(self.next_run),
+            'last_run': stamp(self.last_run),
+            'last_duration': self.last_duration,
+            'last_result': self.last_result,
+            'runs': self.runs,
+            'running': self.running
+        }
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs = {}
+        self._queue = []
+        self._sequence = 0
+        self._startup_slots = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def add_job(self, name, target, trigger, **options):
+        """Registra una tarea; `trigger` es el valor por omisión de `SCHEDULE_<NAME>`."""
+        job = Job(name, target, trigger, **options)
+        now = datetime.now()
+        with self._condition:
+            # Con cachés restauradas del disco, el calendario sigue desde su última sincronización
+            synced = [cache['timestamp'] for cache in job.caches]
+            if job.caches and all(synced):
+                job.schedule_after(min(synced))
+            else:
+                job.schedule_after(now)
+            startup = job.run_at_startup and (not job.caches or any(cache.is_stale() for cache in job.caches))
+            if startup or job.next_run < now:
+                job.next_run = now + timedelta(seconds=SCHEDULER_STAGGER * self._startup_slots)
+                self._startup_slots += 1
+            self.jobs[name] = job
+            self._push(job)
+            self._condition.notify()
+        return job
+
+    def _push(self, job):
+        self._sequence += 1
+        heapq.heappush(self._queue, (job.next_run, self._sequence, job))
+
+    def run_now(self, name):
+        """Adelanta una tarea a este momento; su siguiente turno se calcula desde ahí."""
+        with self._condition:
+            job = self.jobs[name]
+            job.next_run = datetime.now()
+            self._push(job)
+            self._condition.notify()
+
+    def _execute(self, job):
+        job.running = True
+        job.last_run = datetime.now()
+        started = time.monotonic()
+        try:
+            result = job.target(*job.args, **job.kwargs)
+            # Las sincronizaciones con SingleFlight devuelven False si ya había una en curso
+            job.last_result = 'en curso' if result is False else 'ok'
+        except Exception as e:
+            job.last_result = f"error: {e}"
+            logger.exception(f"Error en la tarea programada {job.name}: {e}")
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_duration = time.monotonic() - started
+            self.save_state()
+
+    def _run_due(self, job, due):
+        now = datetime.now()
+        # Se descartan las entradas viejas de una tarea reprogramada (p. ej. por run_now)
+        if job.next_run != due:
+            return
+        late = (now - due).total_seconds()
+        if job.running:
+            job.last_result = 'omitida: la ejecución anterior sigue en curso'
+        elif job.misfire_grace is not None and late > job.misfire_grace:
+            job.last_result = f"omitida: atrasada {late:.0f} s"
+            logger.warning(f"Tarea {job.name} omitida por atraso de {late:.0f} s")
+        else:
+            threading.Thread(target=self._execute, args=(job,), name=f"job-{job.name}", daemon=True).start()
+        # Las ejecuciones perdidas se agrupan en una: la siguiente se calcula desde ahora
+        job.schedule_after(max(now, due))
+        self._push(job)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                now = datetime.now()
+                if self._queue and self._queue[0][0] <= now:
+                    due, _, job = heapq.heappop(self._queue)
+                    self._run_due(job, due)
+                    self.save_state()
+                    continue
+                timeout = MAX_SLEEP
+                if self._queue:
+                    timeout = min(timeout, max(0.0, (self._queue[0][0] - now).total_seconds()))
+                self._condition.wait(timeout)
+
+    def start(self):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+                self._thread.start()
+        for job in sorted(self.jobs.values(), key=lambda j: j.next_run):
+            logger.info(f"Tarea {job.name} ({job.trigger}): próxima ejecución {job.next_run:%Y-%m-%d %H:%M:%S}")
+
+    def states(self):
+        return [job.state() for job in sorted(self.jobs.values(), key=lambda j: j.name)]
+
+    def save_state(self):
+        try:
+            cache_store.save_meta(STATE_KEY, {'updated': datetime.now().isoformat(timespec='seconds'),
+                                              'jobs': self.states()})
+        except Exception as e:
+            logger.error(f"No se pudo guardar el estado del programador: {e}")
+
+
+SCHEDULER = Scheduler()
+
+
+def add_job(name, target, trigger, **options):
+    return SCHEDULER.add_job(name, target, trigger, **options)
+
+
+def start():
+    SCHEDULER.start()
+
+
+def job_states():
+    """Estado de las tareas: las de este proceso o, si corren en `sync.py`, las guardadas en el almacén."""
+    if SCHEDULER.jobs:
+        return SCHEDULER.states()
+    saved = cache_store.load_meta(STATE_KEY)
+    return saved['jobs'] if saved else []
@@ -0,0 +1,131 @@
+"""Índices de búsqueda para los selectores de las pantallas de captura.
+
+Los índices se construyen cada vez que una caché se publica o se restaura
+(ver `cache_store.add_listener`), de modo que `/api/search` responde sin
+recorrer las listas completas en cada tecla. La comparación ignora
+mayúsculas y acentos ("DESCRIPCIÓN" == "descripcion").
+"""
+import bisect
+import unicodedata
+import cache_store
+
+# Dataset -> campo con el texto a indexar (None si los elementos son cadenas)
+SEARCHABLE_DATASETS = {
+    'partidas': None,
+    'materiales': None,
+    'inventario': None,
+    'proyectos': 'codigo_proyecto',
+    'clientes': None,
+    'usuarios': None,
+    'puestos': None,
+    'areas': None
+}
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+SEARCH_INDEXES = {}
+
+
+def normalize(text):
+    """Minúsculas, sin acentos y con espacios colapsados."""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.casefold().split())
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Índice de prefijos (por palabra) y trigramas sobre una lista de elementos."""
+
+    def __init__(self, items, field=None):
+        self.items = list(items)
+        self.texts = [normalize(item.get(field, '') if field else item) for item in self.items]
+        self.trigrams = {}
+        words = []
+        for idx, text in enumerate(self.texts):
+            for gram in _trigrams(text):
+                self.trigrams.setdefault(gram, set()).add(idx)
+            for word in set(text.split()):
+                words.append((word, idx))
+        words.sort()
+        self.words = [w for w, _ in words]
+        self.word_ids = [i for _, i in words]
+
+    def __len__(self):
+        return len(self.items)
+
+    def _prefix_candidates(self, prefix):
+        start = bisect.bisect_left(self.words, prefix)
+        end = bisect.bisect_left(self.words, prefix + '\uffff')
+        return set(self.word_ids[start:end])
+
+    def _candidates(self, word):
+        if len(word) >= 3:
+            postings = [self.trigrams.get(gram) for gram in _trigrams(word)]
+            if not all(postings):
+                return set()
+            return set.intersection(*sorted(postings, key=len))
+        return None
+
+    def _score(self, text, query, words):
+        if text == query:
+            return 0
+        if text.startswith(query):
+            return 1
+        text_words = text.split()
+        if all(any(tw.startswith(w) for tw in text_words) for w in words):
+            return 2
+        return 3
+
+    def search(self, query, limit=DEFAULT_LIMIT, prefix=None):
+        """Devuelve los elementos que contienen todas las palabras de `query`, ordenados por relevancia."""
+        query = normalize(query)
+        words = query.split()
+        prefix = normalize(prefix) if prefix else None
+
+        candidates = None
+        for word in words:
+            found = self._candidates(word)
+            if found is None:
+                continue
+            candidates = found if candidates is None else candidates & found
+        if candidates is None:
+            prefix_words = prefix.split() if prefix else []
+            candidates = self._prefix_candidates(prefix_words[0]) if prefix_words else range(len(self.texts))
+
+        ranked = []
+        for idx in candidates:
+            text = self.texts[idx]
+            if prefix and not text.startswith(prefix):
+                continue
+            if not words:
+                # Sin texto de búsqueda se conserva el orden original de la caché
+                ranked.append((0, 0, '', idx))
+            elif all(w in text for w in words):
+                ranked.append((self._score(text, query, words), len(text), text, idx))
+        ranked.sort()
+        return [self.items[idx] for _, _, _, idx in ranked[:limit]]
+
+
+def build_index(name, cache):
+    """Reconstruye el índice de un dataset a partir de su caché."""
+    if name not in SEARCHABLE_DATASETS:
+        return
+    SEARCH_INDEXES[name] = SearchIndex(cache['data'], SEARCHABLE_DATASETS[name])
+
+
+def search(name, query, limit=DEFAULT_LIMIT, prefix=None):
+    index = SEARCH_INDEXES.get(name)
+    if index is None:
+        return []
+    return index.search(query, max(1, min(limit, MAX_LIMIT)), prefix)
+
+
+# Mantener los índices al día con cada publicación o recarga de caché
+cache_store.add_listener(build_index)
+for _name, _cache in list(cache_store.CACHE_REGISTRY.items()):
+    build_index(_name, _cache)
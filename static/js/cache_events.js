@@ -0,0 +1,75 @@
+// Avisos en vivo de sincronización (Server-Sent Events, ver events.py).
+// Uso: CacheEvents.subscribe(['planeacion'], (event) => recargar());
+//      CacheEvents.track(response);  // tras cada fetch de datos de la pantalla
+// El callback recibe {dataset, version, timestamp, count} cuando la versión publicada difiere de la que
+// cargó la pantalla (cabecera X-Cache-Versions, ver http_cache.py), también si la sincronización terminó
+// entre la primera carga y la conexión. Mientras no hay conexión (o los eventos están deshabilitados y no se
+// define CacheEvents.url), CacheEvents.connected es false y las pantallas siguen consultando como antes.
+(function () {
+    const RECONNECT_DELAY = 30000;
+    const STALE_RETRY_DELAY = 2000;
+
+    const CacheEvents = {
+        connected: false,
+        handlers: {},
+        loaded: {},   // versión que tiene la pantalla, por dataset
+        latest: {},   // última versión anunciada por el servidor, por dataset
+        retried: {},
+        source: null,
+        connectTimer: null,
+        url: null,
+
+        subscribe(datasets, handler) {
+            datasets.forEach(name => {
+                (this.handlers[name] = this.handlers[name] || []).push(handler);
+            });
+            // Varias suscripciones seguidas comparten una sola conexión
+            clearTimeout(this.connectTimer);
+            this.connectTimer = setTimeout(() => this.connect(), 0);
+        },
+
+        track(response) {
+            const header = response.headers.get('X-Cache-Versions');
+            if (!header) return;
+            const stale = new Map();
+            header.split(',').forEach(pair => {
+                const [name, version] = pair.split('=');
+                this.loaded[name] = version;
+                const latest = this.latest[name];
+                // La pantalla cargó datos anteriores a un aviso que ya llegó. Con varios workers el que respondió
+                // puede no haber leído aún el almacén: se reintenta una sola vez por versión y tras una espera
+                if (latest !== undefined && latest !== version && this.retried[name] !== latest) {
+                    this.retried[name] = latest;
+                    (this.handlers[name] || []).forEach(fn => stale.set(fn, { dataset: name, version: latest }));
+                }
+            });
+            if (stale.size) setTimeout(() => stale.forEach((event, fn) => fn(event)), STALE_RETRY_DELAY);
+        },
+
+        connect() {
+            if (this.source) this.source.close();
+            const datasets = Object.keys(this.handlers);
+            if (!window.EventSource || !this.url || datasets.length === 0) return;
+
+            this.source = new EventSource(`${this.url}?datasets=${encodeURIComponent(datasets.join(','))}`);
+            this.source.onopen = () => { this.connected = true; };
+            this.source.addEventListener('cache', (e) => {
+                const event = JSON.parse(e.data);
+                this.latest[event.dataset] = event.version;
+                const loaded = this.loaded[event.dataset];
+                // Sin carga registrada todavía, track() compara cuando llegue la respuesta
+                if (loaded === undefined || loaded === event.version) return;
+                (this.handlers[event.dataset] || []).forEach(fn => fn(event));
+            });
+            this.source.onerror = () => {
+                this.connected = false;
+                // EventSource reintenta solo tras cortes de red; ante 503 o sesión vencida se cierra
+                if (this.source.readyState === EventSource.CLOSED) {
+                    setTimeout(() => this.connect(), RECONNECT_DELAY);
+                }
+            };
+        }
+    };
+
+    window.CacheEvents = CacheEvents;
+})();
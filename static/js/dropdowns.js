@@ -1,8 +1,15 @@
 /**
  * Shared Dynamic Dropdown Logic
+ *
+ * options.dataset: when set, suggestions come from the server-side index
+ * (`/api/search`) instead of scanning the full list in the browser.
+ * options.prefix: optional function returning a prefix every result must start with.
  */
 
-function initCustomDropdown(input, itemsOrFn, wrapperClass) {
+const SEARCH_URL = '/api/search';
+const SEARCH_DEBOUNCE_MS = 150;
+
+function initCustomDropdown(input, itemsOrFn, wrapperClass, options = {}) {
     const wrapper = input.closest('.select-wrapper');
     if (input.dataset.dropdownInit) return;
     input.dataset.dropdownInit = 'true';
@@ -37,20 +44,57 @@ function initCustomDropdown(input, itemsOrFn, wrapperClass) {
         dropdown.style.top = `${rect.bottom + 4}px`;
     };
 
+    let searchTimer = null;
+    let searchController = null;
+
+    const filterLocal = (searchWords) => {
+        const items = getItems() || [];
+        return items.filter(item => {
+            const itemStr = String(item).toLowerCase();
+            return searchWords.every(word => itemStr.includes(word));
+        }).slice(0, 50);
+    };
+
+    const fetchRemote = (filter, searchWords) => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(async () => {
+            if (searchController) searchController.abort();
+            searchController = new AbortController();
+            const params = new URLSearchParams({ dataset: options.dataset, q: filter, limit: 50 });
+            const prefix = options.prefix ? options.prefix() : '';
+            if (prefix) params.set('prefix', prefix);
+            try {
+                const response = await fetch(`${SEARCH_URL}?${params}`, { signal: searchController.signal });
+                const result = await response.json();
+                if (!result.success) throw new Error(result.message);
+                // Ignore responses for text that is no longer in the input
+                if ((input.readOnly ? '' : input.value) !== filter) return;
+                showItems(result.results, searchWords);
+            } catch (error) {
+                if (error.name === 'AbortError') return;
+                showItems(filterLocal(searchWords), searchWords);
+            }
+        }, SEARCH_DEBOUNCE_MS);
+    };
+
     const renderItems = (filter = '') => {
+        const searchWords = String(filter).toLowerCase().trim().split(/\s+/).filter(word => word.length > 0);
+
+        if (options.dataset) {
+            fetchRemote(filter, searchWords);
+            return;
+        }
+
         const items = getItems();
         if (!items || items.length === 0) {
             dropdown.classList.remove('active');
             return;
         }
 
-        const searchWords = String(filter).toLowerCase().trim().split(/\s+/).filter(word => word.length > 0);
-
-        const filtered = items.filter(item => {
-            const itemStr = String(item).toLowerCase();
-            return searchWords.every(word => itemStr.includes(word));
-        }).slice(0, 50);
+        showItems(filterLocal(searchWords), searchWords);
+    };
 
+    const showItems = (filtered, searchWords) => {
         if (filtered.length === 0) {
             dropdown.classList.remove('active');
             return;
@@ -0,0 +1,86 @@
+"""Proceso dedicado de sincronización con Notion.
+
+Uso: `python sync.py` (con `gunicorn -c gunicorn.conf.py` lo inicia el
+proceso maestro de gunicorn, salvo `GUNICORN_SYNC_PROCESS=0`).
+
+Ejecuta todas las sincronizaciones (Logística, Ventas, Producción y Diseño)
+una sola vez por despliegue y publica los resultados en el almacén
+compartido de `cache_store`. También entrega la bandeja de salida de n8n.
+Los workers web deben arrancar con `SYNC_MODE=external` para que solo lean
+de ese almacén.
+"""
+import os
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s in %(module)s: %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+import cache_store
+import scheduler
+import outbox
+import metrics
+from routes.logistics import start_background_sync, refresh_notion_cache
+from routes.sales import start_sales_sync, refresh_sales_cache
+from routes.production import start_production_sync, refresh_planeacion_cache
+from routes.design import start_inventory_scheduler, refresh_inventory_cache, refresh_projects_cache
+
+# Cada cuántos segundos se atienden las sincronizaciones manuales pedidas desde la web
+SYNC_REQUEST_POLL = float(os.getenv('SYNC_REQUEST_POLL', '2'))
+
+# Sincronización a ejecutar por cada caché solicitada
+SYNC_JOBS = {
+    'partidas': (refresh_notion_cache, ()),
+    'materiales': (refresh_notion_cache, ()),
+    'clientes': (refresh_sales_cache, (True,)),
+    'usuarios': (refresh_sales_cache, (True,)),
+    'puestos': (refresh_sales_cache, (True,)),
+    'areas': (refresh_sales_cache, (True,)),
+    'planeacion': (refresh_planeacion_cache, (True,)),
+    'inventario': (refresh_inventory_cache, ()),
+    'proyectos': (refresh_projects_cache, ())
+}
+
+
+def run_requested_syncs():
+    """Atiende las solicitudes pendientes, ejecutando cada sincronización una sola vez."""
+    started = set()
+    for name in cache_store.pop_sync_requests():
+        job = SYNC_JOBS.get(name)
+        if job is None or job in started:
+            continue
+        started.add(job)
+        target, args = job
+        logger.info(f"Sincronización manual solicitada: {name}")
+        threading.Thread(target=target, args=args, daemon=True).start()
+
+
+def main():
+    start_background_sync()
+    start_sales_sync()
+    start_production_sync()
+    start_inventory_scheduler()
+    scheduler.start()
+    outbox.start_outbox_workers()
+    # Las métricas de sincronización de este proceso (la web no las ve en modo externo)
+    metrics.start_http_server()
+    logger.info("Proceso de sincronización iniciado.")
+
+    while True:
+        try:
+            run_requested_syncs()
+        except Exception as e:
+            logger.error(f"Error atendiendo solicitudes de sincronización: {e}")
+        time.sleep(SYNC_REQUEST_POLL)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Cachés sincronizadas desde Notion con una sola sincronización en vuelo.
+
+Antes cada módulo mantenía diccionarios `{'data', 'timestamp', 'is_syncing'}`
+y marcaba el indicador con un "revisar y luego asignar" sin candado: dos
+`?force=true` simultáneos podían lanzar sincronizaciones superpuestas y un
+lector podía ver `data` nueva con `timestamp` viejo.
+
+- `SingleFlight` agrupa las cachés que se sincronizan juntas (p. ej.
+  Partidas y Materiales). Su decorador `job` envuelve la función de
+  sincronización: si ya hay una en curso, la nueva llamada no hace nada. El
+  indicador `is_syncing` es el propio candado, así que no puede quedar
+  desincronizado.
+- `SyncedCache` guarda `(data, timestamp, version)` en una tupla inmutable
+  que se reemplaza de una sola vez (`swap`). Leer no requiere candado y
+  siempre se ve una versión completa. Conserva la interfaz de diccionario
+  (`cache['data']`, `cache['is_syncing']`) que usan `cache_store`,
+  `http_cache` y los índices.
+- Cada caché tiene un TTL (`CACHE_TTL_<NOMBRE>` en el entorno). Al leer una
+  caché vencida se sigue sirviendo la copia actual y se pide una
+  sincronización en segundo plano (stale-while-revalidate).
+"""
+import os
+import time
+import logging
+import threading
+import functools
+from collections import namedtuple
+import cache_store
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Mínimo de segundos entre dos revalidaciones pedidas por lecturas de la misma caché
+REVALIDATE_INTERVAL = float(os.getenv('CACHE_REVALIDATE_INTERVAL', '60'))
+
+Snapshot = namedtuple('Snapshot', ['data', 'timestamp', 'version'])
+
+# Todos los grupos de sincronización y cachés del proceso, por nombre (para estadísticas)
+FLIGHTS = {}
+CACHES = {}
+
+
+class SingleFlight:
+    """Sincronización compartida por una o varias cachés; nunca hay dos en curso a la vez."""
+
+    def __init__(self, name):
+        self.name = name
+        self.target = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.last_started = None
+        self.last_duration = None
+        self.last_error = None
+        FLIGHTS[name] = self
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def job(self, fn):
+        """Decorador de la función de sincronización del grupo.
+
+        La función envuelta devuelve `False` si ya había una sincronización
+        en curso (la llamada se une a ella en lugar de repetirla).
+        """
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            if not self._lock.acquire(blocking=False):
+                self.coalesced += 1
+                metrics.SYNC_RUNS.inc(flight=self.name, result='coalesced')
+                return False
+            started = time.monotonic()
+            self.runs += 1
+            self.last_started = time.time()
+            result = 'ok'
+            try:
+                fn(*args, **kwargs)
+                self.last_error = None
+            except Exception as e:
+                result = 'error'
+                self.failures += 1
+                self.last_error = str(e)
+                logger.exception(f"Error en la sincronización {self.name}: {e}")
+            finally:
+                self.last_duration = time.monotonic() - started
+                self._lock.release()
+                metrics.SYNC_DURATION.observe(self.last_duration, flight=self.name)
+                metrics.SYNC_RUNS.inc(flight=self.name, result=result)
+            return True
+
+        self.target = run
+        return run
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'runs': self.runs,
+            'coalesced': self.coalesced,
+            'failures': self.failures,
+            'last_started': self.last_started,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error
+        }
+
+
+class SyncedCache:
+    """Caché con instantáneas inmutables, TTL y revalidación en segundo plano."""
+
+    def __init__(self, name, flight, ttl, data=None):
+        self.name = name
+        self.flight = flight
+        self.ttl = float(os.getenv(f'CACHE_TTL_{name.upper()}', ttl))
+        self._snapshot = Snapshot([] if data is None else data, None, None)
+        self._revalidated_at = 0.0
+        self.reads = 0
+        self.stale_reads = 0
+        self.revalidations = 0
+        self.swaps = 0
+        CACHES[name] = self
+
+    def snapshot(self):
+        """`(data, timestamp, version)` actuales, siempre consistentes entre sí."""
+        return self._snapshot
+
+    def swap(self, data, timestamp, version=None):
+        """Reemplaza el contenido completo de una sola vez."""
+        self._snapshot = Snapshot(data, timestamp, version)
+        self.swaps += 1
+
+    @property
+    def is_syncing(self):
+        return self.flight.running
+
+    def __getitem__(self, key):
+        if key == 'is_syncing':
+            return self.flight.running
+        if key not in Snapshot._fields:
+            raise KeyError(key)
+        return getattr(self._snapshot, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def age(self):
+        """Segundos desde la última sincronización publicada (`None` si nunca se sincronizó)."""
+        timestamp = self._snapshot.timestamp
+        return time.time() - timestamp.timestamp() if timestamp else None
+
+    def is_stale(self):
+        age = self.age()
+        return age is None or age > self.ttl
+
+    def read(self):
+        """Instantánea para una respuesta; si está vencida pide sincronizar sin esperar."""
+        self.reads += 1
+        if self.is_stale():
+            self.stale_reads += 1
+            self.revalidate()
+        return self._snapshot
+
+    def revalidate(self):
+        now = time.monotonic()
+        if self.flight.running or self.flight.target is None or now - self._revalidated_at < REVALIDATE_INTERVAL:
+            return
+        self._revalidated_at = now
+        self.revalidations += 1
+        logger.info(f"Caché {self.name} vencida: sincronizando en segundo plano")
+        cache_store.trigger_sync(self.name, self.flight.target)
+
+    def stats(self):
+        data = self._snapshot.data
+        return {
+            'records': len(data) if data is not None else 0,
+            'version': self._snapshot.version,
+            'age': self.age(),
+            'ttl': self.ttl,
+            'stale': self.is_stale(),
+            'syncing': self.flight.running,
+            'reads': self.reads,
+            'stale_reads': self.stale_reads,
+            'revalidations': self.revalidations,
+            'swaps': self.swaps
+        }
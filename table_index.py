@@ -0,0 +1,114 @@
+"""Índices de consulta sobre tablas en columnas (ver columnar.py).
+
+Se construyen una vez por sincronización para responder filtros del lado
+del servidor sin recorrer todos los registros:
+
+- Índice invertido por columna categórica: código de categoría -> filas.
+- Índice de intervalos sobre (inicio, fin): inicios ordenados más el máximo
+  acumulado de los fines, de modo que una ventana [desde, hasta] se reduce
+  con dos búsquedas binarias a las filas que pueden traslaparla.
+- Texto normalizado por fila (sin acentos ni mayúsculas) para la búsqueda.
+"""
+import bisect
+from array import array
+from columnar import NULL_DATE, parse_date
+from search_index import normalize
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+def to_millis(value):
+    """Convierte una fecha ISO (de la petición) a milisegundos en el reloj de la tabla."""
+    parsed = parse_date(value) if value else None
+    if parsed is None:
+        raise ValueError(f"Fecha inválida: {value!r}")
+    return parsed[0]
+
+
+class TableIndex:
+    """Índices de una `ColumnarTable` para filtrar por categorías, ventana de fechas y texto."""
+
+    def __init__(self, table, categories=(), start_columns=(), end_column=None, text_columns=(), min_duration=0):
+        self.table = table
+        self.categories = {}
+        for name in categories:
+            column = table.columns[name]
+            postings = [array('I') for _ in column.categories]
+            for row, code in enumerate(column.codes):
+                postings[code].append(row)
+            self.categories[name] = postings
+
+        # Inicio: la primera columna de `start_columns` con valor; fin: `end_column` o el propio inicio
+        starts = [NULL_DATE] * len(table)
+        for name in reversed(start_columns):
+            for row, millis in enumerate(table.columns[name].millis):
+                if millis != NULL_DATE:
+                    starts[row] = millis
+        ends = list(starts)
+        if end_column:
+            for row, millis in enumerate(table.columns[end_column].millis):
+                if millis != NULL_DATE and starts[row] != NULL_DATE:
+                    ends[row] = max(millis, starts[row])
+        # Los puntos sin fin ocupan `min_duration` (como en el diagrama de Gantt)
+        ends = [e + min_duration if e == s and s != NULL_DATE else e for s, e in zip(starts, ends)]
+        self.starts = array('q', starts)
+        self.ends = array('q', ends)
+
+        dated = sorted((s, row) for row, s in enumerate(starts) if s != NULL_DATE)
+        self.by_start = array('I', (row for _, row in dated))
+        self.sorted_starts = array('q', (s for s, _ in dated))
+        max_end = NULL_DATE
+        self.max_ends = array('q')
+        for row in self.by_start:
+            max_end = max(max_end, ends[row])
+            self.max_ends.append(max_end)
+
+        self.texts = [normalize(' '.join(filter(None, (table.columns[name].get(row) for name in text_columns))))
+                      for row in range(len(table))]
+
+    def facet(self, name):
+        """Valores distintos de una columna categórica (sin vacíos), ordenados."""
+        return sorted(value for value in self.table.columns[name].categories if value)
+
+    def _window(self, start, end):
+        lo = bisect.bisect_left(self.max_ends, start) if start is not None else 0
+        hi = bisect.bisect_right(self.sorted_starts, end) if end is not None else len(self.by_start)
+        if start is None:
+            return set(self.by_start[lo:hi])
+        ends = self.ends
+        return {row for row in self.by_start[lo:hi] if ends[row] >= start}
+
+    def match(self, filters=None, start=None, end=None, text=None):
+        """Posiciones (en orden de la tabla) de los registros que cumplen todos los criterios.
+
+        `filters` es `{columna categórica: [valores]}` (cualquiera de los
+        valores); `start`/`end` son milisegundos de la ventana.
+        """
+        candidates = None
+        for name, values in (filters or {}).items():
+            column = self.table.columns[name]
+            rows = set()
+            for value in values:
+                code = column.code(value)
+                if code is not None:
+                    rows.update(self.categories[name][code])
+            candidates = rows if candidates is None else candidates & rows
+
+        if start is not None or end is not None:
+            window = self._window(start, end)
+            candidates = window if candidates is None else candidates & window
+
+        rows = sorted(candidates) if candidates is not None else range(len(self.table))
+        words = normalize(text).split() if text else []
+        if words:
+            texts = self.texts
+            rows = [row for row in rows if all(word in texts[row] for word in words)]
+        return rows
+
+    def query(self, filters=None, start=None, end=None, text=None, offset=0, limit=DEFAULT_LIMIT):
+        """Devuelve `(total, filas)` de `match()`, paginado con `offset`/`limit`."""
+        rows = self.match(filters, start, end, text)
+        limit = max(1, min(limit, MAX_LIMIT))
+        offset = max(0, offset)
+        return len(rows), [self.table[row] for row in rows[offset:offset + limit]]
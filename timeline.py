@@ -0,0 +1,137 @@
+"""Segmentos del diagrama de Gantt precalculados al sincronizar.
+
+A partir de la tabla en columnas y su `TableIndex` se calcula una sola vez
+por sincronización, para cada registro, el carril (máquina), el intervalo
+en milisegundos y la pieza con su color. Al consultar una ventana solo se
+agrupan los segmentos visibles en trazas listas para Plotly.
+
+Con la vista alejada, los segmentos que medirían menos de
+`GANTT_COALESCE_PX` píxeles se fusionan con sus vecinos del mismo carril en
+un solo bloque ("N trabajos"): el navegador dibuja unas decenas de barras
+en lugar de miles que no se alcanzan a distinguir.
+"""
+import os
+from array import array
+from columnar import NULL_DATE
+
+GANTT_COALESCE_PX = float(os.getenv('GANTT_COALESCE_PX', '3'))
+DEFAULT_WIDTH = 1200
+MAX_WIDTH = 10000
+
+NO_MACHINE = 'Sin Máquina'
+NO_NAME = 'Sin Nombre'
+
+
+def _int32(value):
+    return (value + 2 ** 31) % 2 ** 32 - 2 ** 31
+
+
+def string_to_color(value):
+    """Color estable de una pieza; mismo resultado que `stringToColor` del frontend."""
+    units = value.encode('utf-16-le')
+    hash_ = 0
+    for i in range(0, len(units), 2):
+        # charCodeAt + ((hash << 5) - hash), con el desplazamiento en enteros de 32 bits como en JS
+        hash_ = int.from_bytes(units[i:i + 2], 'little') + (_int32(_int32(hash_) << 5) - hash_)
+    return f"hsl({abs(hash_) % 360}, 70%, 55%)"
+
+
+class Timeline:
+    """Carriles, intervalos y piezas de cada registro de la tabla de Planeación."""
+
+    def __init__(self, table, index, lane_column='maquina'):
+        self.table = table
+        self.index = index
+        lanes = table.columns[lane_column]
+        self.lane_names = [value or NO_MACHINE for value in lanes.categories]
+        self.lanes = lanes.codes
+
+        # Una pieza por partida (o por nombre si no tiene relación), como las trazas del frontend
+        self.pieces = []
+        piece_codes = {}
+        self.piece_of = array('I')
+        for row in table:
+            name = row['partida'] or row['n'] or NO_NAME
+            key = row['partida_id'] or name
+            code = piece_codes.get(key)
+            if code is None:
+                code = piece_codes[key] = len(self.pieces)
+                self.pieces.append({
+                    'nombre': name,
+                    'descripcion': row['nombre_pieza'] or row['n'],
+                    'color': string_to_color(key),
+                    'imagen': row['imagen_url']
+                })
+            self.piece_of.append(code)
+
+    def lane_order(self):
+        """Nombres de los carriles ordenados para el eje Y."""
+        return sorted(set(self.lane_names))
+
+    def window(self, rows, start=None, end=None, width=DEFAULT_WIDTH):
+        """Trazas de Plotly de los registros `rows` (resultado de `TableIndex.match`).
+
+        `width` es el ancho del diagrama en píxeles: junto con la ventana
+        `[start, end]` define cuántos milisegundos representa un píxel.
+        """
+        starts, ends = self.index.starts, self.index.ends
+        rows = [row for row in rows if starts[row] != NULL_DATE]
+        resolution = 0
+        if start is not None and end is not None and end > start:
+            resolution = (end - start) / max(1, min(width, MAX_WIDTH))
+        min_length = GANTT_COALESCE_PX * resolution
+
+        traces = {}
+        groups = {'base': [], 'x': [], 'y': [], 'cantidad': []}
+        operador = self.table.columns['operador']
+        ids = self.table.columns['id']
+
+        def emit(row):
+            code = self.piece_of[row]
+            trace = traces.get(code)
+            if trace is None:
+                trace = traces[code] = dict(self.pieces[code], base=[], x=[], y=[], operador=[], id=[])
+            trace['base'].append(starts[row])
+            trace['x'].append(ends[row] - starts[row])
+            trace['y'].append(self.lane_names[self.lanes[row]])
+            trace['operador'].append(operador.get(row))
+            trace['id'].append(ids.get(row))
+
+        def flush(lane, cluster):
+            if len(cluster) == 1:
+                emit(cluster[0])
+                return
+            first = starts[cluster[0]]
+            last = max(ends[row] for row in cluster)
+            groups['base'].append(first)
+            groups['x'].append(max(last - first, min_length))
+            groups['y'].append(lane)
+            groups['cantidad'].append(len(cluster))
+
+        by_lane = {}
+        for row in rows:
+            by_lane.setdefault(self.lanes[row], []).append(row)
+
+        for code, lane_rows in by_lane.items():
+            lane = self.lane_names[code]
+            lane_rows.sort(key=starts.__getitem__)
+            cluster, cluster_end = [], None
+            for row in lane_rows:
+                if ends[row] - starts[row] >= min_length:
+                    emit(row)
+                    continue
+                if cluster and starts[row] > cluster_end + resolution:
+                    flush(lane, cluster)
+                    cluster = []
+                if not cluster:
+                    cluster_end = starts[row] + min_length
+                cluster.append(row)
+                cluster_end = max(cluster_end, ends[row])
+            if cluster:
+                flush(lane, cluster)
+
+        return {
+            'piezas': list(traces.values()),
+            'grupos': groups,
+            'segmentos': sum(len(trace['x']) for trace in traces.values()) + len(groups['x'])
+        }
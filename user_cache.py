@@ -0,0 +1,152 @@
+"""Caché de usuarios para el `user_loader` de Flask-Login.
+
+Antes cada petición autenticada (incluidas las consultas periódicas de las
+APIs) hacía un `select` a `profiles` en Supabase. Ahora:
+
+1. La sesión firmada (cookie de Flask) lleva una copia de los datos del
+   usuario (`claims`) válida `USER_CLAIMS_TTL` segundos: la mayoría de las
+   peticiones no consultan nada.
+2. Si la copia venció, se busca en una caché LRU en memoria del proceso
+   (`USER_CACHE_SIZE` entradas, `USER_CACHE_TTL` segundos).
+3. Solo si tampoco está ahí se consulta Supabase, y se renuevan ambas.
+
+Cuando un administrador cambia el estado o los roles de alguien se llama a
+`invalidate(user_id)`. La invalidación se registra en SQLite, compartido
+por todos los workers, y cada proceso la relee cada
+`USER_INVALIDATION_POLL` segundos. Desde entonces se descartan las copias
+en memoria y las `claims` emitidas antes del cambio.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from flask import session
+from models import User
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+USER_CACHE_PATH = os.getenv('USER_CACHE_PATH', os.path.join(BASE_DIR, 'instance', 'user_cache.sqlite3'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1000'))
+# Vigencia de la copia en la sesión (0 = no usar la sesión, solo la caché en memoria)
+USER_CLAIMS_TTL = float(os.getenv('USER_CLAIMS_TTL', '300'))
+USER_INVALIDATION_POLL = float(os.getenv('USER_INVALIDATION_POLL', '5'))
+
+CLAIMS_KEY = 'user_claims'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_invalidations (
+    user_id TEXT PRIMARY KEY,
+    invalidated_at REAL NOT NULL
+);
+"""
+
+# user_id -> (User, momento en que se cargó); el más reciente al final
+_users = OrderedDict()
+_lock = threading.Lock()
+
+# user_id -> momento de la última invalidación (copia local de la tabla compartida)
+_invalidations = {}
+_invalidations_loaded_at = 0.0
+
+
+def _connect():
+    directory = os.path.dirname(USER_CACHE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(USER_CACHE_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _invalidated_at(user_id):
+    global _invalidations, _invalidations_loaded_at
+    now = time.time()
+    if now - _invalidations_loaded_at >= USER_INVALIDATION_POLL:
+        _invalidations_loaded_at = now
+        try:
+            conn = _connect()
+            try:
+                _invalidations = dict(conn.execute("SELECT user_id, invalidated_at FROM user_invalidations"))
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"No se pudieron leer las invalidaciones de usuarios: {e}")
+    return _invalidations.get(user_id, 0.0)
+
+
+def _to_claims(user, loaded_at):
+    return {'id': user.id, 'email': user.email, 'username': user.username, 'roles': user.roles, 'issued': loaded_at}
+
+
+def _from_claims(claims):
+    return User(id=claims['id'], email=claims['email'], username=claims.get('username'), roles=claims.get('roles'))
+
+
+def remember(user, loaded_at=None):
+    """Guarda `user` en la caché del proceso y, si está habilitado, en la sesión."""
+    loaded_at = loaded_at or time.time()
+    with _lock:
+        _users[user.id] = (user, loaded_at)
+        _users.move_to_end(user.id)
+        while len(_users) > USER_CACHE_SIZE:
+            _users.popitem(last=False)
+    if USER_CLAIMS_TTL > 0:
+        session[CLAIMS_KEY] = _to_claims(user, loaded_at)
+    # Los módulos leen los roles de la sesión: se mantienen al día con el perfil
+    session['roles'] = user.roles
+
+
+def load_user(user_id, fetch):
+    """Usuario `user_id` desde la sesión, la caché o, si no, `fetch(user_id)` (Supabase)."""
+    now = time.time()
+    invalidated_at = _invalidated_at(user_id)
+
+    claims = session.get(CLAIMS_KEY)
+    if claims and claims.get('id') == user_id:
+        issued = claims.get('issued', 0)
+        if now - issued < USER_CLAIMS_TTL and issued > invalidated_at:
+            return _from_claims(claims)
+
+    with _lock:
+        entry = _users.get(user_id)
+        if entry and now - entry[1] < USER_CACHE_TTL and entry[1] > invalidated_at:
+            _users.move_to_end(user_id)
+            user, loaded_at = entry
+        else:
+            user = None
+
+    if user is None:
+        user = fetch(user_id)
+        if user is None:
+            return None
+        loaded_at = now
+    remember(user, loaded_at)
+    return user
+
+
+def invalidate(user_id):
+    """Descarta las copias de `user_id` en todos los workers (tras cambiar su estado o roles)."""
+    now = time.time()
+    with _lock:
+        _users.pop(user_id, None)
+        _invalidations[user_id] = now
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO user_invalidations (user_id, invalidated_at) VALUES (?, ?)",
+                             (user_id, now))
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"No se pudo registrar la invalidación del usuario {user_id}: {e}")
+
+
+def forget():
+    """Quita la copia de la sesión actual (al cerrar sesión)."""
+    session.pop(CLAIMS_KEY, None)